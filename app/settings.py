@@ -29,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'declarations.middleware.MetricsMiddleware',
+    'declarations.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +54,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'declarations.context_processors.hersteller_profile',
             ],
         },
     },
@@ -105,3 +108,120 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Zahntec Lab <info@zahntecl
 SITE_URL = os.getenv('SITE_URL', 'http://zahnovia.pythonanywhere.com')
 SITE_DOMAIN = os.getenv('SITE_DOMAIN', 'zahnovia.pythonanywhere.com')
 ADMIN_NOTIFICATION_EMAIL = os.getenv('ADMIN_NOTIFICATION_EMAIL', '')
+
+# Email outbox (python manage.py run_email_worker)
+EMAIL_WORKER_POLL_INTERVAL = float(os.getenv('EMAIL_WORKER_POLL_INTERVAL', '5'))
+EMAIL_WORKER_BATCH_SIZE = int(os.getenv('EMAIL_WORKER_BATCH_SIZE', '20'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '8'))  # sonra 'dead' (admin'den tekrar gönderilebilir)
+EMAIL_RETRY_DELAY = int(os.getenv('EMAIL_RETRY_DELAY', '30'))  # saniye, her denemede 2 katına çıkar
+EMAIL_LOCK_TIMEOUT = int(os.getenv('EMAIL_LOCK_TIMEOUT', '300'))  # saniye
+PASSWORD_RESET_EMAIL_WINDOW = int(os.getenv('PASSWORD_RESET_EMAIL_WINDOW', '3600'))  # saniye; bu aralıkta aynı kullanıcıya tek şifre sıfırlama email'i
+
+# PDF Job Queue (python manage.py run_pdf_worker)
+PDF_WORKER_CONCURRENCY = int(os.getenv('PDF_WORKER_CONCURRENCY', '2'))
+PDF_WORKER_POLL_INTERVAL = float(os.getenv('PDF_WORKER_POLL_INTERVAL', '2'))
+PDF_JOB_MAX_ATTEMPTS = int(os.getenv('PDF_JOB_MAX_ATTEMPTS', '5'))
+PDF_JOB_RETRY_DELAY = int(os.getenv('PDF_JOB_RETRY_DELAY', '30'))  # saniye, her denemede 2 katına çıkar
+PDF_JOB_LOCK_TIMEOUT = int(os.getenv('PDF_JOB_LOCK_TIMEOUT', '600'))  # saniye
+
+# PDF Renderer havuzu (WeasyPrint worker process'leri, font/CSS önceden yüklenir)
+# 0 = havuz yok, render mevcut process'te yapılır
+PDF_RENDER_POOL_SIZE = int(os.getenv('PDF_RENDER_POOL_SIZE', str(PDF_WORKER_CONCURRENCY)))
+PDF_RENDER_WORKER_MAX_RENDERS = int(os.getenv('PDF_RENDER_WORKER_MAX_RENDERS', '200'))
+PDF_RENDER_WORKER_MAX_RSS_MB = int(os.getenv('PDF_RENDER_WORKER_MAX_RSS_MB', '500'))
+
+# Yüklenen dosyaların SHA-256'sı yükleme sırasında hesaplanır (uploaded_file.sha256)
+FILE_UPLOAD_HANDLERS = [
+    'declarations.upload_handlers.HashingMemoryFileUploadHandler',
+    'declarations.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+# Referans PDF parse cache'i (process içi LRU; anahtar: PDF SHA-256 + parser sürümü)
+PARSE_CACHE_SIZE = int(os.getenv('PARSE_CACHE_SIZE', '128'))  # 0 = kapalı
+PARSE_CACHE_TTL = int(os.getenv('PARSE_CACHE_TTL', '3600'))  # saniye
+
+# Referans PDF metin çıkarma sınırları: bu kadar sayfadan / metinden sonrası okunmaz
+PDF_PARSE_MAX_PAGES = int(os.getenv('PDF_PARSE_MAX_PAGES', '20'))
+PDF_PARSE_MAX_TEXT_BYTES = int(os.getenv('PDF_PARSE_MAX_TEXT_BYTES', str(512 * 1024)))
+PDF_PARSE_MAX_FILE_BYTES = int(os.getenv('PDF_PARSE_MAX_FILE_BYTES', str(20 * 1024 * 1024)))
+
+# Referans PDF parser havuzu: güvenilmeyen PDF'ler süre ve bellek sınırlı worker
+# process'lerde parse edilir. 0 = havuz yok, parse mevcut process'te yapılır
+PDF_PARSE_POOL_SIZE = int(os.getenv('PDF_PARSE_POOL_SIZE', '2'))
+PDF_PARSE_TIMEOUT = float(os.getenv('PDF_PARSE_TIMEOUT', '10'))  # saniye, aşılırsa worker öldürülür
+PDF_PARSE_WORKER_MEMORY_LIMIT_MB = int(os.getenv('PDF_PARSE_WORKER_MEMORY_LIMIT_MB', '1024'))  # adres alanı (RLIMIT_AS)
+PDF_PARSE_WORKER_MAX_RSS_MB = int(os.getenv('PDF_PARSE_WORKER_MAX_RSS_MB', '300'))
+PDF_PARSE_WORKER_MAX_TASKS = int(os.getenv('PDF_PARSE_WORKER_MAX_TASKS', '500'))
+PDF_PARSE_POOL_WARM_UP = os.getenv('PDF_PARSE_POOL_WARM_UP', 'True') == 'True'
+
+# Referans PDF toplu içe aktarma (declaration_bulk_import / import_reference_pdfs)
+BULK_IMPORT_MAX_FILES = int(os.getenv('BULK_IMPORT_MAX_FILES', '100'))  # import başına PDF (ZIP içindekiler dahil)
+BULK_IMPORT_MAX_TOTAL_BYTES = int(os.getenv('BULK_IMPORT_MAX_TOTAL_BYTES', str(200 * 1024 * 1024)))  # import başına açılan toplam PDF boyutu
+
+# Web'den yüklenen dosyaların arka planda içe aktarılması (run_import_worker)
+IMPORT_WORKER_POLL_INTERVAL = float(os.getenv('IMPORT_WORKER_POLL_INTERVAL', '2'))
+IMPORT_JOB_MAX_ATTEMPTS = int(os.getenv('IMPORT_JOB_MAX_ATTEMPTS', '3'))
+IMPORT_JOB_RETRY_DELAY = int(os.getenv('IMPORT_JOB_RETRY_DELAY', '30'))  # saniye, her denemede 2 katına çıkar
+IMPORT_JOB_LOCK_TIMEOUT = int(os.getenv('IMPORT_JOB_LOCK_TIMEOUT', '1800'))  # saniye; en uzun import'tan uzun olmalı
+
+# Google Drive resumable upload parça boyutu (byte, 256 KB'ın katı)
+DRIVE_UPLOAD_CHUNK_SIZE = int(os.getenv('DRIVE_UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+
+# Döküman depolama backend'i
+#   declarations.storage.GoogleDriveStorage     - Google Drive (varsayılan)
+#   declarations.storage.LocalFileSystemStorage - Yerel disk (DOCUMENT_STORAGE_ROOT), içerik adresli
+DOCUMENT_STORAGE_BACKEND = os.getenv('DOCUMENT_STORAGE_BACKEND', 'declarations.storage.GoogleDriveStorage')
+DOCUMENT_STORAGE_ROOT = os.getenv('DOCUMENT_STORAGE_ROOT', str(BASE_DIR / 'documents'))
+
+# Liste sayfalarında (Erklärungen, Archiv) sayfa başına satır (?page_size= ile en fazla 200)
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '50'))
+
+# Cache (profil bayrakları vb.). Birden fazla process varsa paylaşılan bir backend
+# (redis / memcached / file) önerilir; locmem'de profil değişikliği diğer
+# process'lere en geç PROFILE_CACHE_TIMEOUT saniye sonra yansır.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'zahnovia'),
+    }
+}
+PROFILE_CACHE_TIMEOUT = int(os.getenv('PROFILE_CACHE_TIMEOUT', '300'))
+
+# /metrics/ (Prometheus) - superuser oturumu veya "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Logging: tüm kayıtlarda istek trace ID'si bulunur (utils.tracing)
+#   LOG_LEVEL        - uygulama logları (varsayılan INFO)
+#   TRACE_LOG_LEVEL  - DEBUG ise her span (render, drive.upload, parse, mail.send) loglanır
+# Loglara döküman metni / hasta bilgisi yazılmaz.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'trace_id': {'()': 'utils.tracing.TraceIdFilter'},
+    },
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['trace_id'],
+            'formatter': 'default',
+        },
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'declarations': {'level': LOG_LEVEL},
+        'utils': {'level': LOG_LEVEL},
+        'zahnovia.trace': {'level': os.getenv('TRACE_LOG_LEVEL', 'WARNING')},
+        'zahnovia.slow': {'level': 'WARNING'},
+    },
+}
+
+# Yavaş istek logu (zahnovia.slow): eşik ms cinsinden, 0 = kapalı; örnekleme oranı 0..1
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '0'))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', '1.0'))
@@ -7,3 +7,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 application = get_wsgi_application()
+
+# Referans PDF parser worker'larını ısıt (bkz. declarations.services.parse_worker)
+from declarations.services.parse_worker import warm_up_parser_pool
+
+warm_up_parser_pool()
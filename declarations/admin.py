@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Declaration, DeclarationItem, MaterialProduct, HerstellerProfile, ProductWork
+from .models import Declaration, DeclarationItem, MaterialProduct, HerstellerProfile, ProductWork, PdfJob, DriveFolder, DeclarationCounter, OutboundEmail, ImportJob
 
 
 class ProductWorkInline(admin.TabularInline):
@@ -16,11 +16,11 @@ class DeclarationItemInline(admin.TabularInline):
 
 @admin.register(Declaration)
 class DeclarationAdmin(admin.ModelAdmin):
-    list_display = ['declaration_number', 'praxis', 'created_at', 'item_count']
-    list_filter = ['created_at', 'praxis']
+    list_display = ['declaration_number', 'praxis', 'is_draft', 'created_at', 'item_count']
+    list_filter = ['is_draft', 'created_at', 'praxis']
     search_fields = ['declaration_number', 'praxis__username']
     inlines = [ProductWorkInline, DeclarationItemInline]
-    readonly_fields = ['declaration_number', 'created_at', 'updated_at']
+    readonly_fields = ['declaration_number', 'is_draft', 'created_at', 'updated_at']
 
     def item_count(self, obj):
         return obj.items.count()
@@ -53,3 +53,47 @@ class MaterialProductAdmin(admin.ModelAdmin):
 class HerstellerProfileAdmin(admin.ModelAdmin):
     list_display = ['firma_name', 'user', 'ort', 'telefon', 'email']
     search_fields = ['firma_name', 'ort', 'user__username']
+
+
+@admin.register(PdfJob)
+class PdfJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'declaration', 'status', 'attempts', 'run_after', 'locked_by', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['declaration__declaration_number', 'declaration__praxis__username']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at', 'locked_by', 'locked_at', 'last_error']
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'praxis', 'status', 'attempts', 'run_after', 'locked_by', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['praxis__username']
+    readonly_fields = ['results', 'created_at', 'updated_at', 'finished_at', 'locked_by', 'locked_at', 'last_error']
+
+
+@admin.register(DriveFolder)
+class DriveFolderAdmin(admin.ModelAdmin):
+    list_display = ['path', 'folder_id', 'updated_at']
+    search_fields = ['path', 'folder_id']
+
+
+@admin.register(DeclarationCounter)
+class DeclarationCounterAdmin(admin.ModelAdmin):
+    list_display = ['praxis', 'year', 'last_value']
+    list_filter = ['year']
+    search_fields = ['praxis__username']
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['id', 'subject', 'status', 'attempts', 'run_after', 'created_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject', 'idempotency_key']
+    readonly_fields = ['idempotency_key', 'created_at', 'updated_at', 'sent_at', 'locked_by', 'locked_at', 'last_error']
+    actions = ['requeue']
+
+    @admin.action(description='Erneut senden (fehlgeschlagene E-Mails)')
+    def requeue(self, request, queryset):
+        from .services.email_outbox import requeue_dead_emails
+        count = requeue_dead_emails(queryset)
+        self.message_user(request, f'{count} E-Mail(s) wieder in die Warteschlange gestellt.')
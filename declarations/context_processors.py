@@ -0,0 +1,12 @@
+"""
+Zahnovia Template Context Processor'ları
+"""
+from .services.profile_cache import get_cached_profile
+
+
+def hersteller_profile(request):
+    """Giriş yapmış kullanıcının profili (cache'ten, base.html başlığı için)"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and not user.is_superuser:
+        return {'current_profile': get_cached_profile(user.pk)}
+    return {}
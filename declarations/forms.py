@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from .models import Declaration, DeclarationItem, ProductWork, MaterialProduct, HerstellerProfile
+from .services.material_catalog import get_material_catalog, invalidate_material_catalog
 
 
 class DeclarationForm(forms.ModelForm):
@@ -21,10 +22,66 @@ class ProductWorkForm(forms.ModelForm):
         }
 
 
+class CatalogChoiceIterator(forms.models.ModelChoiceIterator):
+    """Seçenekleri queryset yerine önceden yüklenmiş katalog listesinden üretir"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.field.catalog:
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.catalog) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.catalog)
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """
+    MaterialProduct seçimi. Formset'teki tüm formlar aynı katalog listesini
+    paylaşır; render ve alan validasyonu için ek sorgu yapılmaz. Cache eski
+    olabileceğinden seçilen ürünler formset.clean()'de DB'den doğrulanır.
+    """
+    iterator = CatalogChoiceIterator
+
+    def __init__(self, *args, **kwargs):
+        self._catalog = []
+        self._catalog_by_pk = {}
+        super().__init__(*args, **kwargs)
+
+    @property
+    def catalog(self):
+        return self._catalog
+
+    @catalog.setter
+    def catalog(self, products):
+        self._catalog = products
+        self._catalog_by_pk = {str(product.pk): product for product in products}
+
+    def __deepcopy__(self, memo):
+        result = super().__deepcopy__(memo)
+        result.catalog = self._catalog
+        return result
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self._catalog_by_pk.get(str(value))
+        if obj is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+
 class DeclarationItemForm(forms.ModelForm):
     # Custom field for MaterialProduct selection
-    material_product = forms.ModelChoiceField(
-        queryset=None,  # Will be set in __init__
+    material_product = CatalogChoiceField(
+        queryset=MaterialProduct.objects.none(),  # Seçenekler __init__'te katalogdan gelir
         required=False,
         empty_label="--- Produkt Wahlen ---",
         widget=forms.Select(attrs={'class': 'form-control material-product-select'})
@@ -43,9 +100,51 @@ class DeclarationItemForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
+        catalog = kwargs.pop('catalog', None)
         super().__init__(*args, **kwargs)
-        if user:
-            self.fields['material_product'].queryset = MaterialProduct.objects.filter(user=user, is_active=True)
+        if catalog is None and user:
+            catalog = get_material_catalog(user.pk)
+        self.fields['material_product'].catalog = catalog or []
+
+
+class ExistingObjectChoiceField(forms.ModelChoiceField):
+    """
+    Formset'in gizli `id` alanı. Django her satır için ayrı bir SELECT ile
+    nesneyi arar; burada formset'in zaten yüklediği satırlardan bakılır.
+    """
+
+    def __init__(self, formset, *args, **kwargs):
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            pk = self.formset.model._meta.pk.to_python(value)
+        except forms.ValidationError:
+            pk = None
+        obj = self.formset._existing_object(pk) if pk is not None else None
+        if obj is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return obj
+
+
+class BaseLineItemFormSet(forms.BaseInlineFormSet):
+    """Satır formset'leri için ortak base: mevcut satırlar tek sorguda yüklenir"""
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        pk_name = self._pk_field.name
+        field = form.fields.get(pk_name)
+        if isinstance(field, forms.ModelChoiceField) and not isinstance(field, ExistingObjectChoiceField):
+            form.fields[pk_name] = ExistingObjectChoiceField(
+                self, field.queryset, initial=field.initial, required=False, widget=field.widget
+            )
 
 
 # Formset for product works
@@ -53,20 +152,57 @@ ProductWorkFormSet = forms.inlineformset_factory(
     Declaration,
     ProductWork,
     form=ProductWorkForm,
+    formset=BaseLineItemFormSet,
     extra=1,
     max_num=20,
     can_delete=True
 )
 
 # Base Formset class to pass user to each form
-class BaseDeclarationItemFormSet(forms.BaseInlineFormSet):
+class BaseDeclarationItemFormSet(BaseLineItemFormSet):
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        # Kullanıcının ürün kataloğu istek başına bir kez okunur, tüm formlar paylaşır
+        self.catalog = get_material_catalog(self.user.pk) if self.user else []
         super().__init__(*args, **kwargs)
 
-    def _construct_form(self, i, **kwargs):
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
         kwargs['user'] = self.user
-        return super()._construct_form(i, **kwargs)
+        kwargs['catalog'] = self.catalog
+        return kwargs
+
+    def clean(self):
+        """
+        Seçilen ürünler hâlâ var ve aktif mi? Katalog cache'i sinyallerle
+        temizlenir; .update() veya başka process'teki eski cache sinyal
+        üretmez, bu yüzden kaydetmeden önce tek sorguyla DB'ye bakılır.
+        """
+        super().clean()
+        selected = {}
+        for form in self.forms:
+            if not hasattr(form, 'cleaned_data') or form.cleaned_data.get('DELETE'):
+                continue
+            product = form.cleaned_data.get('material_product')
+            if product is not None:
+                selected.setdefault(product.pk, []).append(form)
+        if not selected or self.user is None:
+            return
+
+        available = set(
+            MaterialProduct.objects.filter(pk__in=selected, user=self.user, is_active=True).values_list('pk', flat=True)
+        )
+        missing = [pk for pk in selected if pk not in available]
+        if not missing:
+            return
+        # Cache eski: yenisini yükle, form tekrar gösterilirken ürün listede olmasın
+        invalidate_material_catalog(self.user.pk)
+        self.catalog = get_material_catalog(self.user.pk)
+        for form in self.forms:
+            form.fields['material_product'].catalog = self.catalog
+        for pk in missing:
+            for form in selected[pk]:
+                form.add_error('material_product', 'Dieses Produkt ist nicht mehr verfügbar. Bitte wählen Sie ein anderes.')
 
 # Formset for multiple items
 DeclarationItemFormSet = forms.inlineformset_factory(
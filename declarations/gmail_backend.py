@@ -1,5 +1,9 @@
 # declarations/gmail_backend.py
 import base64
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from django.core.mail.backends.base import BaseEmailBackend
@@ -7,48 +11,172 @@ from django.conf import settings
 
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+from utils.metrics import timed
 
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.send']
 
-def _build_service():
-    creds = Credentials(
-        token=None,  # access token yok; refresh ile alınacak
-        refresh_token=settings.GOOGLE_REFRESH_TOKEN,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=settings.GOOGLE_CLIENT_ID,
-        client_secret=settings.GOOGLE_CLIENT_SECRET,
-        scopes=GMAIL_SCOPES,
-    )
-    # access token'ı yenile
-    creds.refresh(Request())
-    return build('gmail', 'v1', credentials=creds, cache_discovery=False)
+# Gmail batch isteği başına en fazla mesaj (Google 50'nin üstünü önermiyor)
+GMAIL_BATCH_SIZE = 50
+
+# Access token'ın bitmesine bu kadar süre kala yenile
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== GMAIL CLIENT ====================
+# Django her send_mail için yeni bir backend oluşturur. Credentials bu yüzden
+# process genelinde tutulur ve sadece süresi dolmak üzereyken yenilenir;
+# service nesneleri (httplib2 thread-safe değil) thread başına bir kez
+# oluşturulur. Bkz. utils.google_drive'daki Drive client'ı.
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_discovery_document = None
+_thread_local = threading.local()
+
+
+def _needs_refresh(creds):
+    if not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+    # google-auth expiry'yi naive UTC olarak tutar
+    return creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+
+
+def get_gmail_credentials():
+    """Process genelinde paylaşılan credentials (gerekirse yenilenir)"""
+    global _credentials
+    creds = _credentials
+    if creds is not None and not _needs_refresh(creds):
+        return creds
+
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = Credentials(
+                token=None,  # access token yok; refresh ile alınacak
+                refresh_token=settings.GOOGLE_REFRESH_TOKEN,
+                token_uri="https://oauth2.googleapis.com/token",
+                client_id=settings.GOOGLE_CLIENT_ID,
+                client_secret=settings.GOOGLE_CLIENT_SECRET,
+                scopes=GMAIL_SCOPES,
+            )
+        if _needs_refresh(_credentials):
+            _credentials.refresh(Request())
+        return _credentials
+
+
+def _get_discovery_document():
+    """googleapiclient ile gelen statik Gmail v1 discovery dokümanı (bir kez parse edilir)"""
+    global _discovery_document
+    if _discovery_document is None:
+        _discovery_document = json.loads(discovery_cache.get_static_doc('gmail', 'v1'))
+    return _discovery_document
+
+
+def get_gmail_service():
+    """
+    Gmail servisini döner.
+
+    Service nesnesi thread başına bir kez oluşturulur ve tekrar kullanılır;
+    sonraki çağrılar sadece token süresini kontrol eder.
+    """
+    creds = get_gmail_credentials()
+    service = getattr(_thread_local, 'service', None)
+    if service is None or getattr(_thread_local, 'credentials', None) is not creds:
+        service = build_from_document(_get_discovery_document(), credentials=creds)
+        _thread_local.service = service
+        _thread_local.credentials = creds
+    return service
+
+
+def reset_gmail_client():
+    """Cache'lenmiş credentials'ı bırak (ör. token iptal edildiğinde)"""
+    global _credentials
+    with _credentials_lock:
+        _credentials = None
+
 
 class GmailApiEmailBackend(BaseEmailBackend):
     """
     Django EmailBackend uyumlu: EmailMessage objelerini Gmail API ile yollar.
+    Birden fazla mesaj Gmail batch endpoint'i üzerinden tek HTTP isteğinde gider.
     .env'de:
       GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REFRESH_TOKEN
       DEFAULT_FROM_EMAIL
     """
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.service = _build_service()
 
+    @timed('mail.send')
     def send_messages(self, email_messages):
         if not email_messages:
             return 0
-        print(f"DEBUG: Sending {len(email_messages)} messages")
+        logger.debug('Gmail: sending %d messages', len(email_messages))
+        try:
+            service = get_gmail_service()
+        except Exception:
+            if not self.fail_silently:
+                raise
+            logger.exception('Gmail: client could not be initialized')
+            return 0
+
+        if len(email_messages) == 1:
+            return self._send_single(service, email_messages[0])
+
         sent_count = 0
-        for message in email_messages:
+        for i in range(0, len(email_messages), GMAIL_BATCH_SIZE):
+            sent_count += self._send_batch(service, email_messages[i:i + GMAIL_BATCH_SIZE])
+        return sent_count
+
+    def _send_single(self, service, message):
+        try:
+            raw = self._build_raw(message)
+            service.users().messages().send(userId='me', body={'raw': raw}).execute()
+            return 1
+        except Exception:
+            if not self.fail_silently:
+                raise
+            logger.exception('Gmail: message could not be sent')
+            return 0
+
+    def _send_batch(self, service, email_messages):
+        """Mesajları tek bir batch HTTP isteğiyle gönder; başarılı mesaj sayısını döner"""
+        errors = []
+        sent = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors.append(exception)
+            else:
+                sent.append(request_id)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for index, message in enumerate(email_messages):
             try:
                 raw = self._build_raw(message)
-                self.service.users().messages().send(userId='me', body={'raw': raw}).execute()
-                sent_count += 1
             except Exception as e:
-                if not self.fail_silently:
-                    raise
-        return sent_count
+                errors.append(e)
+                continue
+            batch.add(service.users().messages().send(userId='me', body={'raw': raw}), request_id=str(index))
+
+        try:
+            if len(errors) < len(email_messages):
+                batch.execute()
+        except Exception:
+            if not self.fail_silently:
+                raise
+            logger.exception('Gmail: batch request failed')
+            return 0
+
+        if errors:
+            if not self.fail_silently:
+                raise errors[0]
+            for error in errors:
+                logger.warning('Gmail: message could not be sent: %s', error)
+        return len(sent)
 
     def _build_raw(self, message):
         from email.mime.base import MIMEBase
@@ -57,7 +185,6 @@ class GmailApiEmailBackend(BaseEmailBackend):
         # from, to, subject, body (text veya html) ayarla
         from_email = message.from_email or settings.DEFAULT_FROM_EMAIL
         to_list = list(message.to or [])
-        print(f"DEBUG Gmail: from={from_email}, to={to_list}")
         cc_list = list(message.cc or [])
         bcc_list = list(message.bcc or [])
 
@@ -109,11 +236,6 @@ class GmailApiEmailBackend(BaseEmailBackend):
                         )
 
                     mime.attach(part)
-                    # Windows console emoji sorunu için try-except ekle
-                    try:
-                        print(f"  Attachment added: {filename}")
-                    except UnicodeEncodeError:
-                        print(f"  [*] Attachment added: {filename}")
         else:
             # Attachments yok, eski mantık
             if has_html:
@@ -0,0 +1,74 @@
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from declarations.services.pdf_text import extract_pdf_text
+from declarations.services.reference_parser import detect_profile, parse_reference_text
+
+
+class Command(BaseCommand):
+    help = 'Referans PDF parse süresini ölçer: metin çıkarma ve parse ayrı ayrı (örnek PDF klasörü üzerinde)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='PDF dosyaları veya klasörler (.txt: sadece parse ölçülür)')
+        parser.add_argument('--iterations', type=int, default=20, help='Dosya başına parse sayısı')
+
+    def handle(self, *args, **options):
+        files = []
+        for path in map(Path, options['paths']):
+            if path.is_dir():
+                files.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in ('.pdf', '.txt')))
+            elif path.exists():
+                files.append(path)
+            else:
+                raise CommandError(f'{path} nicht gefunden')
+        if not files:
+            raise CommandError('Keine PDF-Dateien gefunden')
+
+        iterations = max(1, options['iterations'])
+        extract_timings, parse_timings = [], []
+        profiles = Counter()
+
+        for path in files:
+            if path.suffix.lower() == '.txt':
+                text = path.read_text(encoding='utf-8')
+                extract_ms = None
+            else:
+                start = time.perf_counter()
+                with open(path, 'rb') as f:
+                    text, _ = extract_pdf_text(f)
+                extract_ms = (time.perf_counter() - start) * 1000
+                extract_timings.append(extract_ms)
+
+            profile = detect_profile(text)
+            profiles[profile.name] += 1
+
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                result = parse_reference_text(text)
+                timings.append((time.perf_counter() - start) * 1000)
+            parse_timings.extend(timings)
+
+            extract_label = f"{extract_ms:8.1f} ms" if extract_ms is not None else '       -   '
+            self.stdout.write(
+                f"{path.name[:40]:<40} {profile.name:<16} extract {extract_label} | "
+                f"parse median {statistics.median(timings):7.3f} ms | "
+                f"{len(result['product_works'])} Arbeit(en), {len(result['materials'])} Material(ien)"
+            )
+
+        self.stdout.write('')
+        self.stdout.write(f"Dateien: {len(files)}  Profile: {dict(profiles)}")
+        if extract_timings:
+            self._report('extract', extract_timings)
+        self._report('parse', parse_timings)
+
+    def _report(self, label, timings):
+        self.stdout.write(
+            f"{label:>10}: min {min(timings):8.3f} ms | "
+            f"median {statistics.median(timings):8.3f} ms | "
+            f"mean {statistics.mean(timings):8.3f} ms"
+        )
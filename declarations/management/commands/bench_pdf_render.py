@@ -0,0 +1,71 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from weasyprint import HTML
+
+from declarations.models import Declaration
+from declarations.utils import (
+    PDF_STYLESHEET_PATH, _init_pdf_renderer, _render_pdf_task, get_renderer_pool,
+)
+
+
+class Command(BaseCommand):
+    help = 'PDF render süresini ölçer: soğuk (her seferinde CSS/font) vs. sıcak (önceden yüklenmiş)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--declaration', type=int, help='Render edilecek Declaration ID (varsayılan: en son)')
+        parser.add_argument('--iterations', type=int, default=10, help='Mod başına render sayısı')
+        parser.add_argument('--skip-pool', action='store_true', help='Process havuzu ölçümünü atla')
+
+    def handle(self, *args, **options):
+        declarations = Declaration.objects.select_related('praxis')
+        if options['declaration']:
+            declaration = declarations.filter(pk=options['declaration']).first()
+        else:
+            declaration = declarations.order_by('-created_at').first()
+        if declaration is None:
+            raise CommandError('Keine Declaration gefunden')
+
+        try:
+            hersteller_profile = declaration.praxis.hersteller_profile
+        except Exception:
+            hersteller_profile = None
+
+        html_string = render_to_string('declarations/pdf/declaration.html', {
+            'declaration': declaration,
+            'hersteller_profile': hersteller_profile
+        })
+        with open(PDF_STYLESHEET_PATH, encoding='utf-8') as f:
+            inline_html = html_string.replace('</head>', f'<style>{f.read()}</style></head>', 1)
+
+        iterations = max(1, options['iterations'])
+        self.stdout.write(f"Declaration {declaration.declaration_number}, {iterations} Render pro Modus\n")
+
+        # Soğuk: eski davranış, her render'da inline CSS parse + yeni font config
+        self._report('cold', self._measure(lambda: HTML(string=inline_html).write_pdf(), iterations))
+
+        # Sıcak, aynı process: font config ve CSS bir kez hazırlanır
+        state = _init_pdf_renderer(PDF_STYLESHEET_PATH)
+        self._report('warm', self._measure(lambda: _render_pdf_task(state, html_string), iterations))
+
+        if not options['skip_pool']:
+            pool = get_renderer_pool()
+            pool.warm_up()
+            self._report('warm pool', self._measure(lambda: pool.submit(html_string), iterations))
+
+    def _measure(self, render, iterations):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            render()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def _report(self, label, timings):
+        self.stdout.write(
+            f"{label:>10}: min {min(timings):8.1f} ms | "
+            f"median {statistics.median(timings):8.1f} ms | "
+            f"mean {statistics.mean(timings):8.1f} ms"
+        )
@@ -0,0 +1,87 @@
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from declarations.services.bulk_import import STATUS_CREATED, STATUS_DUPLICATE, finalize_drafts, import_reference_pdfs
+
+
+class Command(BaseCommand):
+    help = 'Referans PDF\'lerden (veya PDF içeren ZIP\'lerden) taslak Erklärung\'lar oluşturur'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='PDF / ZIP dosyaları veya klasörler')
+        parser.add_argument('--user', required=True, help='Erklärung\'ların oluşturulacağı kullanıcı (username)')
+        parser.add_argument(
+            '--finalize', action='store_true',
+            help='Auftragsnummer\'ı olan taslakları hemen tamamla (numara + PDF işleri tek partide)'
+        )
+
+    def chunks(self, files):
+        """
+        Import başına dosya ve toplam boyut sınırı: büyük klasörler parçalar
+        halinde içe aktarılır (ZIP'lerin açılmış boyutu önceden bilinmez)
+        """
+        max_files = max(1, getattr(settings, 'BULK_IMPORT_MAX_FILES', 100))
+        max_total_bytes = getattr(settings, 'BULK_IMPORT_MAX_TOTAL_BYTES', 200 * 1024 * 1024)
+        chunk, chunk_bytes = [], 0
+        for path in files:
+            size = path.stat().st_size
+            if chunk and (len(chunk) >= max_files or (max_total_bytes and chunk_bytes + size > max_total_bytes)):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(path)
+            chunk_bytes += size
+        if chunk:
+            yield chunk
+
+    def handle(self, *args, **options):
+        try:
+            praxis = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Benutzer {options['user']} nicht gefunden")
+
+        files = []
+        for path in map(Path, options['paths']):
+            if path.is_dir():
+                files.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in ('.pdf', '.zip')))
+            elif path.exists():
+                files.append(path)
+            else:
+                raise CommandError(f'{path} nicht gefunden')
+        if not files:
+            raise CommandError('Keine PDF- oder ZIP-Dateien gefunden')
+
+        counts = {STATUS_CREATED: 0, STATUS_DUPLICATE: 0}
+        errors = 0
+        draft_ids = []
+        for chunk_paths in self.chunks(files):
+            with ExitStack() as stack:
+                chunk = [(str(path), stack.enter_context(open(path, 'rb'))) for path in chunk_paths]
+                results = import_reference_pdfs(praxis, chunk)
+
+            for result in results:
+                if result.status == STATUS_CREATED:
+                    self.stdout.write(f"{result.file_name}: Entwurf {result.declaration.pk} ({result.declaration.patient_name})")
+                    draft_ids.append(result.declaration.pk)
+                elif result.status == STATUS_DUPLICATE:
+                    self.stdout.write(self.style.WARNING(f"{result.file_name}: übersprungen ({result.message})"))
+                else:
+                    self.stdout.write(self.style.ERROR(f"{result.file_name}: {result.message}"))
+                if result.status in counts:
+                    counts[result.status] += 1
+                else:
+                    errors += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts[STATUS_CREATED]} Entwürfe erstellt, {counts[STATUS_DUPLICATE]} übersprungen, {errors} Fehler"
+        ))
+
+        if options['finalize'] and draft_ids:
+            # Tüm parçaların taslakları tek partide: tek numara ayırma, tek PdfJob bulk_create
+            finalized = finalize_drafts(praxis, draft_ids)
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(finalized)} Entwürfe fertiggestellt, {len(draft_ids) - len(finalized)} ohne Auftragsnummer"
+            ))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from declarations.services.email_outbox import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Email outbox\'taki email\'leri gönderir (Gmail API / EMAIL_BACKEND)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'EMAIL_WORKER_POLL_INTERVAL', 5),
+            help='Kuyruk boşken bekleme süresi (saniye)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'EMAIL_WORKER_BATCH_SIZE', 20),
+            help='Tek seferde alınan en fazla email'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Kuyruk boşalınca çık (cron için)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Email worker gestartet")
+        try:
+            sent = run_worker(
+                poll_interval=options['poll_interval'],
+                batch_size=max(1, options['batch_size']),
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Email worker gestoppt")
+            return
+        self.stdout.write(self.style.SUCCESS(f"{sent} E-Mail(s) gesendet"))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from declarations.services.import_queue import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Import kuyruğundaki referans PDF\'leri parse edip taslak Erklärung\'lar oluşturur'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'IMPORT_WORKER_POLL_INTERVAL', 2),
+            help='Kuyruk boşken bekleme süresi (saniye)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Kuyruk boşalınca çık (cron için)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Import worker gestartet")
+        try:
+            processed = run_worker(
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Import worker gestoppt")
+            return
+        self.stdout.write(self.style.SUCCESS(f"{processed} Import Job(s) verarbeitet"))
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from declarations.services.pdf_queue import run_worker
+from declarations.utils import get_renderer_pool
+
+
+class Command(BaseCommand):
+    help = 'PDF kuyruğundaki işleri çalıştırır (render + Google Drive upload)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=getattr(settings, 'PDF_WORKER_CONCURRENCY', 2),
+            help='Paralel çalışan worker thread sayısı'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=getattr(settings, 'PDF_WORKER_POLL_INTERVAL', 2),
+            help='Kuyruk boşken bekleme süresi (saniye)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Kuyruk boşalınca çık (cron için)'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        if getattr(settings, 'PDF_RENDER_POOL_SIZE', 2) > 0:
+            # Renderer process'lerini önceden başlat (font/CSS yüklemesi ilk işe yansımasın)
+            get_renderer_pool().warm_up()
+        self.stdout.write(f"PDF worker gestartet (concurrency={concurrency})")
+        try:
+            processed = run_worker(
+                concurrency=concurrency,
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("PDF worker gestoppt")
+            return
+        self.stdout.write(self.style.SUCCESS(f"{processed} PDF Job(s) verarbeitet"))
@@ -1,10 +1,23 @@
 """
 Zahnovia Middleware
-Profil tamamlama kontrolü için
+Profil tamamlama kontrolü, istek metrikleri ve tracing için
 """
+import random
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
 from django.shortcuts import redirect
 from django.urls import reverse
 
+from utils.metrics import (
+    REQUEST_DB_SECONDS, REQUEST_EXTERNAL_SECONDS, REQUEST_QUERIES, REQUEST_SECONDS,
+    current_request_stats, end_request, query_wrapper, start_request
+)
+from utils.tracing import clean_trace_id, end_trace, log_slow_request, start_trace
+from .services.profile_cache import get_cached_profile, invalidate_profile
+
 
 class ProfileCompletionMiddleware:
     """
@@ -25,29 +38,101 @@ class ProfileCompletionMiddleware:
         '/media/',
     ]
 
+    # Tüm muaf prefix'ler tek bir regex'te: her istekte tek match
+    EXEMPT_URL_RE = re.compile('|'.join(re.escape(url) for url in EXEMPT_URLS))
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
         # Önce muaf URL'leri kontrol et
-        path = request.path
-        for exempt_url in self.EXEMPT_URLS:
-            if path.startswith(exempt_url):
-                return self.get_response(request)
+        if self.EXEMPT_URL_RE.match(request.path):
+            return self.get_response(request)
 
         # Kullanıcı giriş yapmış mı kontrol et
         if request.user.is_authenticated and not request.user.is_superuser:
-            try:
-                profile = request.user.hersteller_profile
+            # Profil bayrakları cache'ten okunur (normal durumda ek sorgu yok)
+            profile = get_cached_profile(request.user.pk)
 
-                # Email doğrulanmış ama profil tamamlanmamış mı?
-                if profile.email_verified and not profile.profile_completed:
-                    return redirect('profile_edit')
-
-            except AttributeError:
+            if profile is None:
                 # Profil yoksa oluştur ve yönlendir
                 from .models import HerstellerProfile
                 HerstellerProfile.objects.get_or_create(user=request.user)
                 return redirect('profile_edit')
 
+            # Email doğrulanmış ama profil tamamlanmamış mı?
+            if profile.email_verified and not profile.profile_completed:
+                # Profil başka bir process'te tamamlanmış olabilir: yönlendirmeden önce DB'den doğrula
+                invalidate_profile(request.user.pk)
+                profile = get_cached_profile(request.user.pk)
+                if profile and profile.email_verified and not profile.profile_completed:
+                    return redirect('profile_edit')
+
         return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """
+    Her istek için süre, SQL sorgu sayısı / süresi ve harici çağrı süresini
+    (utils.metrics.timed) view bazında histogramlara yazar. MIDDLEWARE
+    listesinin başında olmalı.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats, token = start_request()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(query_wrapper):
+                response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            end_request(token)
+
+            # 404 vb. çözümlenemeyen URL'ler tek etikette toplanır (etiket sayısı sınırlı kalsın)
+            match = getattr(request, 'resolver_match', None)
+            view = match.view_name if match else 'unresolved'
+            REQUEST_SECONDS.observe(elapsed, view=view, method=request.method)
+            REQUEST_QUERIES.observe(stats.queries, view=view)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, view=view)
+            REQUEST_EXTERNAL_SECONDS.observe(stats.external_seconds, view=view)
+        return response
+
+
+class TracingMiddleware:
+    """
+    Her isteğe bir trace ID verir (gelen X-Request-ID geçerliyse o kullanılır),
+    yanıta X-Trace-ID header'ı olarak ekler ve yavaş istekleri örnekleyerek
+    span süreleriyle loglar. MetricsMiddleware'den hemen sonra olmalı (SQL
+    sayaçları yavaş istek kaydına eklenir).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold_ms = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 0)
+        self.sample_rate = getattr(settings, 'SLOW_REQUEST_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        trace, token = start_trace(clean_trace_id(request.headers.get('X-Request-ID')))
+        request.trace_id = trace.trace_id
+        try:
+            response = self.get_response(request)
+            response['X-Trace-ID'] = trace.trace_id
+
+            if (self.threshold_ms and trace.elapsed_ms() >= self.threshold_ms
+                    and random.random() < self.sample_rate):
+                match = getattr(request, 'resolver_match', None)
+                stats = current_request_stats()
+                log_slow_request(
+                    trace,
+                    view=match.view_name if match else 'unresolved',
+                    method=request.method,
+                    status=response.status_code,
+                    queries=stats.queries if stats else None,
+                    db_ms=round(stats.db_seconds * 1000, 1) if stats else None,
+                )
+        finally:
+            end_trace(token)
+        return response
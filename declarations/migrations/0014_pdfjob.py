@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0013_herstellerprofile_email_verified_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PdfJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Wartend'), ('running', 'In Bearbeitung'), ('done', 'Fertig'), ('failed', 'Fehlgeschlagen')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Versuche')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='Max. Versuche')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ausführen ab')),
+                ('last_error', models.TextField(blank=True, verbose_name='Letzter Fehler')),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('declaration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pdf_jobs', to='declarations.declaration')),
+            ],
+            options={
+                'verbose_name': 'PDF Job',
+                'verbose_name_plural': 'PDF Jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='pdfjob_status_run_after_idx')],
+            },
+        ),
+    ]
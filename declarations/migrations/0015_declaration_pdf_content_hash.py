@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0014_pdfjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='declaration',
+            name='pdf_content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
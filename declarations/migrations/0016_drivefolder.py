@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0015_declaration_pdf_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveFolder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('folder_id', models.CharField(blank=True, max_length=200)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Drive Ordner',
+                'verbose_name_plural': 'Drive Ordner',
+            },
+        ),
+    ]
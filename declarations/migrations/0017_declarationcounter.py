@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    """Mevcut DECL-YYYY-NNNN numaralarından praxis/yıl bazında sayaçları oluştur"""
+    Declaration = apps.get_model('declarations', 'Declaration')
+    DeclarationCounter = apps.get_model('declarations', 'DeclarationCounter')
+
+    last_values = {}
+    numbers = Declaration.objects.filter(
+        declaration_number__startswith='DECL-'
+    ).values_list('praxis_id', 'declaration_number')
+    for praxis_id, number in numbers.iterator():
+        parts = number.split('-')
+        if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+            continue
+        key = (praxis_id, int(parts[1]))
+        last_values[key] = max(last_values.get(key, 0), int(parts[2]))
+
+    DeclarationCounter.objects.bulk_create([
+        DeclarationCounter(praxis_id=praxis_id, year=year, last_value=last_value)
+        for (praxis_id, year), last_value in last_values.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0016_drivefolder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeclarationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('praxis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='declaration_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Erklärungszähler',
+                'verbose_name_plural': 'Erklärungszähler',
+                'unique_together': {('praxis', 'year')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
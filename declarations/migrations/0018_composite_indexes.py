@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0017_declarationcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='herstellerprofile',
+            name='verification_token',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='archivedocument',
+            index=models.Index(fields=['user', '-document_date', '-upload_date', '-id'], name='archive_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='declaration',
+            index=models.Index(fields=['praxis', '-created_at', '-id'], name='decl_praxis_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materialproduct',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'name'], name='matprod_user_active_name_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0018_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=200, unique=True)),
+                ('from_email', models.CharField(blank=True, max_length=254)),
+                ('recipients', models.JSONField(default=list)),
+                ('subject', models.CharField(max_length=500)),
+                ('body', models.TextField(blank=True)),
+                ('html_body', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Wartend'), ('sending', 'Wird gesendet'), ('sent', 'Gesendet'), ('dead', 'Fehlgeschlagen')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Versuche')),
+                ('max_attempts', models.PositiveIntegerField(default=8, verbose_name='Max. Versuche')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Senden ab')),
+                ('last_error', models.TextField(blank=True, verbose_name='Letzter Fehler')),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Ausgehende E-Mail',
+                'verbose_name_plural': 'Ausgehende E-Mails',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='outbox_status_run_after_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0019_outbound_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='declaration',
+            name='is_draft',
+            field=models.BooleanField(default=False, verbose_name='Entwurf'),
+        ),
+        migrations.AlterField(
+            model_name='declaration',
+            name='declaration_number',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
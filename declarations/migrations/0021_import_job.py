@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('declarations', '0020_declaration_draft'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Wartend'), ('running', 'In Bearbeitung'), ('done', 'Fertig'), ('failed', 'Fehlgeschlagen')], default='pending', max_length=10, verbose_name='Status')),
+                ('results', models.JSONField(blank=True, default=list)),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Versuche')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='Max. Versuche')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ausführen ab')),
+                ('last_error', models.TextField(blank=True, verbose_name='Letzter Fehler')),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('praxis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Import Job',
+                'verbose_name_plural': 'Import Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportJobFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('file_name', models.CharField(max_length=500)),
+                ('data', models.BinaryField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='declarations.importjob')),
+            ],
+            options={
+                'verbose_name': 'Import-Datei',
+                'verbose_name_plural': 'Import-Dateien',
+                'ordering': ['job', 'position'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(fields=['status', 'run_after'], name='importjob_status_run_after_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 class HerstellerProfile(models.Model):
@@ -24,7 +26,7 @@ class HerstellerProfile(models.Model):
 
     # Email doğrulama alanları
     email_verified = models.BooleanField(default=False, verbose_name="E-Mail bestätigt")
-    verification_token = models.CharField(max_length=100, blank=True)
+    verification_token = models.CharField(max_length=100, blank=True, db_index=True)
     token_created_at = models.DateTimeField(null=True, blank=True)
 
     # Profil tamamlandı mı?
@@ -45,7 +47,9 @@ class Declaration(models.Model):
     """Konformitätserklärung (Uygunluk Beyanı)"""
 
     praxis = models.ForeignKey(User, on_delete=models.CASCADE, related_name='declarations')
-    declaration_number = models.CharField(max_length=50, blank=True)
+    # Taslaklar (toplu import) fertigstellen'e kadar numarasızdır (NULL: unique_together'a takılmaz)
+    declaration_number = models.CharField(max_length=50, blank=True, null=True)
+    is_draft = models.BooleanField(default=False, verbose_name="Entwurf")
 
     # Hasta ve Üretim Bilgileri
     auftragsnummer = models.CharField(max_length=100, verbose_name="Auftragsnummer", blank=True)
@@ -57,38 +61,89 @@ class Declaration(models.Model):
 
     # PDF URL (oluşturulduktan sonra)
     pdf_url = models.URLField(blank=True, null=True)
+    # pdf_url'deki PDF'i üreten verilerin hash'i (render cache)
+    pdf_content_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Konformitätserklärung'
         verbose_name_plural = 'Konformitätserklärungen'
         unique_together = [['praxis', 'declaration_number']]
+        indexes = [
+            # declaration_list / dashboard: praxis'e göre, en yeni önce (keyset: created_at, id)
+            models.Index(fields=['praxis', '-created_at', '-id'], name='decl_praxis_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.declaration_number or 'Draft'} - {self.praxis.username}"
 
     def save(self, *args, **kwargs):
-        if not self.declaration_number:
+        if not self.declaration_number and not self.is_draft:
             # Otomatik numara üretimi: Her kullanıcı için ayrı sıralama
             # Format: DECL-YYYY-NNNN (kullanıcı bazında)
-            from datetime import datetime
-            year = datetime.now().year
+            # Numara ve kayıt aynı transaction'da: INSERT başarısız olursa numara boşa gitmez
+            with transaction.atomic():
+                self.declaration_number = DeclarationCounter.next_number(self.praxis)
+                super().save(*args, **kwargs)
+            return
 
-            # Sadece bu kullanıcının bu yıla ait son declaration'ını bul
-            last_decl = Declaration.objects.filter(
-                praxis=self.praxis,
-                declaration_number__startswith=f'DECL-{year}'
-            ).order_by('-declaration_number').first()
+        super().save(*args, **kwargs)
 
-            if last_decl and last_decl.declaration_number:
-                last_num = int(last_decl.declaration_number.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
 
-            self.declaration_number = f'DECL-{year}-{new_num:04d}'
+class DeclarationCounter(models.Model):
+    """Praxis ve yıl bazında son verilen declaration numarası"""
 
-        super().save(*args, **kwargs)
+    praxis = models.ForeignKey(User, on_delete=models.CASCADE, related_name='declaration_counters')
+    year = models.PositiveIntegerField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Erklärungszähler'
+        verbose_name_plural = 'Erklärungszähler'
+        unique_together = [['praxis', 'year']]
+
+    def __str__(self):
+        return f"{self.praxis.username} {self.year}: {self.last_value}"
+
+    @staticmethod
+    def format_number(year, value):
+        return f'DECL-{year}-{value:04d}'
+
+    @classmethod
+    def allocate(cls, praxis, count=1, year=None):
+        """
+        Sayacı atomik olarak `count` kadar artır.
+
+        Artırma tek bir koşullu UPDATE ile yapılır; UPDATE satırı transaction
+        sonuna kadar kilitler, böylece aynı praxis için eşzamanlı create'ler
+        sırayla farklı numaralar alır (IntegrityError / retry gerekmez).
+
+        Args:
+            praxis: User instance
+            count: Ayrılacak numara adedi
+            year: Varsayılan: bu yıl
+
+        Returns:
+            tuple: (year, ilk_değer) - ayrılan aralık ilk_değer .. ilk_değer + count - 1
+        """
+        year = year or timezone.localdate().year
+        with transaction.atomic():
+            counter = cls.objects.filter(praxis=praxis, year=year)
+            if not counter.update(last_value=F('last_value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(praxis=praxis, year=year, last_value=count)
+                except IntegrityError:
+                    # Başka bir istek sayacı aynı anda oluşturdu
+                    counter.update(last_value=F('last_value') + count)
+            last_value = counter.values_list('last_value', flat=True).get()
+        return year, last_value - count + 1
+
+    @classmethod
+    def next_number(cls, praxis):
+        """Praxis için sıradaki declaration numarasını ayır (DECL-YYYY-NNNN)"""
+        year, value = cls.allocate(praxis)
+        return cls.format_number(year, value)
 
 
 class ProductWork(models.Model):
@@ -163,6 +218,12 @@ class MaterialProduct(models.Model):
         ordering = ['name']
         verbose_name = 'Material Product'
         verbose_name_plural = 'Material Products'
+        indexes = [
+            # Formlardaki ürün seçimi: kullanıcının aktif ürünleri, isme göre.
+            # SQLite boolean filtreyi `WHERE "is_active"` olarak yazdığından sütun
+            # indekste işe yaramaz; bunun yerine kısmi (partial) index kullanılır.
+            models.Index(fields=['user', 'name'], condition=models.Q(is_active=True), name='matprod_user_active_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.material})"
@@ -199,6 +260,10 @@ class ArchiveDocument(models.Model):
         ordering = ['-upload_date']
         verbose_name = 'Archiv Dokument'
         verbose_name_plural = 'Archiv Dokumente'
+        indexes = [
+            # archive_list: kullanıcıya göre, belge tarihi / yükleme tarihi azalan (keyset: + id)
+            models.Index(fields=['user', '-document_date', '-upload_date', '-id'], name='archive_user_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} ({self.upload_date.strftime('%d.%m.%Y')})"
@@ -210,6 +275,193 @@ class ArchiveDocument(models.Model):
         return self.get_category_display()
 
 
+class PdfJob(models.Model):
+    """Arka planda çalışan PDF render + Google Drive upload işi"""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Wartend'),
+        (STATUS_RUNNING, 'In Bearbeitung'),
+        (STATUS_DONE, 'Fertig'),
+        (STATUS_FAILED, 'Fehlgeschlagen'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    declaration = models.ForeignKey(Declaration, on_delete=models.CASCADE, related_name='pdf_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+
+    # Retry bilgileri
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Versuche")
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name="Max. Versuche")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Ausführen ab")
+    last_error = models.TextField(blank=True, verbose_name="Letzter Fehler")
+
+    # Worker kilidi
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'PDF Job'
+        verbose_name_plural = 'PDF Jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='pdfjob_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"PDF Job #{self.pk} - {self.declaration} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+
+class DriveFolder(models.Model):
+    """Google Drive klasör yolu → klasör ID cache'i (ör. 'Zahnovia/Declarations')"""
+
+    path = models.CharField(max_length=500, unique=True)
+    # Boş folder_id: klasör şu anda başka bir worker tarafından oluşturuluyor (kilit)
+    folder_id = models.CharField(max_length=200, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Drive Ordner'
+        verbose_name_plural = 'Drive Ordner'
+
+    def __str__(self):
+        return f"{self.path} ({self.folder_id or '...'})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Gönderilecek email (outbox). EmailService'ler buraya yazar,
+    `run_email_worker` management command'ı gönderir.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Wartend'),
+        (STATUS_SENDING, 'Wird gesendet'),
+        (STATUS_SENT, 'Gesendet'),
+        (STATUS_DEAD, 'Fehlgeschlagen'),
+    ]
+
+    # Aynı email'in iki kez kuyruğa girmesini engeller (ör. form iki kez gönderildiğinde)
+    idempotency_key = models.CharField(max_length=200, unique=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    subject = models.CharField(max_length=500)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+
+    # Retry bilgileri
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Versuche")
+    max_attempts = models.PositiveIntegerField(default=8, verbose_name="Max. Versuche")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Senden ab")
+    last_error = models.TextField(blank=True, verbose_name="Letzter Fehler")
+
+    # Worker kilidi
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Ausgehende E-Mail'
+        verbose_name_plural = 'Ausgehende E-Mails'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='outbox_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.recipients)} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """
+    Toplu referans PDF içe aktarma işi. declaration_bulk_import yüklenen
+    dosyaları ImportJobFile olarak yazar, `run_import_worker` management
+    command'ı parse edip taslakları oluşturur.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Wartend'),
+        (STATUS_RUNNING, 'In Bearbeitung'),
+        (STATUS_DONE, 'Fertig'),
+        (STATUS_FAILED, 'Fehlgeschlagen'),
+    ]
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+    praxis = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="Status")
+    # Dosya başına sonuç (ImportResult.as_dict), iş bitince yazılır
+    results = models.JSONField(default=list, blank=True)
+
+    # Retry bilgileri
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Versuche")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Max. Versuche")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Ausführen ab")
+    last_error = models.TextField(blank=True, verbose_name="Letzter Fehler")
+
+    # Worker kilidi
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Import Job'
+        verbose_name_plural = 'Import Jobs'
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='importjob_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"Import Job #{self.pk} - {self.praxis.username} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+
+class ImportJobFile(models.Model):
+    """İçe aktarılmayı bekleyen yüklenmiş PDF / ZIP (iş bitince silinir)"""
+
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='files')
+    position = models.PositiveIntegerField()
+    file_name = models.CharField(max_length=500)
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['job', 'position']
+        verbose_name = 'Import-Datei'
+        verbose_name_plural = 'Import-Dateien'
+
+    def __str__(self):
+        return self.file_name
+
+
 # Signals - Kullanıcı oluşturulduğunda otomatik profil oluştur
 @receiver(post_save, sender=User)
 def create_hersteller_profile(sender, instance, created, **kwargs):
@@ -225,3 +477,19 @@ def save_hersteller_profile(sender, instance, **kwargs):
     """Kullanıcı kaydedildiğinde profili de kaydet"""
     if not instance.is_superuser and hasattr(instance, 'hersteller_profile'):
         instance.hersteller_profile.save()
+
+
+@receiver(post_save, sender=HerstellerProfile)
+@receiver(post_delete, sender=HerstellerProfile)
+def invalidate_hersteller_profile_cache(sender, instance, **kwargs):
+    """Profil değişince kullanıcı bazındaki profil cache'ini temizle"""
+    from .services.profile_cache import invalidate_profile
+    invalidate_profile(instance.user_id)
+
+
+@receiver(post_save, sender=MaterialProduct)
+@receiver(post_delete, sender=MaterialProduct)
+def invalidate_material_catalog_cache(sender, instance, **kwargs):
+    """Ürün eklenince / değişince / silinince kullanıcının katalog cache'ini temizle"""
+    from .services.material_catalog import invalidate_material_catalog
+    invalidate_material_catalog(instance.user_id)
@@ -0,0 +1,159 @@
+"""
+Zahnovia Keyset (Cursor) Pagination
+OFFSET yerine son görülen satırın sıralama anahtarından devam edilir; sayfa
+maliyeti geçmişin büyüklüğünden bağımsızdır ve araya yeni kayıt eklense de
+sayfa linkleri aynı satırları gösterir.
+
+Tüm anahtarlar azalan (DESC) sıralanır; NULL değerler en sona gelir.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import F, Q
+
+MAX_PAGE_SIZE = 200
+
+
+def get_page_size(request, setting_name='LIST_PAGE_SIZE', default=50):
+    """Sayfa boyutu: ?page_size=... veya settings'teki değer (1..MAX_PAGE_SIZE)"""
+    page_size = getattr(settings, setting_name, default)
+    try:
+        page_size = int(request.GET.get('page_size', page_size))
+    except (TypeError, ValueError):
+        pass
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def _encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor, fields):
+    """Cursor'ı model alanlarına göre Python değerlerine çevir (geçersizse None)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        return None
+
+
+def _keyset_filter(keys, fields, values, forward):
+    """
+    (k1, k2, ...) sıralamasında cursor'dan sonraki (forward) veya önceki
+    satırlar için WHERE koşulu:
+        k1 < v1 OR (k1 = v1 AND k2 < v2) OR ...
+    """
+    condition = Q(pk__in=[])
+    equal = Q()
+    for key, field, value in zip(keys, fields, values):
+        if forward:
+            # DESC + NULLS LAST: değerden küçükler ve NULL'lar sonra gelir
+            if value is None:
+                step = Q(pk__in=[])
+            else:
+                step = Q(**{f'{key}__lt': value})
+                if field.null:
+                    step |= Q(**{f'{key}__isnull': True})
+        else:
+            if value is None:
+                step = Q(**{f'{key}__isnull': False})
+            else:
+                step = Q(**{f'{key}__gt': value})
+        condition |= equal & step
+        equal &= Q(**{f'{key}__isnull': True}) if value is None else Q(**{key: value})
+    return condition
+
+
+class KeysetPage:
+    """Bir sayfa satır ve önceki / sonraki sayfa linkleri"""
+
+    def __init__(self, items, request, next_cursor=None, previous_cursor=None):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._request = request
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _query(self, param, cursor):
+        params = self._request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[param] = cursor
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query('after', self.next_cursor) if self.has_next else ''
+
+    @property
+    def previous_query(self):
+        return self._query('before', self.previous_cursor) if self.has_previous else ''
+
+
+def keyset_paginate(request, queryset, keys, page_size):
+    """
+    Queryset'i ?after=<cursor> / ?before=<cursor> parametrelerine göre sayfala
+
+    Args:
+        request: HttpRequest
+        queryset: Filtrelenmiş (sıralanmamış) queryset
+        keys: Azalan sıralama anahtarları, benzersiz olmalı (son anahtar 'id' olmalı)
+        page_size: Sayfa başına satır
+
+    Returns:
+        KeysetPage
+    """
+    model = queryset.model
+    fields = [model._meta.pk if key in ('id', 'pk') else model._meta.get_field(key) for key in keys]
+    desc_order = [F(key).desc(nulls_last=True) for key in keys]
+    asc_order = [F(key).asc(nulls_first=True) for key in keys]
+
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    values = _decode_cursor(after or before or '', fields) if (after or before) else None
+    forward = not (before and not after)
+
+    if values is None:
+        # İlk sayfa
+        rows = list(queryset.order_by(*desc_order)[:page_size + 1])
+        has_more, has_less = len(rows) > page_size, False
+        rows = rows[:page_size]
+    elif forward:
+        rows = list(queryset.filter(_keyset_filter(keys, fields, values, True)).order_by(*desc_order)[:page_size + 1])
+        has_more, has_less = len(rows) > page_size, True
+        rows = rows[:page_size]
+    else:
+        rows = list(queryset.filter(_keyset_filter(keys, fields, values, False)).order_by(*asc_order)[:page_size + 1])
+        has_more, has_less = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+
+    def cursor_for(obj):
+        return _encode_cursor([getattr(obj, field.attname) for field in fields])
+
+    return KeysetPage(
+        rows,
+        request,
+        next_cursor=cursor_for(rows[-1]) if rows and has_more else None,
+        previous_cursor=cursor_for(rows[0]) if rows and has_less else None,
+    )
@@ -0,0 +1,394 @@
+"""
+Zahnovia Toplu Referans PDF İçe Aktarma
+Çok sayıda referans PDF'ten (tek tek veya ZIP içinde) taslak declaration
+oluşturur; arka plan import işi (bkz. import_queue) ve `import_reference_pdfs`
+management command'ı kullanır.
+
+- PDF'ler paralel parse edilir: her dosya parse_declaration_pdf'ten geçer,
+  parse işi parser havuzunun worker process'lerine dağılır (bkz. parse_worker).
+- Taslaklar (is_draft) numarasız oluşturulur ve PDF'leri render edilmez;
+  listelerde görünmezler. Declaration, ProductWork ve DeclarationItem
+  satırları ilişki başına tek bir bulk_create ile yazılır.
+- finalize_drafts taslakları toplu tamamlar: numaralar tek bir
+  DeclarationCounter.allocate() ile ayrılır, PdfJob'lar tek partide kuyruğa girer.
+"""
+import hashlib
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Declaration, DeclarationCounter, DeclarationItem, PdfJob, ProductWork
+from .line_items import ITEM_FIELDS, PRODUCT_WORK_FIELDS
+from .material_catalog import get_material_catalog
+
+logger = logging.getLogger(__name__)
+
+STATUS_CREATED = 'created'
+STATUS_DUPLICATE = 'duplicate'
+STATUS_ERROR = 'error'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ImportResult:
+    """Tek bir dosyanın içe aktarma sonucu"""
+
+    __slots__ = ('file_name', 'status', 'message', 'declaration')
+
+    def __init__(self, file_name, status=None, message='', declaration=None):
+        self.file_name = file_name
+        self.status = status
+        self.message = message
+        self.declaration = declaration
+
+    def as_dict(self):
+        return {
+            'file': self.file_name,
+            'status': self.status,
+            'message': self.message,
+            'declaration_id': self.declaration.pk if self.declaration else None,
+            'patient_name': self.declaration.patient_name if self.declaration else '',
+        }
+
+
+def _is_pdf_name(name):
+    return name.lower().endswith('.pdf')
+
+
+def _file_size(fileobj):
+    """UploadedFile.size, diskteki dosya için fstat boyutu, yoksa seek ile ölçülen boyut"""
+    size = getattr(fileobj, 'size', None)
+    if size is None:
+        try:
+            size = os.fstat(fileobj.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            try:
+                position = fileobj.tell()
+                size = fileobj.seek(0, os.SEEK_END) - position
+                fileobj.seek(position)
+            except (AttributeError, OSError, ValueError):
+                size = 0
+    return size
+
+
+def collect_pdf_files(files):
+    """
+    Yüklenen dosyaları (PDF veya ZIP) içe aktarılacak PDF'lere aç.
+
+    ZIP içindeki klasörler, PDF olmayan dosyalar ve macOS meta dosyaları
+    atlanır. Toplam PDF sayısı BULK_IMPORT_MAX_FILES, tek PDF boyutu
+    PDF_PARSE_MAX_FILE_BYTES, belleğe okunan toplam boyut
+    BULK_IMPORT_MAX_TOTAL_BYTES ile sınırlıdır; sınırı aşan dosyalar okunmadan
+    STATUS_ERROR ile reddedilir.
+
+    Args:
+        files: (isim, dosya objesi) çiftleri
+
+    Returns:
+        (pdfs, results): pdfs = [(isim, bytes), ...]; results = açılamayan /
+        reddedilen dosyaların ImportResult'ları
+    """
+    max_files = _setting('BULK_IMPORT_MAX_FILES', 100)
+    max_bytes = _setting('PDF_PARSE_MAX_FILE_BYTES', 20 * 1024 * 1024)
+    max_total_bytes = _setting('BULK_IMPORT_MAX_TOTAL_BYTES', 200 * 1024 * 1024)
+    total_error = f'Gesamtgröße des Imports überschritten (max. {max_total_bytes // (1024 * 1024)} MB pro Import)'
+    pdfs, results = [], []
+    total_bytes = 0
+
+    def add(name, size, read):
+        nonlocal total_bytes
+        if len(pdfs) >= max_files:
+            results.append(ImportResult(name, STATUS_ERROR, f'Zu viele Dateien (max. {max_files} pro Import)'))
+        elif max_bytes and size > max_bytes:
+            results.append(ImportResult(name, STATUS_ERROR, 'Die PDF-Datei ist zu groß'))
+        elif max_total_bytes and total_bytes + size > max_total_bytes:
+            results.append(ImportResult(name, STATUS_ERROR, total_error))
+        else:
+            data = read()
+            # Bildirilen boyut yanlış olabilir: okunan gerçek boyut sayılır
+            if max_total_bytes and total_bytes + len(data) > max_total_bytes:
+                results.append(ImportResult(name, STATUS_ERROR, total_error))
+                return
+            total_bytes += len(data)
+            pdfs.append((name, data))
+
+    for name, fileobj in files:
+        if _is_pdf_name(name):
+            add(name, _file_size(fileobj), fileobj.read)
+        elif name.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(fileobj) as archive:
+                    for info in archive.infolist():
+                        member = info.filename
+                        if info.is_dir() or not _is_pdf_name(member) or member.startswith('__MACOSX/'):
+                            continue
+                        # Boyut ZIP başlığından kontrol edilir: sınırı aşan dosya açılmaz
+                        add(f'{name}/{member}', info.file_size, lambda info=info: archive.read(info))
+            except (zipfile.BadZipFile, NotImplementedError, RuntimeError, OSError) as e:
+                # Bozuk, şifreli veya desteklenmeyen sıkıştırma
+                results.append(ImportResult(name, STATUS_ERROR, f'ZIP-Datei konnte nicht gelesen werden: {e}'))
+        else:
+            results.append(ImportResult(name, STATUS_ERROR, 'Nur PDF- oder ZIP-Dateien sind erlaubt'))
+    return pdfs, results
+
+
+def _parse_one(name, data):
+    from ..utils import parse_declaration_pdf
+    return parse_declaration_pdf(SimpleUploadedFile(os.path.basename(name), data, content_type='application/pdf'))
+
+
+def parse_pdfs(pdfs):
+    """
+    PDF'leri paralel parse et.
+
+    Thread'ler sadece işi parser havuzuna iletir; asıl parse worker
+    process'lerinde (CPU çekirdekleri arasında) yapılır. Havuz kapalıysa
+    (PDF_PARSE_POOL_SIZE=0) parse bu process'te sırayla yapılır.
+
+    Returns:
+        list: pdfs ile aynı sırada parse sonuçları (dict)
+    """
+    workers = _setting('PDF_PARSE_POOL_SIZE', 2)
+    if workers <= 0 or len(pdfs) <= 1:
+        return [_parse_one(name, data) for name, data in pdfs]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-parse') as executor:
+        return list(executor.map(lambda pdf: _parse_one(*pdf), pdfs))
+
+
+def _clip(model, field, value):
+    """Değeri model alanının max_length'ine kısalt"""
+    max_length = model._meta.get_field(field).max_length
+    value = (value or '').strip()
+    return value[:max_length] if max_length else value
+
+
+def _parse_date(value):
+    if value:
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    # declaration_create ile aynı: tarih yoksa bugün
+    return date.today()
+
+
+def _item_row(material, catalog):
+    """
+    Parse edilen materyali DeclarationItem satırına çevir (declaration_create
+    formundaki JS ile aynı kurallar: katalogda eşleşen ürünün bestandteile'si
+    kullanılır, CE 'yes' -> 'Ja')
+    """
+    row = {field: material.get(field) or '' for field in ITEM_FIELDS}
+    product = catalog.get((row['material'], row['firma']))
+    if product is not None:
+        row['bestandteile'] = product.bestandteile
+    if row['ce_status']:
+        row['ce_status'] = 'Ja' if row['ce_status'] == 'yes' else 'Nein'
+    else:
+        row['ce_status'] = 'Ja'
+    return {field: _clip(DeclarationItem, field, value) for field, value in row.items()}
+
+
+def _product_work_row(work):
+    return {
+        field: _clip(ProductWork, field, work.get(field))
+        for field in PRODUCT_WORK_FIELDS
+    }
+
+
+def create_drafts(praxis, entries):
+    """
+    Parse sonuçlarından taslak declaration'ları toplu oluştur.
+
+    Taslaklar numarasızdır ve PdfJob'ları yoktur; numara ve PDF
+    finalize_drafts ile verilir.
+
+    Args:
+        praxis: User instance
+        entries: [(ImportResult, parse sonucu), ...] - sadece geçerli sonuçlar
+
+    Returns:
+        list: Oluşturulan Declaration'lar (entries ile aynı sırada)
+    """
+    if not entries:
+        return []
+
+    catalog = {(p.material, p.firma): p for p in get_material_catalog(praxis.pk)}
+
+    with transaction.atomic():
+        declarations = [
+            Declaration(
+                praxis=praxis,
+                is_draft=True,
+                auftragsnummer=_clip(Declaration, 'auftragsnummer', parsed.get('auftragsnummer')),
+                patient_name=_clip(Declaration, 'patient_name', parsed.get('patient_name')),
+                herstellungsdatum=_parse_date(parsed.get('herstellungsdatum')),
+            )
+            for _, parsed in entries
+        ]
+        Declaration.objects.bulk_create(declarations)
+
+        product_works, items = [], []
+        for declaration, (_, parsed) in zip(declarations, entries):
+            for line_number, work in enumerate(parsed.get('product_works') or [], start=1):
+                product_works.append(ProductWork(declaration=declaration, line_number=line_number, **_product_work_row(work)))
+            for line_number, material in enumerate(parsed.get('materials') or [], start=1):
+                items.append(DeclarationItem(declaration=declaration, line_number=line_number, **_item_row(material, catalog)))
+        ProductWork.objects.bulk_create(product_works)
+        DeclarationItem.objects.bulk_create(items)
+
+    for declaration, (result, _) in zip(declarations, entries):
+        result.status = STATUS_CREATED
+        result.declaration = declaration
+    return declarations
+
+
+def finalize_drafts(praxis, pks):
+    """
+    Taslakları toplu tamamla: numara ver ve PDF'lerini tek partide kuyruğa al.
+
+    Auftragsnummer'ı olmayan taslaklar (declaration_create ile aynı kural)
+    ve zaten tamamlanmış kayıtlar atlanır. Numaralar oluşturulma sırasıyla
+    tek bir DeclarationCounter.allocate() ile ayrılır; PdfJob'lar tek bir
+    bulk_create ile yazılır.
+
+    Args:
+        praxis: User instance
+        pks: Tamamlanacak taslakların id'leri
+
+    Returns:
+        list: Tamamlanan Declaration'lar
+    """
+    with transaction.atomic():
+        # select_for_update: aynı taslak eşzamanlı iki istekte iki numara almaz
+        drafts = list(
+            Declaration.objects.select_for_update()
+            .filter(praxis=praxis, pk__in=pks, is_draft=True)
+            .exclude(auftragsnummer='')
+            .order_by('created_at', 'id')
+        )
+        if not drafts:
+            return []
+
+        year, first_value = DeclarationCounter.allocate(praxis, count=len(drafts))
+        now = timezone.now()
+        for index, declaration in enumerate(drafts):
+            declaration.declaration_number = DeclarationCounter.format_number(year, first_value + index)
+            declaration.is_draft = False
+            declaration.updated_at = now
+        Declaration.objects.bulk_update(drafts, ['declaration_number', 'is_draft', 'updated_at'])
+
+        max_attempts = _setting('PDF_JOB_MAX_ATTEMPTS', 5)
+        PdfJob.objects.bulk_create([
+            PdfJob(declaration=declaration, max_attempts=max_attempts)
+            for declaration in drafts
+        ])
+
+    logger.info('Drafts finalized: praxis=%s count=%d', praxis.pk, len(drafts))
+    return drafts
+
+
+def prepare_import(praxis, files):
+    """
+    İçe aktarılacak dosyaları aç, parse et ve tekrarları ele.
+
+    Aynı içerikteki PDF'ler ve praxis'te zaten var olan Auftragsnummer'lar
+    atlanır (STATUS_DUPLICATE). Parse edilemeyen veya hasta adı bulunamayan
+    dosyalar diğerlerini etkilemez (STATUS_ERROR). DB'ye yazmaz.
+
+    Args:
+        praxis: User instance
+        files: (isim, dosya objesi) çiftleri
+
+    Returns:
+        (results, entries): results = dosya başına ImportResult (önce açılamayan
+        dosyalar, sonra PDF'ler yükleme sırasıyla); entries = create_drafts'a
+        verilecek [(ImportResult, parse sonucu), ...]
+    """
+    pdfs, rejected = collect_pdf_files(files)
+
+    results, unique_pdfs, seen_hashes = [], [], {}
+    for name, data in pdfs:
+        result = ImportResult(name)
+        results.append(result)
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in seen_hashes:
+            result.status = STATUS_DUPLICATE
+            result.message = f'Gleicher Inhalt wie {seen_hashes[digest]}'
+            continue
+        seen_hashes[digest] = name
+        unique_pdfs.append((result, name, data))
+
+    parsed_list = parse_pdfs([(name, data) for _, name, data in unique_pdfs])
+
+    entries, seen_auftrag = [], {}
+    for (result, name, _), parsed in zip(unique_pdfs, parsed_list):
+        if 'error' in parsed:
+            result.status = STATUS_ERROR
+            result.message = parsed['error']
+        elif not parsed.get('patient_name'):
+            result.status = STATUS_ERROR
+            result.message = 'Patientenname wurde in der PDF-Datei nicht gefunden'
+        elif parsed.get('auftragsnummer') and parsed['auftragsnummer'] in seen_auftrag:
+            result.status = STATUS_DUPLICATE
+            result.message = f"Auftragsnummer {parsed['auftragsnummer']} bereits in {seen_auftrag[parsed['auftragsnummer']]}"
+        else:
+            if parsed.get('auftragsnummer'):
+                seen_auftrag[parsed['auftragsnummer']] = name
+            entries.append((result, parsed))
+
+    # Bu praxis'te zaten var olan Auftragsnummer'lar (tek sorgu)
+    existing = set(
+        Declaration.objects.filter(
+            praxis=praxis,
+            auftragsnummer__in=[parsed['auftragsnummer'] for _, parsed in entries if parsed.get('auftragsnummer')],
+        ).values_list('auftragsnummer', flat=True)
+    )
+    new_entries = []
+    for result, parsed in entries:
+        if parsed.get('auftragsnummer') in existing:
+            result.status = STATUS_DUPLICATE
+            result.message = f"Auftragsnummer {parsed['auftragsnummer']} ist bereits vorhanden"
+        else:
+            new_entries.append((result, parsed))
+
+    return rejected + results, new_entries
+
+
+def log_results(results):
+    logger.info(
+        'Bulk import: files=%d created=%d duplicate=%d error=%d',
+        len(results),
+        sum(r.status == STATUS_CREATED for r in results),
+        sum(r.status == STATUS_DUPLICATE for r in results),
+        sum(r.status == STATUS_ERROR for r in results),
+    )
+
+
+def import_reference_pdfs(praxis, files):
+    """
+    Referans PDF'leri (veya PDF içeren ZIP'leri) taslak declaration olarak içe aktar.
+
+    Web'den yüklenen dosyalar arka planda import_queue ile işlenir; bu
+    fonksiyon aynı işi senkron yapar (management command).
+
+    Args:
+        praxis: User instance
+        files: (isim, dosya objesi) çiftleri
+
+    Returns:
+        list: Dosya başına ImportResult (bkz. prepare_import)
+    """
+    results, entries = prepare_import(praxis, files)
+    create_drafts(praxis, entries)
+    log_results(results)
+    return results
@@ -0,0 +1,255 @@
+"""
+Zahnovia Email Outbox
+Email'ler önce OutboundEmail tablosuna yazılır, `run_email_worker` management
+command'ı gönderir. Böylece view'lar Gmail API'yi beklemez ve Gmail
+erişilemezken email kaybolmaz.
+
+- Hata alan email üstel beklemeyle tekrar denenir; max_attempts aşılınca
+  'dead' olarak işaretlenir (admin'den tekrar kuyruğa alınabilir).
+- idempotency_key aynı email'in iki kez kuyruğa girmesini engeller.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_email(subject, message, recipient_list, html_message=None, idempotency_key=None, from_email=None):
+    """
+    Email'i outbox'a ekle.
+
+    Args:
+        subject: Konu
+        message: Düz metin içerik
+        recipient_list: Alıcı listesi
+        html_message: HTML içerik (opsiyonel)
+        idempotency_key: Aynı anahtarla ikinci çağrı yeni email oluşturmaz
+                         (None ise her çağrı yeni bir email'dir)
+        from_email: Gönderen (varsayılan: settings.DEFAULT_FROM_EMAIL)
+
+    Returns:
+        (OutboundEmail, created)
+    """
+    if idempotency_key:
+        existing = OutboundEmail.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing, False
+    else:
+        idempotency_key = f"auto:{os.urandom(16).hex()}"
+
+    try:
+        with transaction.atomic():
+            email = OutboundEmail.objects.create(
+                idempotency_key=idempotency_key,
+                from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+                recipients=list(recipient_list),
+                subject=subject,
+                body=message or '',
+                html_body=html_message or '',
+                max_attempts=_setting('EMAIL_MAX_ATTEMPTS', 8),
+            )
+        return email, True
+    except IntegrityError:
+        # Aynı anahtar paralel bir istekte oluşturuldu
+        return OutboundEmail.objects.get(idempotency_key=idempotency_key), False
+
+
+def requeue_stale_emails():
+    """
+    Kilit süresi dolmuş (worker çökmüş) email'leri tekrar kuyruğa al.
+
+    Returns:
+        int: Kuyruğa geri alınan email sayısı
+    """
+    timeout = _setting('EMAIL_LOCK_TIMEOUT', 300)
+    stale_before = timezone.now() - timedelta(seconds=timeout)
+    return OutboundEmail.objects.filter(
+        status=OutboundEmail.STATUS_SENDING,
+        locked_at__lt=stale_before
+    ).update(status=OutboundEmail.STATUS_PENDING, locked_by='', locked_at=None)
+
+
+def claim_emails(worker_id, limit=20):
+    """
+    Gönderilmeye hazır email'leri bu worker için kilitle.
+
+    PDF kuyruğundaki gibi koşullu UPDATE ile iyimser kilitleme yapılır
+    (bkz. pdf_queue.claim_next_job).
+
+    Returns:
+        list: OutboundEmail instance'ları
+    """
+    now = timezone.now()
+    candidates = list(
+        OutboundEmail.objects.filter(
+            status=OutboundEmail.STATUS_PENDING,
+            run_after__lte=now,
+        ).order_by('run_after', 'created_at').values_list('pk', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+
+    claimed = []
+    for email_id in candidates:
+        updated = OutboundEmail.objects.filter(pk=email_id, status=OutboundEmail.STATUS_PENDING).update(
+            status=OutboundEmail.STATUS_SENDING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if updated:
+            claimed.append(email_id)
+    return list(OutboundEmail.objects.filter(pk__in=claimed, locked_by=worker_id).order_by('created_at'))
+
+
+def _retry_delay(attempts):
+    """Üstel bekleme: 30s, 60s, 120s, ... (en fazla 1 saat)"""
+    base = _setting('EMAIL_RETRY_DELAY', 30)
+    return min(base * (2 ** max(attempts - 1, 0)), 3600)
+
+
+def _build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or None,
+        to=email.recipients,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _mark_sent(email):
+    now = timezone.now()
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status=OutboundEmail.STATUS_SENT,
+        last_error='',
+        locked_by='',
+        locked_at=None,
+        sent_at=now,
+        updated_at=now,
+    )
+
+
+def _mark_failed(email, error):
+    now = timezone.now()
+    last_error = f"{type(error).__name__}: {error}"[:5000]
+
+    if email.attempts < email.max_attempts:
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=OutboundEmail.STATUS_PENDING,
+            run_after=now + timedelta(seconds=_retry_delay(email.attempts)),
+            last_error=last_error,
+            locked_by='',
+            locked_at=None,
+            updated_at=now,
+        )
+    else:
+        # Dead letter: otomatik olarak tekrar denenmez
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=OutboundEmail.STATUS_DEAD,
+            last_error=last_error,
+            locked_by='',
+            locked_at=None,
+            updated_at=now,
+        )
+        logger.error('Email #%s dead-lettered after %d attempts: %s', email.pk, email.attempts, last_error)
+
+
+def send_emails(emails):
+    """
+    Kilitlenmiş email'leri tek bir backend bağlantısı üzerinden gönder.
+
+    Returns:
+        int: Başarıyla gönderilen email sayısı
+    """
+    if not emails:
+        return 0
+    try:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+    except Exception as e:
+        logger.exception('Email backend could not be opened')
+        for email in emails:
+            _mark_failed(email, e)
+        return 0
+
+    sent = 0
+    try:
+        for email in emails:
+            try:
+                if connection.send_messages([_build_message(email, connection)]):
+                    _mark_sent(email)
+                    sent += 1
+                else:
+                    _mark_failed(email, RuntimeError('Backend hat die E-Mail nicht gesendet'))
+            except Exception as e:
+                logger.warning('Email #%s could not be sent: %s', email.pk, e)
+                _mark_failed(email, e)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+    return sent
+
+
+def requeue_dead_emails(queryset):
+    """Dead-letter email'leri yeniden denenmek üzere kuyruğa al (admin action)"""
+    return queryset.filter(status=OutboundEmail.STATUS_DEAD).update(
+        status=OutboundEmail.STATUS_PENDING,
+        attempts=0,
+        run_after=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+def run_worker(poll_interval=None, batch_size=None, once=False, stop_event=None):
+    """
+    Email worker döngüsü.
+
+    Args:
+        poll_interval: Kuyruk boşken bekleme süresi (saniye)
+        batch_size: Tek seferde kilitlenen en fazla email
+        once: True ise kuyruk boşalınca çık
+        stop_event: threading.Event - set edilince worker durur
+
+    Returns:
+        int: Gönderilen email sayısı
+    """
+    poll_interval = poll_interval if poll_interval is not None else _setting('EMAIL_WORKER_POLL_INTERVAL', 5)
+    batch_size = batch_size or _setting('EMAIL_WORKER_BATCH_SIZE', 20)
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    sent = 0
+    requeue_stale_emails()
+    while not stop_event.is_set():
+        close_old_connections()
+        emails = claim_emails(worker_id, batch_size)
+        if not emails:
+            if once:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        sent += send_emails(emails)
+    close_old_connections()
+    return sent
@@ -1,30 +1,46 @@
 """
 Zahnovia Email Servisi
-Kayıt doğrulama ve şifre sıfırlama emailleri için
+Kayıt doğrulama ve şifre sıfırlama emailleri için.
+
+Email'ler doğrudan gönderilmez, outbox'a yazılır (bkz. email_outbox);
+`run_email_worker` management command'ı çalışıyor olmalıdır.
 """
-from django.core.mail import send_mail, EmailMessage
-from django.template.loader import render_to_string
+import hashlib
+import logging
+import time
+
 from django.conf import settings
 
+from .email_outbox import enqueue_email
+
+logger = logging.getLogger(__name__)
+
 
 class EmailService:
     """Base email service"""
 
     @staticmethod
-    def send_email(subject, message, recipient_list, html_message=None):
-        """Send email with optional HTML content"""
+    def send_email(subject, message, recipient_list, html_message=None, idempotency_key=None):
+        """
+        Email'i gönderilmek üzere outbox'a ekle
+
+        Args:
+            idempotency_key: Aynı anahtarla tekrar çağrılırsa email ikinci kez kuyruğa girmez
+
+        Returns:
+            bool: Kuyruğa eklendiyse (veya zaten kuyruktaysa) True
+        """
         try:
-            send_mail(
+            enqueue_email(
                 subject=subject,
                 message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=recipient_list,
                 html_message=html_message,
-                fail_silently=False,
+                idempotency_key=idempotency_key,
             )
             return True
-        except Exception as e:
-            print(f"Email gönderme hatası: {str(e)}")
+        except Exception:
+            logger.exception('Email kuyruğa eklenemedi')
             return False
 
 
@@ -97,7 +113,8 @@ Ihr Zahnovia Team
             subject=subject,
             message=message,
             recipient_list=[user.email],
-            html_message=html_message
+            html_message=html_message,
+            idempotency_key=f"verify-email:{user.pk}:{profile.verification_token}"
         )
 
     @staticmethod
@@ -120,7 +137,8 @@ Registrierungsdatum: {user.date_joined.strftime('%d.%m.%Y %H:%M')}
         return EmailService.send_email(
             subject=subject,
             message=message,
-            recipient_list=[admin_email]
+            recipient_list=[admin_email],
+            idempotency_key=f"admin-registration:{user.pk}"
         )
 
 
@@ -198,5 +216,23 @@ Ihr Zahnovia Team
             subject=subject,
             message=message,
             recipient_list=[user.email],
-            html_message=html_message
+            html_message=html_message,
+            idempotency_key=PasswordResetEmailService.idempotency_key(user)
         )
+
+    @staticmethod
+    def idempotency_key(user, now=None):
+        """
+        Şifre sıfırlama email'inin outbox anahtarı
+
+        reset_url kullanılamaz: token içinde saniye cinsinden zaman damgası
+        vardır, formun her gönderilişinde değişir. Anahtar bunun yerine
+        kullanıcının durumundan (şifre hash'i, son giriş) ve bir zaman
+        aralığından (PASSWORD_RESET_EMAIL_WINDOW) üretilir: aralık içindeki
+        tekrar istekler yeni email oluşturmaz; şifre değişince veya aralık
+        dolunca yeni bir email gönderilebilir.
+        """
+        window = max(1, getattr(settings, 'PASSWORD_RESET_EMAIL_WINDOW', 3600))
+        bucket = int((now if now is not None else time.time()) // window)
+        state = f"{user.password}:{user.last_login.isoformat() if user.last_login else ''}:{bucket}"
+        return f"password-reset:{user.pk}:{hashlib.sha256(state.encode('utf-8')).hexdigest()}"
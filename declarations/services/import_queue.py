@@ -0,0 +1,218 @@
+"""
+Zahnovia Import Kuyruğu
+Web'den yüklenen referans PDF'ler (veya ZIP'ler) request içinde parse
+edilmez: declaration_bulk_import dosyaları ImportJob / ImportJobFile olarak
+yazar, `run_import_worker` management command'ı parse edip taslakları
+oluşturur ve dosya başına sonuçları ImportJob.results'a yazar.
+
+- Taslaklar ve işin 'done' durumu tek transaction'da yazılır: worker iş
+  ortasında çökerse iş tekrar çalıştırılır, yarım import kalmaz.
+- Hata alan iş (ör. DB hatası) üstel beklemeyle tekrar denenir; dosya başına
+  parse hataları işi başarısız yapmaz, sonuçlarda listelenir.
+"""
+import io
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import ImportJob, ImportJobFile
+from .bulk_import import create_drafts, log_results, prepare_import
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_import(praxis, files):
+    """
+    Yüklenen dosyaları içe aktarma işi olarak kuyruğa ekle.
+
+    Dosyalar tek tek okunup yazılır: bellekte aynı anda tek dosya tutulur.
+
+    Args:
+        praxis: User instance
+        files: (isim, dosya objesi) çiftleri
+
+    Returns:
+        ImportJob instance
+    """
+    with transaction.atomic():
+        job = ImportJob.objects.create(
+            praxis=praxis,
+            max_attempts=_setting('IMPORT_JOB_MAX_ATTEMPTS', 3),
+        )
+        for position, (name, fileobj) in enumerate(files):
+            ImportJobFile.objects.create(job=job, position=position, file_name=name[:500], data=fileobj.read())
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Kilit süresi dolmuş (worker çökmüş) işleri tekrar kuyruğa al.
+
+    Returns:
+        int: Kuyruğa geri alınan iş sayısı
+    """
+    timeout = _setting('IMPORT_JOB_LOCK_TIMEOUT', 1800)
+    stale_before = timezone.now() - timedelta(seconds=timeout)
+    return ImportJob.objects.filter(
+        status=ImportJob.STATUS_RUNNING,
+        locked_at__lt=stale_before
+    ).update(status=ImportJob.STATUS_PENDING, locked_by='', locked_at=None)
+
+
+def claim_next_job(worker_id):
+    """
+    Sıradaki uygun işi bu worker için kilitle (koşullu UPDATE ile iyimser
+    kilitleme, bkz. pdf_queue.claim_next_job).
+
+    Returns:
+        ImportJob veya None
+    """
+    now = timezone.now()
+    candidates = ImportJob.objects.filter(
+        status=ImportJob.STATUS_PENDING,
+        run_after__lte=now
+    ).order_by('run_after', 'created_at').values_list('pk', flat=True)[:10]
+
+    for job_id in candidates:
+        claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_PENDING).update(
+            status=ImportJob.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return ImportJob.objects.select_related('praxis').get(pk=job_id)
+    return None
+
+
+def _retry_delay(attempts):
+    """Üstel bekleme: 30s, 60s, 120s, ... (en fazla 1 saat)"""
+    base = _setting('IMPORT_JOB_RETRY_DELAY', 30)
+    return min(base * (2 ** max(attempts - 1, 0)), 3600)
+
+
+def run_job(job):
+    """
+    Tek bir içe aktarma işini çalıştır: dosyaları parse et, taslakları oluştur.
+
+    Returns:
+        bool: Başarılı ise True
+    """
+    try:
+        files = [
+            (upload.file_name, io.BytesIO(bytes(upload.data)))
+            for upload in ImportJobFile.objects.filter(job=job).order_by('position')
+        ]
+        results, entries = prepare_import(job.praxis, files)
+        with transaction.atomic():
+            create_drafts(job.praxis, entries)
+            _mark_done(job, results)
+    except Exception as e:
+        _mark_failed(job, e)
+        return False
+
+    log_results(results)
+    return True
+
+
+def _mark_done(job, results):
+    now = timezone.now()
+    # Sadece iş hâlâ bu worker'daysa: kilit süresi dolup iş başka worker'a
+    # geçtiyse taslaklar geri alınır (aynı dosyalar iki kez içe aktarılmaz)
+    updated = ImportJob.objects.filter(
+        pk=job.pk, status=ImportJob.STATUS_RUNNING, locked_by=job.locked_by
+    ).update(
+        status=ImportJob.STATUS_DONE,
+        results=[result.as_dict() for result in results],
+        last_error='',
+        locked_by='',
+        locked_at=None,
+        finished_at=now,
+        updated_at=now,
+    )
+    if not updated:
+        raise RuntimeError('Import-Job wurde von einem anderen Worker übernommen')
+    ImportJobFile.objects.filter(job=job).delete()
+
+
+def _mark_failed(job, error):
+    job.refresh_from_db(fields=['attempts', 'max_attempts'])
+    now = timezone.now()
+    last_error = f"{error}\n{traceback.format_exc()}"[:5000]
+    logger.warning('Import Job #%s failed (attempt %d): %s', job.pk, job.attempts, error)
+
+    if job.attempts < job.max_attempts:
+        ImportJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            status=ImportJob.STATUS_PENDING,
+            run_after=now + timedelta(seconds=_retry_delay(job.attempts)),
+            last_error=last_error,
+            locked_by='',
+            locked_at=None,
+            updated_at=now,
+        )
+    else:
+        with transaction.atomic():
+            ImportJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+                status=ImportJob.STATUS_FAILED,
+                last_error=last_error,
+                locked_by='',
+                locked_at=None,
+                finished_at=now,
+                updated_at=now,
+            )
+            ImportJobFile.objects.filter(job=job).delete()
+
+
+def run_worker(poll_interval=None, once=False, stop_event=None):
+    """
+    Import worker döngüsü. İşler sırayla çalışır; bir işin PDF'leri parser
+    havuzunda paralel parse edilir (bkz. bulk_import.parse_pdfs).
+
+    Args:
+        poll_interval: Kuyruk boşken bekleme süresi (saniye)
+        once: True ise kuyruk boşalınca çık
+        stop_event: threading.Event - set edilince worker durur
+
+    Returns:
+        int: Çalıştırılan iş sayısı
+    """
+    poll_interval = poll_interval if poll_interval is not None else _setting('IMPORT_WORKER_POLL_INTERVAL', 2)
+    stop_event = stop_event or threading.Event()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    processed = 0
+    requeue_stale_jobs()
+    while not stop_event.is_set():
+        try:
+            close_old_connections()
+            job = claim_next_job(worker_id)
+        except Exception:
+            # DB geçici olarak erişilemiyor: worker ölmez, bir sonraki turda tekrar dener
+            logger.exception('Import worker: claim failed')
+            job = None
+        if job is None:
+            if once:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        try:
+            run_job(job)
+        except Exception:
+            # İş failed işaretlenemedi (DB hatası): kilitli kalır, requeue_stale_jobs geri alır
+            logger.exception('Import Job #%s could not be marked failed', job.pk)
+        processed += 1
+    close_old_connections()
+    return processed
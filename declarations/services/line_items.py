@@ -0,0 +1,237 @@
+"""
+Zahnovia Declaration Satırları
+ProductWork ve DeclarationItem satırlarının formset'lerden okunup toplu
+kaydedilmesi. Yeni declaration'da her ilişki için tek bir INSERT yapılır;
+düzenlemede satırlar formset'teki ID'lerine göre mevcut satırlarla eşleştirilir
+ve sadece farklar yazılır (bulk_update / bulk_create / tek DELETE). Böylece
+ortadan bir satır silinse de diğer satırların ID'leri (ve lot izlenebilirliği)
+korunur; line_number sadece güncellenen bir alandır.
+"""
+from ..models import DeclarationItem, ProductWork
+
+HEADER_FIELDS = ['auftragsnummer', 'patient_name', 'herstellungsdatum']
+PRODUCT_WORK_FIELDS = ['produktbezeichnung_arbeit', 'zahnnummer', 'zahnfarbe']
+ITEM_FIELDS = ['material', 'firma', 'bestandteile', 'material_lot_no', 'ce_status']
+
+
+class ChangeSet:
+    """Düzenlemede nelerin değiştiği: declaration alanları ve ilişki bazında satır sayıları"""
+
+    def __init__(self, header_fields=None):
+        self.header_fields = list(header_fields or [])
+        # {'product_works': {'created': [...], 'updated': [...], 'deleted': [...]}, ...} (line_number listeleri)
+        self.relations = {}
+
+    def record(self, relation, created, updated, deleted):
+        self.relations[relation] = {'created': created, 'updated': updated, 'deleted': deleted}
+
+    @property
+    def lines_changed(self):
+        return any(any(changes.values()) for changes in self.relations.values())
+
+    def __bool__(self):
+        return bool(self.header_fields) or self.lines_changed
+
+    def summary(self):
+        parts = []
+        if self.header_fields:
+            parts.append('header=' + ','.join(self.header_fields))
+        for relation, changes in self.relations.items():
+            counts = ' '.join(f"{kind}={len(lines)}" for kind, lines in changes.items() if lines)
+            if counts:
+                parts.append(f"{relation}[{counts}]")
+        return '; '.join(parts) or 'keine Änderungen'
+
+
+def snapshot_header(declaration):
+    """Declaration'ın PDF'e giren alanlarının mevcut değerleri"""
+    return {field: getattr(declaration, field) for field in HEADER_FIELDS}
+
+
+def changed_header_fields(declaration, snapshot):
+    return [field for field in HEADER_FIELDS if getattr(declaration, field) != snapshot[field]]
+
+
+def _hidden_material_values(post):
+    """
+    material / firma değerlerini POST'taki hidden field'lardan al
+
+    Returns:
+        dict: {form_index: {'material': str, 'firma': str}}
+    """
+    material_data = {}
+    for key in post.keys():
+        if key.startswith('materials-') and '-material' in key:
+            try:
+                # materials-0-material -> index: 0, field: material
+                parts = key.split('-')
+                if len(parts) == 3:
+                    index = int(parts[1])
+                    material_data.setdefault(index, {})[parts[2]] = post.get(key, '').strip()
+            except (ValueError, IndexError):
+                continue
+    return material_data
+
+
+def product_work_rows(formset):
+    """
+    Geçerli ProductWork formset'inden kaydedilecek satırlar
+
+    Returns:
+        list: [{'id': 12 | None, 'line_number': 1, 'produktbezeichnung_arbeit': ..., ...}, ...]
+    """
+    rows = []
+    for form in formset.forms:
+        data = form.cleaned_data
+        # DELETE checkbox işaretliyse atla
+        if data.get('DELETE'):
+            continue
+        # En azından produktbezeichnung olmalı
+        if not data.get('produktbezeichnung_arbeit'):
+            continue
+        row = {field: data.get(field) or '' for field in PRODUCT_WORK_FIELDS}
+        row['id'] = form.instance.pk
+        row['line_number'] = len(rows) + 1
+        rows.append(row)
+    return rows
+
+
+def item_rows(formset, post):
+    """
+    Geçerli DeclarationItem formset'inden kaydedilecek satırlar
+
+    Boş bırakılan ekstra satırlar atlanır; material / firma boşsa hidden
+    field'lardaki değerler kullanılır.
+
+    Returns:
+        list: [{'id': 7 | None, 'line_number': 1, 'material': ..., ...}, ...]
+    """
+    hidden = _hidden_material_values(post)
+    rows = []
+    for form_index, form in enumerate(formset.forms):
+        data = form.cleaned_data
+        if data.get('DELETE'):
+            continue
+        if not form.instance.pk and not form.has_changed():
+            continue
+
+        row = {field: data.get(field) or '' for field in ITEM_FIELDS}
+        for field in ('material', 'firma'):
+            if not row[field] and hidden.get(form_index, {}).get(field):
+                row[field] = hidden[form_index][field]
+        row['id'] = form.instance.pk
+        row['line_number'] = len(rows) + 1
+        rows.append(row)
+    return rows
+
+
+def create_line_items(declaration, product_works, items):
+    """
+    Satırları toplu olarak ekle (çağıran transaction.atomic içinde olmalı)
+
+    Args:
+        declaration: Kaydedilmiş Declaration instance
+        product_works: product_work_rows() çıktısı
+        items: item_rows() çıktısı
+    """
+    ProductWork.objects.bulk_create([
+        ProductWork(declaration=declaration, **_row_values(row)) for row in product_works
+    ])
+    DeclarationItem.objects.bulk_create([
+        DeclarationItem(declaration=declaration, **_row_values(row)) for row in items
+    ])
+
+
+def _row_values(row):
+    """Satırın model alanları (eşleştirme için taşınan 'id' hariç)"""
+    return {field: value for field, value in row.items() if field != 'id'}
+
+
+def _sync_relation(model, declaration, rows, fields, existing):
+    """
+    Tek bir ilişkinin satırlarını gönderilen satırlarla eşitle
+
+    Satırlar önce formset'teki ID'leriyle eşleştirilir; ID'si olmayan (yeni
+    eklenmiş) satırlar, içeriği birebir aynı olan eşleşmemiş bir mevcut satıra
+    denk gelirse o satır kullanılır. line_number diğer alanlar gibi sadece
+    değiştiyse yazılır.
+
+    Returns:
+        tuple: (created, updated, deleted) line_number listeleri
+    """
+    fields = list(fields) + ['line_number']
+    by_pk = {obj.pk: obj for obj in existing}
+
+    matched = []
+    unmatched_rows = []
+    for row in rows:
+        obj = by_pk.pop(row.get('id'), None) if row.get('id') is not None else None
+        if obj is None:
+            unmatched_rows.append(row)
+        else:
+            matched.append((obj, row))
+
+    to_create = []
+    for row in unmatched_rows:
+        # ID yoksa içerikle eşleştir (line_number hariç tüm alanlar aynı)
+        obj = next(
+            (candidate for candidate in by_pk.values()
+             if all(getattr(candidate, field) == row[field] for field in fields if field != 'line_number')),
+            None
+        )
+        if obj is None:
+            to_create.append(model(declaration=declaration, **_row_values(row)))
+        else:
+            del by_pk[obj.pk]
+            matched.append((obj, row))
+
+    to_update, update_fields = [], set()
+    for obj, row in matched:
+        changed = [field for field in fields if getattr(obj, field) != row[field]]
+        if changed:
+            for field in changed:
+                setattr(obj, field, row[field])
+            update_fields.update(changed)
+            to_update.append(obj)
+
+    to_delete = list(by_pk.values())
+    if to_delete:
+        model.objects.filter(pk__in=[obj.pk for obj in to_delete]).delete()
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(update_fields))
+    if to_create:
+        model.objects.bulk_create(to_create)
+
+    return (
+        [obj.line_number for obj in to_create],
+        [obj.line_number for obj in to_update],
+        [obj.line_number for obj in to_delete],
+    )
+
+
+def sync_line_items(declaration, product_works, items, changes=None):
+    """
+    Mevcut satırları gönderilen satırlarla ID'lerine göre karşılaştır ve
+    sadece farkları yaz (çağıran transaction.atomic içinde olmalı)
+
+    Mevcut satırlar DB'den okunur: formset'in yüklediği instance'lar
+    validasyon sırasında gönderilen verilerle güncellendiği için
+    karşılaştırmada kullanılamaz.
+
+    Args:
+        declaration: Kaydedilmiş Declaration instance
+        product_works: product_work_rows() çıktısı
+        items: item_rows() çıktısı
+        changes: Doldurulacak ChangeSet (verilmezse yenisi oluşturulur)
+
+    Returns:
+        ChangeSet
+    """
+    changes = changes if changes is not None else ChangeSet()
+    changes.record('product_works', *_sync_relation(
+        ProductWork, declaration, product_works, PRODUCT_WORK_FIELDS, declaration.product_works.all()
+    ))
+    changes.record('items', *_sync_relation(
+        DeclarationItem, declaration, items, ITEM_FIELDS, declaration.items.all()
+    ))
+    return changes
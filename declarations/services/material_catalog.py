@@ -0,0 +1,41 @@
+"""
+Zahnovia Material Katalogu
+Kullanıcının aktif MaterialProduct'ları Django cache'inde tutulur. Declaration
+formlarındaki ürün seçimi (her satırdaki <select>) ve JavaScript verisi bu
+listeden üretilir; MaterialProduct kaydedildiğinde / silindiğinde
+(post_save / post_delete) cache temizlenir.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+CACHE_KEY = 'material_catalog:{user_id}'
+
+
+def _field_names():
+    from ..models import MaterialProduct
+    return [field.attname for field in MaterialProduct._meta.concrete_fields]
+
+
+def get_material_catalog(user_id):
+    """
+    Kullanıcının aktif MaterialProduct'ları, isme göre sıralı
+
+    Returns:
+        list: MaterialProduct instance'ları (salt okunur)
+    """
+    from ..models import MaterialProduct
+
+    key = CACHE_KEY.format(user_id=user_id)
+    field_names = _field_names()
+    rows = cache.get(key)
+    if rows is None or (rows and len(rows[0]) != len(field_names)):
+        rows = list(
+            MaterialProduct.objects.filter(user_id=user_id, is_active=True)
+            .order_by('name').values_list(*field_names)
+        )
+        cache.set(key, rows, getattr(settings, 'MATERIAL_CATALOG_CACHE_TIMEOUT', 3600))
+    return [MaterialProduct.from_db('default', field_names, row) for row in rows]
+
+
+def invalidate_material_catalog(user_id):
+    cache.delete(CACHE_KEY.format(user_id=user_id))
@@ -0,0 +1,61 @@
+"""
+Zahnovia Parse Cache
+Referans PDF parse sonuçları, PDF içeriğinin SHA-256'sı ve parser sürümü
+(reference_parser.PARSER_VERSION) anahtarıyla process içi bir LRU'da tutulur.
+Aynı PDF tekrar yüklendiğinde PyPDF2 ve regex'ler yeniden çalışmaz.
+
+Sonuçlar hasta bilgisi içerdiğinden paylaşılan cache'e (redis vb.) değil
+sadece process belleğine yazılır; boyut (PARSE_CACHE_SIZE) ve süre
+(PARSE_CACHE_TTL) sınırlıdır.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .reference_parser import PARSER_VERSION
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _key(content_hash):
+    return f"{PARSER_VERSION}:{content_hash}"
+
+
+def get_parse_result(content_hash):
+    """Cache'teki parse sonucu (kopya) veya None"""
+    key = _key(content_hash)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+    return copy.deepcopy(result)
+
+
+def set_parse_result(content_hash, result):
+    """Başarılı parse sonucunu cache'le (hata sonuçları cache'lenmez)"""
+    if 'error' in result:
+        return
+    max_size = getattr(settings, 'PARSE_CACHE_SIZE', 128)
+    if max_size <= 0:
+        return
+    expires_at = time.monotonic() + getattr(settings, 'PARSE_CACHE_TTL', 3600)
+    key = _key(content_hash)
+    with _cache_lock:
+        _cache[key] = (expires_at, copy.deepcopy(result))
+        _cache.move_to_end(key)
+        while len(_cache) > max_size:
+            _cache.popitem(last=False)
+
+
+def clear_parse_cache():
+    with _cache_lock:
+        _cache.clear()
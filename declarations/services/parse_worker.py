@@ -0,0 +1,101 @@
+"""
+Zahnovia Parse Worker
+Güvenilmeyen referans PDF'ler ayrı, uzun ömürlü worker process'lerde parse
+edilir (bkz. utils.process_pool). Bozuk veya kötü niyetli bir PDF web
+process'ini kilitleyemez ya da belleğini tüketemez:
+
+- Her parse'ın bir süre sınırı vardır (PDF_PARSE_TIMEOUT); aşılırsa worker
+  öldürülür ve yerine yenisi başlatılır.
+- Worker'ların adres alanı sınırlıdır (PDF_PARSE_WORKER_MEMORY_LIMIT_MB);
+  sınırı aşan parse MemoryError ile biter, worker yenilenir.
+- Worker'lar PDF_PARSE_WORKER_MAX_TASKS parse'tan sonra veya RSS
+  PDF_PARSE_WORKER_MAX_RSS_MB'ı geçince yenilenir.
+
+NOT: Bu modül worker process'lerinde import edilir; WeasyPrint veya model
+import'u içermemeli.
+"""
+import atexit
+import io
+import logging
+import threading
+
+from django.conf import settings
+
+from utils.process_pool import WarmProcessPool
+from .pdf_text import PyPDF2, iter_pdf_pages
+from .reference_parser import parse_reference_pages
+
+logger = logging.getLogger(__name__)
+
+
+def _mb(value):
+    return value * 1024 * 1024 if value else None
+
+
+def _init_pdf_parser():
+    """PyPDF2 ve parser modülleri import edildi; worker hazır"""
+    return {'pypdf2': PyPDF2 is not None}
+
+
+def _parse_pdf_task(state, payload):
+    pdf_bytes, max_pages, max_bytes = payload
+    return parse_reference_pages(iter_pdf_pages(io.BytesIO(pdf_bytes), max_pages, max_bytes))
+
+
+_parser_pool = None
+_parser_pool_lock = threading.Lock()
+
+
+def get_parser_pool():
+    """Process genelinde tek referans PDF parser havuzu (lazy)"""
+    global _parser_pool
+    with _parser_pool_lock:
+        if _parser_pool is None:
+            _parser_pool = WarmProcessPool(
+                task=_parse_pdf_task,
+                size=getattr(settings, 'PDF_PARSE_POOL_SIZE', 2),
+                initializer=_init_pdf_parser,
+                max_tasks=getattr(settings, 'PDF_PARSE_WORKER_MAX_TASKS', 500),
+                max_rss_bytes=_mb(getattr(settings, 'PDF_PARSE_WORKER_MAX_RSS_MB', 300)),
+                memory_limit_bytes=_mb(getattr(settings, 'PDF_PARSE_WORKER_MEMORY_LIMIT_MB', 1024)),
+            )
+            atexit.register(_parser_pool.close)
+        return _parser_pool
+
+
+def parse_pdf_isolated(pdf_bytes):
+    """
+    PDF içeriğini bir parse worker'ında parse et.
+
+    Returns:
+        (result, pages_read) - bkz. reference_parser.parse_reference_pages
+
+    Raises:
+        PoolTimeout: PDF_PARSE_TIMEOUT aşıldı (worker öldürüldü)
+        PoolError: Worker çöktü, bellek sınırı aşıldı veya parse hata verdi
+    """
+    payload = (
+        pdf_bytes,
+        getattr(settings, 'PDF_PARSE_MAX_PAGES', 20),
+        getattr(settings, 'PDF_PARSE_MAX_TEXT_BYTES', 512 * 1024),
+    )
+    return get_parser_pool().submit(payload, timeout=getattr(settings, 'PDF_PARSE_TIMEOUT', 10))
+
+
+def warm_up_parser_pool():
+    """
+    Parser worker'larını arka planda başlat (wsgi.py çağırır); ilk referans
+    PDF yüklemesi worker başlatmayı (~1 sn) beklemez.
+    """
+    if getattr(settings, 'PDF_PARSE_POOL_SIZE', 2) <= 0 or not getattr(settings, 'PDF_PARSE_POOL_WARM_UP', True):
+        return None
+
+    def _warm_up():
+        try:
+            get_parser_pool().warm_up()
+        except Exception:
+            logger.exception('Parser pool warm-up failed')
+
+    thread = threading.Thread(target=_warm_up, name='parser-pool-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,132 @@
+"""
+Zahnovia PDF Render Cache
+PDF'e giren tüm verilerin (declaration, satırlar, hersteller profili, template)
+stabil bir hash'i tutulur. Hash değişmediyse mevcut PDF ve pdf_url tekrar
+kullanılır: WeasyPrint render'ı ve Drive sil/yükle döngüsü atlanır.
+"""
+import hashlib
+import json
+import threading
+from functools import lru_cache
+
+from django.template.loader import get_template
+
+PDF_TEMPLATE_NAME = 'declarations/pdf/declaration.html'
+
+# Template dışında render çıktısını etkileyen bir değişiklik olursa artırın
+PDF_RENDER_VERSION = 1
+
+DECLARATION_FIELDS = ['declaration_number', 'auftragsnummer', 'patient_name', 'herstellungsdatum']
+PRODUCT_WORK_FIELDS = ['line_number', 'produktbezeichnung_arbeit', 'zahnnummer', 'zahnfarbe']
+ITEM_FIELDS = ['line_number', 'material', 'firma', 'bestandteile', 'material_lot_no', 'ce_status']
+PROFILE_FIELDS = ['firma_name', 'strasse', 'plz', 'ort', 'telefon', 'email', 'verordnender_arzt']
+
+
+class RenderCacheStats:
+    """Process bazında hit/miss sayaçları"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / total) if total else 0.0,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+stats = RenderCacheStats()
+
+
+@lru_cache(maxsize=1)
+def template_version():
+    """PDF template ve stylesheet kaynağının hash'i (değişince cache otomatik geçersiz olur)"""
+    from ..utils import PDF_STYLESHEET_PATH
+
+    digest = hashlib.sha256(get_template(PDF_TEMPLATE_NAME).template.source.encode('utf-8'))
+    with open(PDF_STYLESHEET_PATH, 'rb') as f:
+        digest.update(f.read())
+    return f"{PDF_RENDER_VERSION}:{digest.hexdigest()[:16]}"
+
+
+def _get_profile(declaration):
+    try:
+        return declaration.praxis.hersteller_profile
+    except Exception:
+        return None
+
+
+def _field_values(obj, fields):
+    values = {}
+    for field in fields:
+        value = getattr(obj, field, None)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        values[field] = value
+    return values
+
+
+def compute_render_hash(declaration, hersteller_profile=None):
+    """
+    PDF template'ine giren tüm verilerin SHA-256 hash'i.
+
+    Args:
+        declaration: Declaration instance
+        hersteller_profile: Verilmezse declaration.praxis üzerinden alınır
+
+    Returns:
+        str: 64 karakterlik hex digest
+    """
+    if hersteller_profile is None:
+        hersteller_profile = _get_profile(declaration)
+
+    payload = {
+        'template': template_version(),
+        'declaration': _field_values(declaration, DECLARATION_FIELDS),
+        'product_works': list(
+            declaration.product_works.order_by('line_number', 'pk').values_list(*PRODUCT_WORK_FIELDS)
+        ),
+        'items': list(
+            declaration.items.order_by('line_number', 'pk').values_list(*ITEM_FIELDS)
+        ),
+        'hersteller_profile': _field_values(hersteller_profile, PROFILE_FIELDS) if hersteller_profile else None,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def is_render_current(declaration, render_hash=None, record=True):
+    """
+    Mevcut PDF declaration'ın güncel halini mi gösteriyor?
+
+    Args:
+        declaration: Declaration instance
+        render_hash: Önceden hesaplanmış hash (yoksa hesaplanır)
+        record: True ise hit/miss sayaçlarına işlenir
+
+    Returns:
+        bool: Cache hit ise True
+    """
+    if render_hash is None:
+        render_hash = compute_render_hash(declaration)
+    hit = bool(declaration.pdf_url) and declaration.pdf_content_hash == render_hash
+    if record:
+        stats.record(hit)
+    return hit
@@ -0,0 +1,285 @@
+"""
+Zahnovia PDF Kuyruğu
+Declaration PDF'lerinin arka planda render edilip depolamaya yüklenmesi için
+DB tabanlı iş kuyruğu. View'lar sadece enqueue eder, `run_pdf_worker`
+management command'ı işleri çalıştırır.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Declaration, PdfJob
+from .pdf_cache import compute_render_hash, is_render_current
+from utils.tracing import end_trace, start_trace
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_pdf_job(declaration):
+    """
+    Declaration için PDF işi kuyruğa ekle.
+
+    Henüz başlamamış (pending) bir iş varsa yenisi oluşturulmaz; worker işi
+    çalıştırdığında declaration'ın en güncel halini render eder.
+
+    Returns:
+        PdfJob instance
+    """
+    with transaction.atomic():
+        job = PdfJob.objects.filter(
+            declaration=declaration,
+            status=PdfJob.STATUS_PENDING
+        ).order_by('created_at').first()
+        if job:
+            return job
+
+        return PdfJob.objects.create(
+            declaration=declaration,
+            max_attempts=_setting('PDF_JOB_MAX_ATTEMPTS', 5),
+        )
+
+
+def get_active_job(declaration):
+    """Declaration'ın bekleyen veya çalışan son işini döner (yoksa None)"""
+    return PdfJob.objects.filter(
+        declaration=declaration,
+        status__in=PdfJob.ACTIVE_STATUSES
+    ).order_by('-created_at').first()
+
+
+def get_latest_job(declaration):
+    """Declaration'ın en son işini döner (yoksa None)"""
+    return PdfJob.objects.filter(declaration=declaration).order_by('-created_at').first()
+
+
+def requeue_stale_jobs():
+    """
+    Kilit süresi dolmuş (worker çökmüş) işleri tekrar kuyruğa al.
+
+    Returns:
+        int: Kuyruğa geri alınan iş sayısı
+    """
+    timeout = _setting('PDF_JOB_LOCK_TIMEOUT', 600)
+    stale_before = timezone.now() - timedelta(seconds=timeout)
+    return PdfJob.objects.filter(
+        status=PdfJob.STATUS_RUNNING,
+        locked_at__lt=stale_before
+    ).update(status=PdfJob.STATUS_PENDING, locked_by='', locked_at=None)
+
+
+def claim_next_job(worker_id):
+    """
+    Sıradaki uygun işi bu worker için kilitle.
+
+    SQLite'ta SELECT ... FOR UPDATE SKIP LOCKED olmadığı için koşullu UPDATE
+    ile iyimser kilitleme yapılır: sadece UPDATE'i kazanan worker işi alır.
+    Aynı declaration için aynı anda iki iş çalıştırılmaz.
+
+    Returns:
+        PdfJob veya None
+    """
+    now = timezone.now()
+    busy_declarations = PdfJob.objects.filter(
+        status=PdfJob.STATUS_RUNNING
+    ).values('declaration_id')
+
+    candidates = PdfJob.objects.filter(
+        status=PdfJob.STATUS_PENDING,
+        run_after__lte=now
+    ).exclude(
+        declaration_id__in=busy_declarations
+    ).order_by('run_after', 'created_at').values_list('pk', flat=True)[:10]
+
+    for job_id in candidates:
+        claimed = PdfJob.objects.filter(pk=job_id, status=PdfJob.STATUS_PENDING).update(
+            status=PdfJob.STATUS_RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return PdfJob.objects.select_related('declaration', 'declaration__praxis').get(pk=job_id)
+    return None
+
+
+def _retry_delay(attempts):
+    """Üstel bekleme: 30s, 60s, 120s, ... (en fazla 1 saat)"""
+    base = _setting('PDF_JOB_RETRY_DELAY', 30)
+    return min(base * (2 ** max(attempts - 1, 0)), 3600)
+
+
+def run_job(job):
+    """
+    Tek bir işi çalıştır: PDF render et, depolamaya yükle, pdf_url'i güncelle.
+
+    Yeni PDF başarıyla yüklendikten sonra eski PDF depolamadan silinir, böylece
+    declaration hiçbir zaman PDF'siz kalmaz.
+
+    Returns:
+        bool: Başarılı ise True
+    """
+    # Her iş kendi trace'ini alır: span'ler ve loglar iş bazında ilişkilendirilir
+    trace, token = start_trace()
+    try:
+        return _run_job(job)
+    finally:
+        end_trace(token)
+
+
+def _run_job(job):
+    from ..utils import generate_declaration_pdf, delete_document
+
+    declaration = job.declaration
+    try:
+        render_hash = compute_render_hash(declaration)
+
+        # Veriler son yüklenen PDF'ten beri değişmediyse render'ı atla
+        if is_render_current(declaration, render_hash, record=False):
+            _mark_done(job)
+            return True
+
+        result = generate_declaration_pdf(declaration)
+        pdf_url = result.get('pdf_url')
+        if logger.isEnabledFor(logging.INFO):
+            timings = ', '.join(f"{name}={ms:.0f}ms" for name, ms in result.get('timings', {}).items())
+            logger.info('PDF Job #%s (%s): %s', job.pk, declaration.declaration_number, timings)
+        if not pdf_url:
+            raise RuntimeError('PDF-Upload fehlgeschlagen')
+    except Exception as e:
+        _mark_failed(job, e)
+        return False
+
+    old_url = Declaration.objects.filter(pk=declaration.pk).values_list('pdf_url', flat=True).first()
+    Declaration.objects.filter(pk=declaration.pk).update(pdf_url=pdf_url, pdf_content_hash=render_hash)
+
+    if old_url and old_url != pdf_url:
+        delete_document(old_url)
+
+    _mark_done(job)
+    return True
+
+
+def _mark_done(job):
+    now = timezone.now()
+    PdfJob.objects.filter(pk=job.pk).update(
+        status=PdfJob.STATUS_DONE,
+        last_error='',
+        locked_by='',
+        locked_at=None,
+        finished_at=now,
+        updated_at=now,
+    )
+
+
+def _mark_failed(job, error):
+    job.refresh_from_db(fields=['attempts', 'max_attempts'])
+    now = timezone.now()
+    last_error = f"{error}\n{traceback.format_exc()}"[:5000]
+
+    if job.attempts < job.max_attempts:
+        PdfJob.objects.filter(pk=job.pk).update(
+            status=PdfJob.STATUS_PENDING,
+            run_after=now + timedelta(seconds=_retry_delay(job.attempts)),
+            last_error=last_error,
+            locked_by='',
+            locked_at=None,
+            updated_at=now,
+        )
+    else:
+        PdfJob.objects.filter(pk=job.pk).update(
+            status=PdfJob.STATUS_FAILED,
+            last_error=last_error,
+            locked_by='',
+            locked_at=None,
+            finished_at=now,
+            updated_at=now,
+        )
+
+
+def _handle_loop_error(job, error):
+    """run_worker döngüsünde yakalanmayan hata: logla, işi mümkünse failed işaretle"""
+    if job is None:
+        logger.exception('PDF worker: claim failed')
+        return
+    logger.exception('PDF Job #%s failed outside the render step', job.pk)
+    try:
+        close_old_connections()
+        _mark_failed(job, error)
+    except Exception:
+        # DB hâlâ erişilemiyor: iş kilitli kalır, requeue_stale_jobs geri alır
+        logger.exception('PDF Job #%s could not be marked failed', job.pk)
+
+
+def run_worker(concurrency=None, poll_interval=None, once=False, stop_event=None):
+    """
+    PDF worker döngüsü. `concurrency` kadar thread paralel iş çalıştırır.
+
+    Args:
+        concurrency: Paralel thread sayısı (varsayılan: settings.PDF_WORKER_CONCURRENCY)
+        poll_interval: Kuyruk boşken bekleme süresi (saniye)
+        once: True ise kuyruk boşalınca çık
+        stop_event: threading.Event - set edilince worker durur
+
+    Returns:
+        int: Çalıştırılan iş sayısı
+    """
+    concurrency = concurrency or _setting('PDF_WORKER_CONCURRENCY', 2)
+    poll_interval = poll_interval if poll_interval is not None else _setting('PDF_WORKER_POLL_INTERVAL', 2)
+    stop_event = stop_event or threading.Event()
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    processed = 0
+    processed_lock = threading.Lock()
+
+    def loop(index):
+        nonlocal processed
+        worker_id = f"{base_id}:{index}"
+        while not stop_event.is_set():
+            job = None
+            try:
+                close_old_connections()
+                job = claim_next_job(worker_id)
+                if job is None:
+                    if once:
+                        break
+                    stop_event.wait(poll_interval)
+                    continue
+                run_job(job)
+            except Exception as e:
+                # Worker thread'i ölmemeli: iş (alındıysa) failed / retry olarak
+                # işaretlenir, DB hatasında bir sonraki turda tekrar denenir
+                _handle_loop_error(job, e)
+                if job is None:
+                    if once:
+                        break
+                    stop_event.wait(poll_interval)
+                    continue
+            with processed_lock:
+                processed += 1
+        close_old_connections()
+
+    requeue_stale_jobs()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='pdf-worker') as executor:
+        futures = [executor.submit(loop, i) for i in range(concurrency)]
+        try:
+            for future in futures:
+                future.result()
+        except KeyboardInterrupt:
+            stop_event.set()
+            raise
+
+    return processed
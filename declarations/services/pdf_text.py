@@ -0,0 +1,64 @@
+"""
+Zahnovia PDF Metin Çıkarma
+Referans PDF'lerin sayfa metni, sayfa ve metin bütçesi sınırları içinde.
+
+Bu modül parse worker process'lerinde (bkz. parse_worker) import edilir;
+WeasyPrint veya model import'u içermemeli.
+"""
+import logging
+
+from django.conf import settings
+
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+logger = logging.getLogger(__name__)
+
+
+def iter_pdf_pages(pdf_file, max_pages=None, max_bytes=None):
+    """
+    PDF sayfalarının metnini sırayla ve sadece istendikçe çıkar (generator)
+
+    Sayfa sınırı (PDF_PARSE_MAX_PAGES) veya toplam metin bütçesi
+    (PDF_PARSE_MAX_TEXT_BYTES) aşılınca durur; bütçeyi aşan sayfa kesilir.
+
+    Yields:
+        str: Sayfa metni (görünmez Unicode karakterler temizlenmiş)
+    """
+    if max_pages is None:
+        max_pages = getattr(settings, 'PDF_PARSE_MAX_PAGES', 20)
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'PDF_PARSE_MAX_TEXT_BYTES', 512 * 1024)
+
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    remaining = max_bytes
+    for index, page in enumerate(pdf_reader.pages):
+        if index >= max_pages:
+            logger.info('Reference PDF: page limit reached (%d pages)', max_pages)
+            return
+        text = page.extract_text() or ''
+
+        # Unicode karakterleri temizle
+        text = text.replace('\u200b', '')  # Zero-width space
+        text = text.replace('\ufeff', '')  # BOM
+
+        encoded = text.encode('utf-8')
+        if len(encoded) >= remaining:
+            logger.info('Reference PDF: text budget reached on page %d (%d bytes)', index + 1, max_bytes)
+            yield encoded[:remaining].decode('utf-8', errors='ignore')
+            return
+        remaining -= len(encoded)
+        yield text
+
+
+def extract_pdf_text(pdf_file, max_pages=None, max_bytes=None):
+    """
+    PDF'in (sınırlar dahilindeki) tüm sayfalarının metni
+
+    Returns:
+        (text, page_count)
+    """
+    pages = list(iter_pdf_pages(pdf_file, max_pages, max_bytes))
+    return ''.join(pages), len(pages)
@@ -0,0 +1,59 @@
+"""
+Zahnovia Profil Cache
+HerstellerProfile her istekte (middleware, base.html, formlar) okunur. Profil
+satırı kullanıcı bazında Django cache'inde tutulur ve HerstellerProfile
+kaydedildiğinde / silindiğinde (post_save / post_delete) geçersiz kılınır.
+
+Cache'e sadece CACHED_FIELDS yazılır (middleware bayrakları ve PDF'e / sayfalara
+basılan alanlar); verification_token gibi alanlar paylaşılan cache'e girmez.
+Diğer alanlara erişim deferred alan gibi DB'den okunur.
+
+Cache'ten dönen instance SADECE OKUMA içindir; profili değiştiren kod her zaman
+DB'den yüklemelidir (request.user.hersteller_profile).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .pdf_cache import PROFILE_FIELDS
+
+CACHE_KEY = 'hersteller_profile:{user_id}'
+
+CACHED_FIELDS = ['id', 'user_id', 'email_verified', 'profile_completed'] + PROFILE_FIELDS
+
+
+def _timeout():
+    return getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300)
+
+
+def _field_names():
+    """CACHED_FIELDS, model sırasıyla (from_db eksik alanları bu sıraya göre eşler)"""
+    from ..models import HerstellerProfile
+    return [field.attname for field in HerstellerProfile._meta.concrete_fields if field.attname in CACHED_FIELDS]
+
+
+def get_cached_profile(user_id):
+    """
+    Kullanıcının HerstellerProfile'ı (cache'ten, yoksa DB'den okunup cache'lenir)
+
+    Args:
+        user_id: User pk
+
+    Returns:
+        HerstellerProfile (salt okunur) veya profil yoksa None
+    """
+    from ..models import HerstellerProfile
+
+    key = CACHE_KEY.format(user_id=user_id)
+    field_names = _field_names()
+    values = cache.get(key)
+    if values is None or len(values) != len(field_names):
+        values = HerstellerProfile.objects.filter(user_id=user_id).values_list(*field_names).first()
+        if values is None:
+            return None
+        values = list(values)
+        cache.set(key, values, _timeout())
+    return HerstellerProfile.from_db('default', field_names, values)
+
+
+def invalidate_profile(user_id):
+    cache.delete(CACHE_KEY.format(user_id=user_id))
@@ -0,0 +1,420 @@
+"""
+Zahnovia Referans PDF Parser
+Referans PDF'ten (Dentsply Sirona iş çıktısı, Ivoclar etiketi, genel tablo)
+çıkarılan metinden Konformitätserklärung alanlarını okur.
+
+- Tüm pattern'ler modül yüklenirken bir kez derlenir.
+- Önce ucuz bir üretici tespiti yapılır (sabit metin aramaları) ve TEK bir
+  profil seçilir.
+- "Etiket: değer" alanları metin üzerinden tek geçişte okunur: tüm etiketler
+  tek bir regex'te aranır, değer pattern'i etiketin hemen arkasında denenir.
+- Sayfa sayfa parse'ta (parse_reference_pages) her sayfa bir kez taranır:
+  ParseContext bulunanları biriktirir, profil ilk eşleşen sayfada seçilir.
+
+Yeni bir üretici formatı için VendorProfile'dan türetip register_profile()
+ile kaydedin. Parse sonucunu değiştiren her değişiklikte PARSER_VERSION
+artırılmalıdır.
+"""
+import re
+
+PARSER_VERSION = '5'
+
+_LETTERS = 'A-Za-zäöüßÄÖÜ'
+_DATE = r'[:\s]+(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{4})'
+
+# ===== "Etiket: değer" alanları =====
+# (alan, etiket, değer pattern'i). Aynı etiketin birden fazla değer pattern'i
+# olabilir; her biri metindeki ilk eşleşmesini alır.
+FIELD_PATTERNS = [
+    ('auftragsnummer', 'Auftragsnummer', r'[:\s]+([A-Z0-9-]+)'),
+    ('patient', 'Patient(?:enname)?', r'[:\s]+([^\n]+)'),
+    ('erstellungsdatum', 'Erstellungsdatum', _DATE),
+    ('herstellungsdatum', 'Herstellungsdatum', _DATE),
+    ('materialfarbe', 'Materialfarbe', r'[:\s]*([A-Z0-9]{1,4})(?:\s|[a-z]|$)'),
+    ('materialfarbe_pair', 'Materialfarbe', r'[:\s]*([A-Z0-9]+\s+[A-Z0-9]+)'),
+    ('lot_nummer', 'LOT-Nummer', r'[:\s]*([A-Z0-9]+)'),
+    ('lot_nr', 'Lot-Nr', r'[.:\s]*([A-Z0-9-]+)'),
+    ('materialname', 'Materialname', r'[:\s]*(.+?)(?:\n|$)'),
+    ('hersteller', 'Hersteller', r'[:\s]*(.+?)(?:\n|$)'),
+]
+
+_LABELS = {}
+for _field, _label, _value in FIELD_PATTERNS:
+    _LABELS.setdefault(_label, []).append((_field, re.compile(_value, re.IGNORECASE)))
+_LABEL_NAMES = list(_LABELS)
+
+# Etiketler tek regex'te, her biri kendi grubunda (uzun olan önce: Patientenname > Patient)
+LABEL_RE = re.compile(
+    '|'.join(f'({label})' for label in _LABEL_NAMES),
+    re.IGNORECASE
+)
+
+# ===== Tablo satırları =====
+# Dentsply: "1Sanli,Seda Fischer,Christine Unknown Krone 24 Hoch"
+# ID+Zahnarzt Patient Techniker Elementtyp Zahnnummer Produktion (virgülden sonra boşluk yok)
+DENTSPLY_ROW_RE = re.compile(
+    rf'\d+[{_LETTERS}]+,[{_LETTERS}]+\s+([{_LETTERS}]+),([{_LETTERS}]+)\s+'
+    rf'[{_LETTERS}]+\s+([{_LETTERS}]+(?:\s+[{_LETTERS}]+)*)\s+(\d+)'
+)
+DENTSPLY_PATIENT_RE = re.compile(
+    rf'\d+[{_LETTERS}]+,[{_LETTERS}]+\s+([{_LETTERS}]+),([{_LETTERS}]+)\s+'
+)
+# Eski Dentsply LOT formatı: "20260101-222705" → "222705"
+DENTSPLY_DATE_LOT_RE = re.compile(r'\d{8}-(\d{6})')
+# "Krone | 24 | A2". İlk sütun satır başında veya bir |'dan sonra başlar ve
+# satır sonunu geçmez: aksi halde önceki satırlar da ürün adına girer ve uzun
+# metinlerde arama her konumdan yeniden denendiği için karesel sürer
+PIPE_ROW_RE = re.compile(r'(?:^|(?<=\|))([^|\n]+)\s*\|\s*(\d+[,\s]*\d*)\s*\|\s*([A-Z0-9]+)', re.MULTILINE)
+
+# ===== Materyal adı düzeltmeleri =====
+MATERIAL_STOP_RE = re.compile('Materialklasse|Materialfarbe|LOT-Nummer|Hersteller|Werkstückgröße')
+# "IPSe.max" / "IP Se.max" / "IP S e.max" → "IPS e.max";
+# "e.maxZirCAD", "ZirCADMT", "MTMulti" → araya boşluk
+EMAX_FIX_RE = re.compile(r'IP ?S ?e\.max|(?<=e\.max)(?=ZirCAD)|(?<=ZirCAD)(?=MT)|(?<=MT)(?=Multi)')
+# Boşluksuz eski format: "CERECMTLZirconia" → "CEREC MTL Zirconia"
+CAMEL_WORD_RE = re.compile(r'([A-Z][a-z]+)')
+CAMEL_ACRONYM_RE = re.compile(r'([A-Z]+)([A-Z][a-z])')
+# "DentsplySirona" → "Dentsply Sirona"
+CAMEL_BOUNDARY_RE = re.compile(r'([a-z])([A-Z])')
+
+# Genel format: CE işareti / Lot içeren serbest satırlar
+LINE_SPLIT_RE = re.compile(r'\s{2,}|\t')
+LINE_LOT_RE = re.compile(r'(?:Lot|LOT)[:\s]*([A-Z0-9-]+)')
+EMAX_RE = re.compile(r'IP ?S ?e\.max', re.IGNORECASE)
+
+DEFAULT_FIRMA = 'Ivoclar'
+
+
+def scan_fields(text, found=None):
+    """
+    Tüm "Etiket: değer" alanlarını tek geçişte oku
+
+    Args:
+        found: Önceki sayfalarda bulunan alanlar (verilirse güncellenir; bulunmuş
+            alanlar tekrar aranmaz)
+
+    Returns:
+        dict: alan → re.Match (her alanın metindeki ilk eşleşmesi)
+    """
+    if found is None:
+        found = {}
+    remaining = len(FIELD_PATTERNS) - len(found)
+    if not remaining:
+        return found
+    for label_match in LABEL_RE.finditer(text):
+        patterns = _LABELS[_LABEL_NAMES[label_match.lastindex - 1]]
+        for field, pattern in patterns:
+            if field in found:
+                continue
+            value_match = pattern.match(text, label_match.end())
+            if value_match:
+                found[field] = value_match
+                remaining -= 1
+        if not remaining:
+            break
+    return found
+
+
+class ParseContext:
+    """
+    Tek bir parse'ın sayfaları ve o ana kadar bulunanlar. Sayfalar add_page()
+    ile eklenir; "Etiket: değer" alanları eklenirken, diğer taramalar (tablo
+    satırları, serbest satırlar, ...) ilk istendiklerinde ve sadece henüz
+    taranmamış sayfalarda yapılır.
+    """
+
+    __slots__ = ('pages', 'fields', '_scans')
+
+    def __init__(self, text=''):
+        self.pages = []
+        self.fields = {}
+        # tarama adı → (taranan sayfa sayısı, sonuç)
+        self._scans = {}
+        if text:
+            self.add_page(text)
+
+    def add_page(self, text):
+        self.pages.append(text)
+        scan_fields(text, self.fields)
+
+    def first(self, name, scan):
+        """scan(sayfa) sonucunun ilk sayfalardaki ilk boş olmayanı (bulunduktan sonra tarama yapılmaz)"""
+        scanned, result = self._scans.get(name, (0, None))
+        if result is None:
+            for page in self.pages[scanned:]:
+                result = scan(page)
+                if result is not None:
+                    break
+            self._scans[name] = (len(self.pages), result)
+        return result
+
+    def collect(self, name, scan):
+        """scan(sayfa) listelerinin tüm sayfalar boyunca birleşimi"""
+        scanned, results = self._scans.get(name, (0, []))
+        if scanned < len(self.pages):
+            results = results + [item for page in self.pages[scanned:] for item in scan(page)]
+            self._scans[name] = (len(self.pages), results)
+        return results
+
+    def value(self, *names):
+        """İlk bulunan alanın (strip edilmiş) değeri"""
+        for name in names:
+            match = self.fields.get(name)
+            if match:
+                return match.group(1).strip()
+        return ''
+
+    def date(self, *names):
+        for name in names:
+            match = self.fields.get(name)
+            if match:
+                day, month, year = match.groups()
+                return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+        return ''
+
+    @property
+    def dentsply_row(self):
+        """Dentsply iş tablosu satırı (hasta adı + iş satırı tek aramada), yoksa None"""
+        return self.first('dentsply_row', DENTSPLY_ROW_RE.search)
+
+
+def normalize_material_name(name):
+    """PDF metnindeki eksik / kayık boşlukları düzelt"""
+    stop = MATERIAL_STOP_RE.search(name)
+    if stop:
+        name = name[:stop.start()].strip()
+    name = EMAX_FIX_RE.sub(lambda m: 'IPS e.max' if m.group() else ' ', name)
+    if ' ' not in name and len(name) > 10:
+        name = CAMEL_WORD_RE.sub(r' \1', name).strip()
+        name = CAMEL_ACRONYM_RE.sub(r'\1 \2', name).strip()
+    return name
+
+
+def normalize_firma(name):
+    if ' ' not in name:
+        return CAMEL_BOUNDARY_RE.sub(r'\1 \2', name)
+    return name
+
+
+class VendorProfile:
+    """
+    Üretici profili: detect() ucuz bir tespit yapar, parse() alanları çıkarır.
+    Alt sınıflar sadece farklı olan adımları override eder. Profil
+    instance'ları paylaşılır; parse'a özel durum ParseContext'te tutulur.
+    """
+
+    name = ''
+    default_firma = DEFAULT_FIRMA
+    # Bu alanların hepsi bulununca sonraki sayfalar okunmaz (boş: tüm sayfalar okunur)
+    required_fields = ()
+
+    def detect(self, text):
+        raise NotImplementedError
+
+    def is_complete(self, result):
+        return bool(self.required_fields) and all(result.get(field) for field in self.required_fields)
+
+    def parse(self, text):
+        return self.parse_context(ParseContext(text))
+
+    def parse_context(self, ctx):
+        """ParseContext'te o ana kadar bulunanlardan sonuç (sayfa sayfa parse için)"""
+        return {
+            'auftragsnummer': ctx.value('auftragsnummer'),
+            'patient_name': self.patient_name(ctx),
+            'herstellungsdatum': ctx.date('erstellungsdatum', 'herstellungsdatum'),
+            'product_works': self.product_works(ctx),
+            'materials': self.materials(ctx),
+        }
+
+    def patient_name(self, ctx):
+        return ctx.value('patient')
+
+    def product_works(self, ctx):
+        return [dict(row) for row in ctx.collect('pipe_rows', _pipe_rows)]
+
+    def lot_number(self, ctx):
+        """LOT-Nummer, Lot-Nr., son çare eski "20260101-222705" formatının son 6 hanesi"""
+        return ctx.value('lot_nummer', 'lot_nr') or _date_lot(ctx)
+
+    def materials(self, ctx):
+        """Materialname / Hersteller / LOT bloğundan tek materyal; blok yoksa serbest satırlar"""
+        material_name = ctx.value('materialname')
+        if not material_name:
+            return _line_materials(ctx)
+        firma = ctx.value('hersteller')
+        return [{
+            'material': normalize_material_name(material_name),
+            'firma': normalize_firma(firma) if firma else self.default_firma,
+            'bestandteile': '',
+            'material_lot_no': self.lot_number(ctx),
+            'ce_status': 'yes',
+        }]
+
+
+def _pipe_rows(text):
+    # PIPE_ROW_RE her konumdan satır sonuna kadar tarar: | yoksa hiç çalıştırma
+    if '|' not in text:
+        return []
+    return [
+        {
+            'produktbezeichnung_arbeit': produkt.strip(),
+            'zahnnummer': zahnnummer.strip(),
+            'zahnfarbe': zahnfarbe.strip(),
+        }
+        for produkt, zahnnummer, zahnfarbe in PIPE_ROW_RE.findall(text)
+    ]
+
+
+def _date_lot(ctx):
+    match = ctx.first('date_lot', DENTSPLY_DATE_LOT_RE.search)
+    return match.group(1) if match else ''
+
+
+def _line_materials(ctx):
+    return [dict(material) for material in ctx.collect('line_materials', _scan_line_materials)]
+
+
+def _scan_line_materials(text):
+    """CE işareti / Lot / Zirkon içeren satırlar: Material  Firma  Lot: 123"""
+    materials = []
+    for line in text.split('\n'):
+        if 'CE' not in line and 'Lot' not in line and 'Zirconi' not in line:
+            continue
+        parts = LINE_SPLIT_RE.split(line)
+        material_data = {
+            'material': parts[0].strip(),
+            'firma': '',
+            'bestandteile': '',
+            'material_lot_no': '',
+            'ce_status': 'yes' if 'CE' in line else 'no',
+        }
+        for part in parts[1:]:
+            if 'Lot' in part or 'LOT' in part:
+                lot_match = LINE_LOT_RE.search(part)
+                if lot_match:
+                    material_data['material_lot_no'] = lot_match.group(1)
+            elif len(part) > 2 and material_data['firma'] == '':
+                material_data['firma'] = part.strip()
+        if material_data['material']:
+            materials.append(material_data)
+    return materials
+
+
+def _dentsply_patient(ctx):
+    row = ctx.dentsply_row or ctx.first('dentsply_patient', DENTSPLY_PATIENT_RE.search)
+    return f"{row.group(1)}, {row.group(2)}" if row else ''
+
+
+def _dentsply_product_work(ctx):
+    row = ctx.dentsply_row
+    if row is None:
+        return None
+    return {
+        'produktbezeichnung_arbeit': row.group(3).strip(),  # Krone, Brücke, ...
+        'zahnnummer': row.group(4).strip(),
+        'zahnfarbe': ctx.value('materialfarbe', 'materialfarbe_pair'),
+    }
+
+
+class DentsplySironaProfile(VendorProfile):
+    """Dentsply Sirona (CEREC) iş çıktısı: boşlukla ayrılmış iş tablosu + Werkstück bloğu"""
+
+    name = 'dentsply_sirona'
+    required_fields = ('patient_name', 'herstellungsdatum', 'product_works', 'materials')
+    MARKERS = ('Dentsply', 'Erstellungsdatum', 'Werkstückname', 'Elementtyp')
+
+    def detect(self, text):
+        return any(marker in text for marker in self.MARKERS)
+
+    def patient_name(self, ctx):
+        return _dentsply_patient(ctx) or super().patient_name(ctx)
+
+    def product_works(self, ctx):
+        # | ile ayrılmış satırlar varsa onlar geçerli; iş tablosu satırı yalnızca yedek
+        rows = super().product_works(ctx)
+        if not rows:
+            row = _dentsply_product_work(ctx)
+            if row:
+                rows.append(row)
+        return rows
+
+
+class IvoclarProfile(VendorProfile):
+    """Ivoclar (IPS e.max) etiket / çıktı: etiketli alanlar ve | ile ayrılmış tablo"""
+
+    name = 'ivoclar'
+    # Materialname bloğu tablodan sonra gelir: bulunduysa tablo satırları da okunmuştur
+    required_fields = ('patient_name', 'herstellungsdatum', 'product_works', 'materials')
+
+    def detect(self, text):
+        return 'Ivoclar' in text or EMAX_RE.search(text) is not None
+
+
+class GenericTableProfile(DentsplySironaProfile):
+    """Bilinmeyen format: tüm tablo formatları ve serbest satır taraması denenir"""
+
+    name = 'generic'
+    required_fields = ()
+
+    def detect(self, text):
+        return True
+
+
+# Sıra önemli: ilk eşleşen profil seçilir, GenericTableProfile her zaman sonda
+PROFILES = [DentsplySironaProfile(), IvoclarProfile(), GenericTableProfile()]
+
+
+def register_profile(profile):
+    """Yeni üretici profili ekle (generic profilden önce denenir)"""
+    PROFILES.insert(len(PROFILES) - 1, profile)
+
+
+def detect_profile(text):
+    """Metne uyan ilk profil"""
+    for profile in PROFILES:
+        if profile.detect(text):
+            return profile
+    return PROFILES[-1]
+
+
+def parse_reference_text(text):
+    """
+    Referans PDF metnini parse et
+
+    Args:
+        text: PDF'ten çıkarılan metin
+
+    Returns:
+        dict: parse_declaration_pdf ile aynı yapı
+    """
+    return detect_profile(text).parse(text)
+
+
+def parse_reference_pages(pages):
+    """
+    Sayfa sayfa gelen metni parse et; seçilen profilin zorunlu alanları
+    bulununca kalan sayfalar okunmaz (çıkarılmaz).
+
+    Her sayfa bir kez taranır. Profil, üreticiye özel bir profilin eşleştiği
+    ilk sayfada seçilir ve sonra değişmez; o zamana kadar generic profil
+    geçerlidir.
+
+    Args:
+        pages: Sayfa metinlerini sırayla veren iterable (tercihen generator)
+
+    Returns:
+        (dict, int): parse sonucu ve okunan sayfa sayısı
+    """
+    ctx = ParseContext()
+    generic = profile = PROFILES[-1]
+    for page_text in pages:
+        ctx.add_page(page_text)
+        if profile is generic:
+            profile = detect_profile(page_text)
+        if profile.required_fields and profile.is_complete(profile.parse_context(ctx)):
+            break
+    if hasattr(pages, 'close'):
+        pages.close()
+    # Taramalar ParseContext'te saklı: son sonuç yeniden tarama yapmaz
+    return profile.parse_context(ctx), len(ctx.pages)
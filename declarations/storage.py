@@ -0,0 +1,246 @@
+"""
+Zahnovia Döküman Depolama
+PDF'lerin nereye kaydedileceği settings.DOCUMENT_STORAGE_BACKEND ile seçilir:
+
+    declarations.storage.GoogleDriveStorage     - Google Drive (varsayılan)
+    declarations.storage.LocalFileSystemStorage - Yerel disk, içerik adresli
+
+Tüm backend'ler aynı arayüzü sunar: put / get / delete / url / exists.
+"""
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Mantıksal klasör → Google Drive klasör yolu
+DRIVE_FOLDER_PATHS = {
+    'declarations': ['Zahnovia', 'Declarations'],
+    'archive': ['Zahnovia', 'Archive'],
+}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def guess_content_type(name):
+    """
+    Dosya adından MIME tipi. İstemcinin gönderdiği Content-Type'a güvenilmez:
+    dökümanlar aynı origin'den (iframe) sunulur.
+    """
+    return mimetypes.guess_type(name or '')[0] or 'application/octet-stream'
+
+
+def _as_stream(content):
+    """bytes / memoryview veya dosya benzeri nesneyi okunabilir stream'e çevir"""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return io.BytesIO(content)
+    content.seek(0)
+    return content
+
+
+class DocumentStorage:
+    """Döküman depolama arayüzü"""
+
+    # Aynı içerik tek dosya olarak saklanıyorsa True (silmeden önce referans kontrolü gerekir)
+    content_addressed = False
+
+    def put(self, content, name, folder, content_type='application/pdf'):
+        """
+        Dökümanı kaydet
+
+        Args:
+            content: bytes / memoryview veya dosya benzeri nesne (UploadedFile)
+            name: Dosya adı
+            folder: Mantıksal klasör ('declarations' veya 'archive')
+            content_type: MIME tipi
+
+        Returns:
+            dict: {'key': storage_key, 'url': görüntüleme_url'i, 'timings': {...}}
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """Dökümanın içeriğini bytes olarak döner"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Dökümanı sil, başarılı ise True"""
+        raise NotImplementedError
+
+    def url(self, key):
+        """Dökümanın görüntüleme URL'i"""
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def key_from_url(self, url):
+        """url() ile üretilmiş bir URL'den key'i çıkar (bu backend'e ait değilse None)"""
+        raise NotImplementedError
+
+
+class GoogleDriveStorage(DocumentStorage):
+    """Google Drive backend - key: Drive file ID"""
+
+    def put(self, content, name, folder, content_type='application/pdf'):
+        from utils.google_drive import get_drive_service, upload_bytes, upload_stream, upload_to_folder_path
+
+        service = get_drive_service()
+
+        def upload(folder_id):
+            if isinstance(content, (bytes, bytearray, memoryview)):
+                return upload_bytes(service, content, folder_id, name, mimetype=content_type)
+            return upload_stream(
+                service, _as_stream(content), folder_id, name,
+                mimetype=content_type,
+                chunksize=getattr(settings, 'DRIVE_UPLOAD_CHUNK_SIZE', None)
+            )
+
+        file_info = upload_to_folder_path(service, DRIVE_FOLDER_PATHS[folder], upload)
+        return {
+            'key': file_info['id'],
+            'url': file_info.get('view') or self.url(file_info['id']),
+            'timings': file_info.get('timings', {}),
+        }
+
+    def get(self, key):
+        from utils.google_drive import get_drive_service
+        with timed('drive.download'):
+            return get_drive_service().files().get_media(fileId=key).execute()
+
+    def delete(self, key):
+        from utils.google_drive import get_drive_service, delete_file
+        return delete_file(get_drive_service(), key)
+
+    def url(self, key):
+        return f"https://drive.google.com/file/d/{key}/view"
+
+    def exists(self, key):
+        from utils.google_drive import get_drive_service, is_not_found_error
+        try:
+            with timed('drive.get'):
+                info = get_drive_service().files().get(fileId=key, fields='id, trashed').execute()
+        except Exception as e:
+            if is_not_found_error(e):
+                return False
+            raise
+        return not info.get('trashed', False)
+
+    def key_from_url(self, url):
+        if url and '/d/' in url:
+            return url.split('/d/')[1].split('/')[0]
+        return None
+
+
+class LocalFileSystemStorage(DocumentStorage):
+    """
+    Yerel disk backend - key: içeriğin SHA-256 hash'i
+
+    Dosyalar DOCUMENT_STORAGE_ROOT/<ilk 2 karakter>/<hash> olarak saklanır.
+    Yazma önce geçici dosyaya yapılıp os.replace ile taşındığından eşzamanlı
+    yazmalar çakışmaz; aynı içerik tek kez saklanır.
+    """
+
+    content_addressed = True
+    KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+    URL_RE = re.compile(r'/documents/([0-9a-f]{64})/')
+
+    def __init__(self, root=None):
+        self.root = str(root or getattr(settings, 'DOCUMENT_STORAGE_ROOT', os.path.join(settings.BASE_DIR, 'documents')))
+
+    def path(self, key):
+        if not self.KEY_RE.match(key or ''):
+            raise ValueError(f'Ungültiger Dokumentschlüssel: {key}')
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, content, name, folder, content_type='application/pdf'):
+        stream = _as_stream(content)
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            key = digest.hexdigest()
+            final_path = self.path(key)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {'key': key, 'url': self.url(key), 'timings': {}}
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except (OSError, ValueError) as e:
+            logger.warning('Dosya silinemedi: %s', e)
+            return False
+
+    def url(self, key):
+        return reverse('document_file', args=[key])
+
+    def exists(self, key):
+        try:
+            return os.path.exists(self.path(key))
+        except ValueError:
+            return False
+
+    def key_from_url(self, url):
+        match = self.URL_RE.search(url or '')
+        return match.group(1) if match else None
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_document_storage(backend=None):
+    """settings.DOCUMENT_STORAGE_BACKEND'de seçili backend (process başına tek instance)"""
+    backend = backend or getattr(settings, 'DOCUMENT_STORAGE_BACKEND', 'declarations.storage.GoogleDriveStorage')
+    with _storages_lock:
+        if backend not in _storages:
+            _storages[backend] = import_string(backend)()
+        return _storages[backend]
+
+
+def storage_for_url(url):
+    """
+    URL'in ait olduğu backend'i ve key'i bul. Backend değiştirildikten sonra
+    eski dökümanların da silinebilmesi için tüm backend'lere bakılır.
+
+    Returns:
+        tuple: (storage, key) veya (None, None)
+    """
+    for backend in ('declarations.storage.LocalFileSystemStorage', 'declarations.storage.GoogleDriveStorage'):
+        storage = get_document_storage(backend)
+        key = storage.key_from_url(url)
+        if key:
+            return storage, key
+    return None, None
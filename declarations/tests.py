@@ -0,0 +1,1449 @@
+import hashlib
+import io
+import operator
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.db import DatabaseError, IntegrityError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import httplib2
+import PyPDF2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
+
+from utils import google_drive
+from utils.process_pool import PoolTimeout, WarmProcessPool
+from utils.metrics import PARSE_CACHE_REQUESTS, REQUEST_QUERIES, REQUEST_SECONDS, end_request, start_request, timed
+
+from .models import (
+    ArchiveDocument, Declaration, DeclarationCounter, DeclarationItem, DriveFolder, HerstellerProfile, ImportJob,
+    MaterialProduct, OutboundEmail, PdfJob, ProductWork
+)
+from . import gmail_backend
+from . import utils as declaration_utils
+from .services import email_outbox, import_queue, parse_cache, parse_worker, pdf_cache, pdf_queue
+from .storage import get_document_storage
+from .services.bulk_import import STATUS_CREATED, STATUS_ERROR, collect_pdf_files, finalize_drafts, import_reference_pdfs
+from .services.email_service import PasswordResetEmailService
+from .services.material_catalog import get_material_catalog
+from .services.profile_cache import CACHE_KEY, get_cached_profile
+from .services import reference_parser
+from .services.reference_parser import detect_profile, parse_reference_pages, parse_reference_text
+
+
+def formset_data(prefix, rows, initial=0):
+    """Formset POST verisi: rows = [{'id': ..., 'alan': değer, ...}, ...]"""
+    data = {
+        f'{prefix}-TOTAL_FORMS': str(len(rows)),
+        f'{prefix}-INITIAL_FORMS': str(initial),
+        f'{prefix}-MIN_NUM_FORMS': '0',
+        f'{prefix}-MAX_NUM_FORMS': '20',
+    }
+    for index, row in enumerate(rows):
+        for field, value in row.items():
+            if value is True:
+                value = 'on'
+            data[f'{prefix}-{index}-{field}'] = '' if value is None else str(value)
+    return data
+
+
+class DeclarationTestCase(TestCase):
+    """Profili tamamlanmış, giriş yapmış bir praxis kullanıcısı"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('praxis', 'praxis@example.com', 'secret')
+        # Instance üzerinden: force_login user'ı kaydederken profili de kaydeder
+        profile = cls.user.hersteller_profile
+        profile.email_verified = profile.profile_completed = True
+        profile.firma_name = 'Labor'
+        profile.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def create_declaration(self, product_works=1, items=1):
+        declaration = Declaration.objects.create(
+            praxis=self.user,
+            auftragsnummer='A-1',
+            patient_name='Muster, Max',
+            herstellungsdatum=date(2026, 1, 1),
+        )
+        ProductWork.objects.bulk_create([
+            ProductWork(
+                declaration=declaration, line_number=n,
+                produktbezeichnung_arbeit=f'Krone {n}', zahnnummer=str(10 + n), zahnfarbe='A2'
+            )
+            for n in range(1, product_works + 1)
+        ])
+        DeclarationItem.objects.bulk_create([
+            DeclarationItem(
+                declaration=declaration, line_number=n,
+                material=f'Material {n}', firma='Firma', bestandteile='ZrO2', material_lot_no=f'LOT{n}', ce_status='Ja'
+            )
+            for n in range(1, items + 1)
+        ])
+        return declaration
+
+    def edit_data(self, declaration, product_works=None, items=None, **header):
+        """Declaration'ın mevcut halini gönderen edit POST verisi"""
+        if product_works is None:
+            product_works = [
+                {'id': pw.pk, 'produktbezeichnung_arbeit': pw.produktbezeichnung_arbeit,
+                 'zahnnummer': pw.zahnnummer, 'zahnfarbe': pw.zahnfarbe}
+                for pw in declaration.product_works.order_by('line_number')
+            ]
+        if items is None:
+            items = [
+                {'id': item.pk, 'material': item.material, 'firma': item.firma, 'bestandteile': item.bestandteile,
+                 'material_lot_no': item.material_lot_no, 'ce_status': item.ce_status}
+                for item in declaration.items.order_by('line_number')
+            ]
+        data = {
+            'auftragsnummer': declaration.auftragsnummer,
+            'patient_name': declaration.patient_name,
+            'herstellungsdatum': declaration.herstellungsdatum.isoformat(),
+        }
+        data.update(header)
+        data.update(formset_data('product_works', product_works, initial=declaration.product_works.count()))
+        data.update(formset_data('materials', items, initial=declaration.items.count()))
+        return data
+
+
+class LineItemSyncTests(DeclarationTestCase):
+
+    def test_deleting_middle_row_keeps_other_row_ids(self):
+        declaration = self.create_declaration(product_works=5, items=3)
+        works = list(declaration.product_works.order_by('line_number'))
+        items = list(declaration.items.order_by('line_number'))
+
+        data = self.edit_data(declaration)
+        data['product_works-1-DELETE'] = 'on'
+        data['materials-1-DELETE'] = 'on'
+        response = self.client.post(reverse('declaration_edit', args=[declaration.pk]), data)
+        self.assertEqual(response.status_code, 302)
+
+        remaining = list(declaration.product_works.order_by('line_number'))
+        self.assertEqual([pw.pk for pw in remaining], [works[0].pk, works[2].pk, works[3].pk, works[4].pk])
+        self.assertEqual([pw.line_number for pw in remaining], [1, 2, 3, 4])
+        self.assertEqual(
+            [pw.produktbezeichnung_arbeit for pw in remaining],
+            ['Krone 1', 'Krone 3', 'Krone 4', 'Krone 5']
+        )
+        self.assertFalse(ProductWork.objects.filter(pk=works[1].pk).exists())
+
+        remaining_items = list(declaration.items.order_by('line_number'))
+        self.assertEqual([item.pk for item in remaining_items], [items[0].pk, items[2].pk])
+        self.assertEqual([item.material_lot_no for item in remaining_items], ['LOT1', 'LOT3'])
+
+    def test_row_without_id_is_matched_by_content(self):
+        declaration = self.create_declaration(product_works=2, items=1)
+        works = list(declaration.product_works.order_by('line_number'))
+
+        data = self.edit_data(declaration)
+        data['product_works-1-id'] = ''
+        self.client.post(reverse('declaration_edit', args=[declaration.pk]), data)
+
+        self.assertEqual(
+            list(declaration.product_works.order_by('line_number').values_list('pk', flat=True)),
+            [works[0].pk, works[1].pk]
+        )
+
+
+class DeclarationCounterTests(DeclarationTestCase):
+
+    def test_numbers_are_sequential_per_praxis_and_year(self):
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        year = timezone.localdate().year
+
+        self.assertEqual(DeclarationCounter.allocate(self.user, count=3), (year, 1))
+        self.assertEqual(DeclarationCounter.next_number(self.user), DeclarationCounter.format_number(year, 4))
+        self.assertEqual(DeclarationCounter.next_number(other), DeclarationCounter.format_number(year, 1))
+        self.assertEqual(DeclarationCounter.allocate(self.user, year=year + 1), (year + 1, 1))
+        self.assertEqual(self.create_declaration().declaration_number, DeclarationCounter.format_number(year, 5))
+
+    def test_failed_insert_does_not_consume_a_number(self):
+        self.create_declaration()
+        with self.assertRaises(IntegrityError):
+            Declaration.objects.create(praxis=self.user, patient_name='Muster, Max', herstellungsdatum=None)
+        self.assertEqual(DeclarationCounter.objects.get(praxis=self.user).last_value, 1)
+        self.assertEqual(self.create_declaration().declaration_number.rsplit('-', 1)[1], '0002')
+
+
+class DeclarationEditTests(DeclarationTestCase):
+
+    def test_header_edit_keeps_pdf_written_by_worker(self):
+        declaration = self.create_declaration()
+        data = self.edit_data(declaration, patient_name='Muster, Erika')
+        # View declaration'ı okuduktan sonra worker yeni PDF'i kaydetmiş gibi
+        original_save = Declaration.save
+
+        def save_after_worker(instance, *args, **kwargs):
+            Declaration.objects.filter(pk=instance.pk).update(
+                pdf_url='https://example.com/new.pdf', pdf_content_hash='new-hash'
+            )
+            return original_save(instance, *args, **kwargs)
+
+        with mock.patch.object(Declaration, 'save', save_after_worker):
+            self.client.post(reverse('declaration_edit', args=[declaration.pk]), data)
+
+        declaration.refresh_from_db()
+        self.assertEqual(declaration.patient_name, 'Muster, Erika')
+        self.assertEqual(declaration.pdf_url, 'https://example.com/new.pdf')
+        self.assertEqual(declaration.pdf_content_hash, 'new-hash')
+
+
+class DeclarationQueryBudgetTests(DeclarationTestCase):
+    """
+    Create / edit'in SQL sorgu sayısı satır sayısından bağımsızdır (toplu
+    INSERT / UPDATE). Sayılar: session + user (2), declaration ve satırlar,
+    PDF işi ve transaction savepoint'leri.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Isınmış durum: profil ve katalog cache'te, bu yılın numara sayacı mevcut
+        get_cached_profile(self.user.pk)
+        get_material_catalog(self.user.pk)
+        DeclarationCounter.objects.create(praxis=self.user, year=timezone.localdate().year, last_value=0)
+
+    def create_data(self, rows):
+        data = {'auftragsnummer': 'A-9', 'patient_name': 'Muster, Erika', 'herstellungsdatum': '2026-01-02'}
+        data.update(formset_data('product_works', [
+            {'produktbezeichnung_arbeit': f'Krone {n}', 'zahnnummer': str(11 + n), 'zahnfarbe': 'A2'}
+            for n in range(rows)
+        ]))
+        data.update(formset_data('materials', [
+            {'material': f'Material {n}', 'firma': 'Firma', 'bestandteile': 'ZrO2',
+             'material_lot_no': f'LOT{n}', 'ce_status': 'Ja'}
+            for n in range(rows)
+        ]))
+        return data
+
+    def test_create_query_budget(self):
+        for rows in (1, 10):
+            with self.subTest(rows=rows):
+                with self.assertNumQueries(17):
+                    response = self.client.post(reverse('declaration_create'), self.create_data(rows))
+                self.assertEqual(response.status_code, 302)
+                declaration = Declaration.objects.get(pk=response.url.rstrip('/').split('/')[-1])
+                self.assertEqual(declaration.product_works.count(), rows)
+                self.assertEqual(declaration.items.count(), rows)
+                self.assertTrue(PdfJob.objects.filter(declaration=declaration).exists())
+
+    def test_edit_query_budget(self):
+        for rows in (1, 10):
+            with self.subTest(rows=rows):
+                declaration = self.create_declaration(product_works=rows, items=rows)
+                data = self.edit_data(declaration, patient_name='Muster, Erika')
+                for key in data:
+                    if key.endswith('-zahnfarbe'):
+                        data[key] = 'B1'
+                with self.assertNumQueries(15):
+                    response = self.client.post(reverse('declaration_edit', args=[declaration.pk]), data)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(
+                    set(declaration.product_works.values_list('zahnfarbe', flat=True)), {'B1'}
+                )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN SQLite\'e özgü')
+class KeysetPaginationTests(DeclarationTestCase):
+
+    def walk(self, url_name, context_key, query='page_size=2'):
+        """Sonraki sayfa linklerini takip et: [[pk, ...], ...]"""
+        pages = []
+        while query is not None:
+            page = self.client.get(f'{reverse(url_name)}?{query}').context[context_key]
+            pages.append([obj.pk for obj in page])
+            query = page.next_query if page.has_next else None
+        return pages
+
+    def test_declaration_list_pages_are_stable(self):
+        ids = [self.create_declaration().pk for _ in range(5)]
+        # Aynı created_at: sıra id ile belirlenir
+        Declaration.objects.update(created_at=timezone.now())
+        newest_first = ids[::-1]
+
+        first = self.client.get(reverse('declaration_list') + '?page_size=2').context['page']
+        self.assertEqual([d.pk for d in first], newest_first[:2])
+        # Yeni kayıt sonraki sayfayı kaydırmaz
+        self.create_declaration()
+        second = self.client.get(reverse('declaration_list') + '?' + first.next_query).context['page']
+        self.assertEqual([d.pk for d in second], newest_first[2:4])
+        third = self.client.get(reverse('declaration_list') + '?' + second.next_query).context['page']
+        self.assertEqual([d.pk for d in third], newest_first[4:])
+        self.assertFalse(third.has_next)
+
+        previous = self.client.get(reverse('declaration_list') + '?' + third.previous_query).context['page']
+        self.assertEqual([d.pk for d in previous], newest_first[2:4])
+
+    def test_archive_list_puts_undated_documents_last(self):
+        dates = [date(2026, 3, 1), None, date(2026, 1, 1), None, date(2026, 2, 1)]
+        documents = [
+            ArchiveDocument.objects.create(user=self.user, title=f'Dok {n}', file_name=f'{n}.pdf', document_date=document_date)
+            for n, document_date in enumerate(dates)
+        ]
+        expected = [documents[0].pk, documents[4].pk, documents[2].pk, documents[3].pk, documents[1].pk]
+        self.assertEqual(self.walk('archive_list', 'documents'), [expected[:2], expected[2:4], expected[4:]])
+
+    def test_invalid_cursor_shows_first_page(self):
+        ids = [self.create_declaration().pk for _ in range(3)]
+        page = self.client.get(reverse('declaration_list') + '?page_size=2&after=kaputt').context['page']
+        self.assertEqual([d.pk for d in page], ids[:0:-1])
+
+
+class ListIndexTests(DeclarationTestCase):
+    """Liste sorguları 0018_composite_indexes'teki index'leri kullanır (sıralama için geçici B-tree yok)"""
+
+    def query_plan(self, url_name, table):
+        """View'ın `table` üzerindeki ilk SELECT'inin sorgu planı"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        sql = next(
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, plan, index_name):
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_declaration_list_uses_praxis_created_index(self):
+        self.create_declaration()
+        self.assertUsesIndex(self.query_plan('declaration_list', 'declarations_declaration'), 'decl_praxis_created_idx')
+
+    def test_archive_list_uses_user_date_index(self):
+        self.assertUsesIndex(self.query_plan('archive_list', 'declarations_archivedocument'), 'archive_user_date_idx')
+
+    def test_material_catalog_uses_partial_index(self):
+        self.assertUsesIndex(
+            self.query_plan('declaration_create', 'declarations_materialproduct'), 'matprod_user_active_name_idx'
+        )
+
+
+class PasswordResetEmailTests(DeclarationTestCase):
+
+    def test_repeated_request_queues_one_email(self):
+        # Token zaman damgası içerdiği için her istekte URL farklıdır
+        PasswordResetEmailService.send_password_reset_email(self.user, 'https://example.com/reset/a/1/')
+        PasswordResetEmailService.send_password_reset_email(self.user, 'https://example.com/reset/a/2/')
+        self.assertEqual(OutboundEmail.objects.filter(idempotency_key__startswith='password-reset:').count(), 1)
+
+    def test_key_changes_with_password(self):
+        key = PasswordResetEmailService.idempotency_key(self.user, now=0)
+        self.assertEqual(key, PasswordResetEmailService.idempotency_key(self.user, now=10))
+        self.user.set_password('changed')
+        self.assertNotEqual(key, PasswordResetEmailService.idempotency_key(self.user, now=10))
+
+
+def _work(produkt, zahnnummer, zahnfarbe):
+    return {'produktbezeichnung_arbeit': produkt, 'zahnnummer': zahnnummer, 'zahnfarbe': zahnfarbe}
+
+
+def _material(material, firma, lot, ce_status='yes'):
+    return {'material': material, 'firma': firma, 'bestandteile': '', 'material_lot_no': lot, 'ce_status': ce_status}
+
+
+class ReferenceParserBaselineTests(SimpleTestCase):
+    """
+    Profil tabanlı parser, eski tek fonksiyonluk parser ile aynı sonucu verir.
+    Tek bilinçli fark: | tablosunun ilk sütunu satır başında başlar (eski
+    parser önceki satırları da ürün adına katıyordu).
+    """
+
+    SAMPLES = [
+        (
+            'dentsply_sirona',
+            'Erstellungsdatum: 01.01.2026 22:27:05\n'
+            'ID Zahnarzt Patient Techniker Elementtyp Zahnnummer Produktion\n'
+            '1Sanli,Seda Fischer,Christine Unknown Krone 24 Hoch\n'
+            'Lot-Nr.: 20260101-222705\n'
+            'Hersteller: DentsplySirona\n'
+            'Materialname: CERECMTLZirconia Materialklasse ZrO2\n'
+            'Materialfarbe: A2 HT\n',
+            {
+                'auftragsnummer': '', 'patient_name': 'Fischer, Christine', 'herstellungsdatum': '2026-01-01',
+                'product_works': [_work('Krone', '24', 'A2')],
+                'materials': [_material('CERECMTL Zirconia', 'Dentsply Sirona', '20260101-222705')],
+            },
+        ),
+        (
+            # | satırları Dentsply iş tablosu satırından önce gelir
+            'dentsply_sirona',
+            'Erstellungsdatum: 01.01.2026 22:27:05\n'
+            '1Sanli,Seda Fischer,Christine Unknown Krone 24 Hoch\n'
+            'Brücke | 25, 26 | A3\n'
+            'Materialname: CERECMTLZirconia\n',
+            {
+                'auftragsnummer': '', 'patient_name': 'Fischer, Christine', 'herstellungsdatum': '2026-01-01',
+                'product_works': [_work('Brücke', '25, 26', 'A3')],
+                'materials': [_material('CERECMTL Zirconia', 'Ivoclar', '')],
+            },
+        ),
+        (
+            # LOT-Nummer / Lot-Nr. yoksa tarih-LOT'un son 6 hanesi
+            'ivoclar',
+            'Ivoclar Vivadent AG\n'
+            'Patientenname: Fischer, Christine\n'
+            'Herstellungsdatum: 05.03.2026\n'
+            'Krone | 24 | A2\n'
+            'Materialname: IPS e.max CAD\n'
+            'Charge 20260305-104512\n',
+            {
+                'auftragsnummer': '', 'patient_name': 'Fischer, Christine', 'herstellungsdatum': '2026-03-05',
+                'product_works': [_work('Krone', '24', 'A2')],
+                'materials': [_material('IPS e.max CAD', 'Ivoclar', '104512')],
+            },
+        ),
+        (
+            # Materialname bloğu yoksa CE / Lot satırları
+            'ivoclar',
+            'Ivoclar Vivadent AG\n'
+            'Patientenname: Fischer, Christine\n'
+            'Krone | 24 | A2\n'
+            'IPS e.max Press  Ivoclar Vivadent  Lot: Z123  CE\n',
+            {
+                'auftragsnummer': '', 'patient_name': 'Fischer, Christine', 'herstellungsdatum': '',
+                'product_works': [_work('Krone', '24', 'A2')],
+                'materials': [_material('IPS e.max Press', 'Ivoclar Vivadent', 'Z123')],
+            },
+        ),
+        (
+            'generic',
+            'Auftragsnummer: 99-1\n'
+            'Patient: Müller, Max\n'
+            'Herstellungsdatum: 7.7.2025\n'
+            'Zirconia Blank  Firma XY  Lot: AB-12  CE\n'
+            'Keramik  Hersteller GmbH  LOT 777\n',
+            {
+                'auftragsnummer': '99-1', 'patient_name': 'Müller, Max', 'herstellungsdatum': '2025-07-07',
+                'product_works': [],
+                # "Keramik" satırında CE / Lot / Zirconi yok (LOT büyük harf)
+                'materials': [_material('Zirconia Blank', 'Firma XY', 'AB-12')],
+            },
+        ),
+    ]
+
+    def test_profiles_match_baseline_parser(self):
+        for profile_name, text, expected in self.SAMPLES:
+            with self.subTest(text=text.splitlines()[1]):
+                self.assertEqual(detect_profile(text).name, profile_name)
+                self.assertEqual(parse_reference_text(text), expected)
+
+
+
+class ReferenceParserPagesTests(SimpleTestCase):
+
+    IVOCLAR_PAGES = [
+        'Ivoclar Vivadent AG\nPatientenname: Fischer, Christine\nHerstellungsdatum: 05.03.2026\n',
+        'Krone | 24 | A2\nBrücke | 25, 26 | A3\n',
+        'Materialname: IPS e.max Press\nLOT-Nummer: Z12345\n',
+        'Anhang\n',
+    ]
+
+    def test_pages_match_full_text_parse_and_stop_early(self):
+        pages = iter(self.IVOCLAR_PAGES)
+        result, pages_read = parse_reference_pages(pages)
+        self.assertEqual(pages_read, 3)
+        self.assertEqual(result, parse_reference_text(''.join(self.IVOCLAR_PAGES[:3])))
+        self.assertEqual(next(pages), 'Anhang\n')
+
+    def test_each_page_is_scanned_once(self):
+        # Ivoclar profili: Materialname olmadığı için her sayfadan sonra sonuç kontrol edilir
+        pages = ['Ivoclar Vivadent AG\n'] + ['Seite {}\nKrone | {} | A2\n'.format(n, n) for n in range(1, 20)]
+        with mock.patch.object(reference_parser, 'scan_fields', wraps=reference_parser.scan_fields) as scan, \
+                mock.patch.object(reference_parser, '_pipe_rows', wraps=reference_parser._pipe_rows) as pipe_rows:
+            result, pages_read = parse_reference_pages(iter(pages))
+        self.assertEqual(pages_read, 20)
+        self.assertEqual([c.args[0] for c in scan.call_args_list], pages)
+        self.assertEqual([c.args[0] for c in pipe_rows.call_args_list], pages)
+        self.assertEqual(len(result['product_works']), 19)
+
+    def test_profile_is_chosen_on_first_matching_page(self):
+        pages = [
+            'Ivoclar Vivadent AG\nPatientenname: Fischer, Christine\n',
+            'Erstellungsdatum: 01.01.2026 22:27:05\n1Sanli,Seda Meier,Hans Unknown Krone 24 Hoch\n',
+        ]
+        result, _ = parse_reference_pages(iter(pages))
+        # Tüm metinde Dentsply işaretleri de var; profil ilk sayfada Ivoclar olarak seçildi
+        self.assertEqual(detect_profile(''.join(pages)).name, 'dentsply_sirona')
+        self.assertEqual(result['patient_name'], 'Fischer, Christine')
+
+
+@override_settings(BULK_IMPORT_MAX_FILES=10, BULK_IMPORT_MAX_TOTAL_BYTES=250)
+class BulkImportLimitTests(SimpleTestCase):
+
+    def test_files_over_total_size_are_rejected_unread(self):
+        files = [(f'{n}.pdf', io.BytesIO(b'%PDF' + b'x' * 96)) for n in range(3)]
+        pdfs, results = collect_pdf_files(files)
+        self.assertEqual([name for name, _ in pdfs], ['0.pdf', '1.pdf'])
+        self.assertEqual([(r.file_name, r.status) for r in results], [('2.pdf', STATUS_ERROR)])
+        self.assertIn('Gesamtgröße', results[0].message)
+        self.assertEqual(files[2][1].tell(), 0)
+
+    def test_zip_members_count_towards_total_size(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for n in range(3):
+                zf.writestr(f'{n}.pdf', b'%PDF' + b'x' * 96)
+        archive.seek(0)
+        pdfs, results = collect_pdf_files([('ref.pdf', io.BytesIO(b'%PDF' + b'x' * 96)), ('ref.zip', archive)])
+        self.assertEqual([name for name, _ in pdfs], ['ref.pdf', 'ref.zip/0.pdf'])
+        self.assertEqual([r.file_name for r in results], ['ref.zip/1.pdf', 'ref.zip/2.pdf'])
+
+
+def _parsed_reference(auftragsnummer, patient_name='Muster, Max'):
+    """parse_declaration_pdf sonucu"""
+    return {
+        'auftragsnummer': auftragsnummer, 'patient_name': patient_name, 'herstellungsdatum': '2026-01-02',
+        'product_works': [{'produktbezeichnung_arbeit': 'Krone', 'zahnnummer': '11', 'zahnfarbe': 'A2'}],
+        'materials': [{'material': 'Zirkon', 'firma': 'Firma', 'bestandteile': 'ZrO2', 'material_lot_no': 'L1', 'ce_status': 'yes'}],
+    }
+
+
+class BulkImportDraftTests(DeclarationTestCase):
+
+    def import_drafts(self, *parsed):
+        files = [(f'{n}.pdf', io.BytesIO(b'%PDF-' + str(n).encode())) for n in range(len(parsed))]
+        with mock.patch('declarations.services.bulk_import.parse_pdfs', return_value=list(parsed)):
+            results = import_reference_pdfs(self.user, files)
+        self.assertEqual([r.status for r in results], [STATUS_CREATED] * len(parsed))
+        return [r.declaration for r in results]
+
+    def test_imported_drafts_are_unnumbered_unlisted_and_not_rendered(self):
+        self.create_declaration()
+        drafts = self.import_drafts(_parsed_reference('A-2'), _parsed_reference('A-3'))
+
+        for draft in Declaration.objects.filter(pk__in=[d.pk for d in drafts]):
+            self.assertTrue(draft.is_draft)
+            self.assertIsNone(draft.declaration_number)
+        self.assertFalse(PdfJob.objects.exists())
+
+        response = self.client.get(reverse('declaration_list'))
+        self.assertEqual([d.auftragsnummer for d in response.context['declarations']], ['A-1'])
+        self.assertEqual(self.client.get(reverse('dashboard')).context['total_declarations'], 1)
+        self.assertEqual(len(self.client.get(reverse('declaration_drafts')).context['drafts']), 2)
+        self.assertRedirects(
+            self.client.get(reverse('declaration_detail', args=[drafts[0].pk])),
+            reverse('declaration_edit', args=[drafts[0].pk]), fetch_redirect_response=False
+        )
+
+    def test_finalize_numbers_drafts_and_enqueues_renders_in_one_batch(self):
+        drafts = self.import_drafts(_parsed_reference('A-2'), _parsed_reference(''), _parsed_reference('A-3'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('declaration_drafts'), {'declarations': [d.pk for d in drafts]})
+        self.assertRedirects(response, reverse('declaration_drafts'), fetch_redirect_response=False)
+
+        year = timezone.localdate().year
+        numbers = dict(Declaration.objects.values_list('auftragsnummer', 'declaration_number'))
+        self.assertEqual(numbers, {
+            'A-2': DeclarationCounter.format_number(year, 1),
+            '': None,
+            'A-3': DeclarationCounter.format_number(year, 2),
+        })
+        self.assertEqual(
+            sorted(PdfJob.objects.values_list('declaration__auftragsnummer', flat=True)), ['A-2', 'A-3']
+        )
+        job_inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "declarations_pdfjob"')]
+        self.assertEqual(len(job_inserts), 1)
+        # Auftragsnummer'sız taslak taslak kalır; tekrar fertigstellen numara harcamaz
+        self.assertEqual(finalize_drafts(self.user, [d.pk for d in drafts]), [])
+        self.assertEqual(DeclarationCounter.objects.get(praxis=self.user).last_value, 2)
+
+    def test_draft_edit_renders_only_when_finalized(self):
+        draft, = self.import_drafts(_parsed_reference('A-2'))
+        draft.refresh_from_db()
+
+        response = self.client.post(reverse('declaration_edit', args=[draft.pk]), self.edit_data(draft, patient_name='Neu'))
+        self.assertRedirects(response, reverse('declaration_drafts'), fetch_redirect_response=False)
+        draft.refresh_from_db()
+        self.assertTrue(draft.is_draft)
+        self.assertEqual(draft.patient_name, 'Neu')
+        self.assertFalse(PdfJob.objects.exists())
+
+        response = self.client.post(reverse('declaration_edit', args=[draft.pk]), {**self.edit_data(draft), 'finalize': '1'})
+        self.assertRedirects(response, reverse('declaration_detail', args=[draft.pk]), fetch_redirect_response=False)
+        draft.refresh_from_db()
+        self.assertFalse(draft.is_draft)
+        self.assertTrue(draft.declaration_number)
+        self.assertEqual(PdfJob.objects.filter(declaration=draft).count(), 1)
+
+
+class ImportQueueTests(DeclarationTestCase):
+
+    def upload(self, *names):
+        files = [SimpleUploadedFile(name, b'%PDF-' + name.encode(), content_type='application/pdf') for name in names]
+        return self.client.post(reverse('declaration_bulk_import'), {'files': files})
+
+    def run_next_job(self, parsed):
+        job = import_queue.claim_next_job('test-worker')
+        with mock.patch('declarations.services.bulk_import.parse_pdfs', return_value=parsed):
+            return import_queue.run_job(job)
+
+    def test_upload_is_queued_without_parsing(self):
+        with mock.patch('declarations.services.bulk_import.parse_pdfs') as parse_pdfs:
+            response = self.upload('a.pdf', 'b.pdf')
+        job = ImportJob.objects.get()
+        self.assertRedirects(response, reverse('declaration_import_job', args=[job.pk]), fetch_redirect_response=False)
+        parse_pdfs.assert_not_called()
+        self.assertEqual(job.status, ImportJob.STATUS_PENDING)
+        self.assertEqual(list(job.files.values_list('file_name', flat=True)), ['a.pdf', 'b.pdf'])
+        self.assertFalse(Declaration.objects.exists())
+        self.assertContains(self.client.get(reverse('declaration_bulk_import')), reverse('declaration_import_job', args=[job.pk]))
+        self.assertContains(self.client.get(reverse('declaration_import_job', args=[job.pk])), 'aktualisiert sich automatisch')
+
+    @override_settings(BULK_IMPORT_MAX_FILES=1)
+    def test_request_batch_is_bounded(self):
+        response = self.upload('a.pdf', 'b.pdf')
+        self.assertRedirects(response, reverse('declaration_bulk_import'), fetch_redirect_response=False)
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_worker_creates_drafts_and_reports_per_file_results(self):
+        self.upload('a.pdf', 'b.pdf')
+        self.assertTrue(self.run_next_job([_parsed_reference('A-2'), {'error': 'Die PDF-Datei ist beschädigt'}]))
+
+        job = ImportJob.objects.get()
+        draft = Declaration.objects.get()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(
+            [(r['file'], r['status'], r['declaration_id']) for r in job.results],
+            [('a.pdf', STATUS_CREATED, draft.pk), ('b.pdf', STATUS_ERROR, None)]
+        )
+        self.assertTrue(draft.is_draft)
+        self.assertFalse(job.files.exists())
+        response = self.client.get(reverse('declaration_import_job', args=[job.pk]))
+        self.assertContains(response, 'Die PDF-Datei ist beschädigt')
+        self.assertEqual(response.context['created'], 1)
+
+    def test_failed_job_is_retried_then_failed(self):
+        self.upload('a.pdf')
+        with mock.patch('declarations.services.import_queue.create_drafts', side_effect=DatabaseError('locked')):
+            self.assertFalse(self.run_next_job([_parsed_reference('A-2')]))
+            job = ImportJob.objects.get()
+            self.assertEqual((job.status, job.attempts), (ImportJob.STATUS_PENDING, 1))
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertTrue(job.files.exists())
+
+            ImportJob.objects.update(run_after=timezone.now(), attempts=job.max_attempts - 1)
+            self.assertFalse(self.run_next_job([_parsed_reference('A-2')]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertIn('locked', job.last_error)
+        self.assertFalse(job.files.exists())
+        self.assertFalse(Declaration.objects.exists())
+
+    def test_drafts_are_rolled_back_when_job_was_taken_over(self):
+        self.upload('a.pdf')
+        job = import_queue.claim_next_job('test-worker')
+        # Kilit süresi doldu, iş başka bir worker'a geçti
+        ImportJob.objects.update(locked_by='other-worker')
+        with mock.patch('declarations.services.bulk_import.parse_pdfs', return_value=[_parsed_reference('A-2')]):
+            self.assertFalse(import_queue.run_job(job))
+        self.assertFalse(Declaration.objects.exists())
+        self.assertEqual(ImportJob.objects.get().locked_by, 'other-worker')
+
+
+class ProfileCacheTests(DeclarationTestCase):
+
+    def test_secrets_are_not_cached(self):
+        HerstellerProfile.objects.filter(user=self.user).update(verification_token='secret-token')
+        profile = get_cached_profile(self.user.pk)
+        cached = cache.get(CACHE_KEY.format(user_id=self.user.pk))
+        self.assertNotIn('secret-token', cached)
+        self.assertTrue(profile.email_verified)
+        self.assertEqual(profile.firma_name, 'Labor')
+        # Cache'lenmeyen alan deferred: DB'den okunur
+        with self.assertNumQueries(1):
+            self.assertEqual(profile.verification_token, 'secret-token')
+
+    def test_cached_profile_serves_flags_without_queries(self):
+        get_cached_profile(self.user.pk)
+        with self.assertNumQueries(0):
+            profile = get_cached_profile(self.user.pk)
+            self.assertTrue(profile.profile_completed)
+
+
+class GenerateDeclarationPdfTests(DeclarationTestCase):
+
+    def test_render_is_timed_once(self):
+        declaration = self.create_declaration()
+        storage = mock.Mock()
+        storage.put.return_value = {'key': 'k', 'url': 'https://example.com/k', 'timings': {'upload': 5.0}}
+        with mock.patch.object(declaration_utils, 'render_pdf_bytes', return_value=b'%PDF-1.7'), \
+                mock.patch.object(declaration_utils, 'get_document_storage', return_value=storage), \
+                mock.patch.object(declaration_utils, 'timed', wraps=declaration_utils.timed) as timed:
+            result = declaration_utils.generate_declaration_pdf(declaration)
+
+        self.assertEqual([c.args for c in timed.call_args_list], [('render',)])
+        self.assertEqual(set(result['timings']), {'render', 'upload'})
+        self.assertGreaterEqual(result['timings']['render'], 0)
+        self.assertEqual(result['pdf_url'], 'https://example.com/k')
+
+
+class RenderCacheTests(DeclarationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.declaration = self.create_declaration()
+        Declaration.objects.filter(pk=self.declaration.pk).update(
+            pdf_url='https://example.com/old.pdf', pdf_content_hash=pdf_cache.compute_render_hash(self.declaration)
+        )
+        self.declaration.refresh_from_db()
+
+    def run_pdf_job(self):
+        pdf_queue.enqueue_pdf_job(self.declaration)
+        job = pdf_queue.claim_next_job('test-worker')
+        with mock.patch.object(declaration_utils, 'generate_declaration_pdf',
+                               return_value={'pdf_url': 'https://example.com/new.pdf'}) as generate, \
+                mock.patch.object(declaration_utils, 'delete_document') as delete_document:
+            self.assertTrue(pdf_queue.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, PdfJob.STATUS_DONE)
+        return generate, delete_document
+
+    def test_unchanged_declaration_is_not_rendered(self):
+        generate, delete_document = self.run_pdf_job()
+        generate.assert_not_called()
+        delete_document.assert_not_called()
+        self.declaration.refresh_from_db()
+        self.assertEqual(self.declaration.pdf_url, 'https://example.com/old.pdf')
+
+    def test_changed_line_item_is_rendered(self):
+        self.declaration.items.update(material_lot_no='LOT-NEU')
+        generate, delete_document = self.run_pdf_job()
+        generate.assert_called_once()
+        delete_document.assert_called_once_with('https://example.com/old.pdf')
+        self.declaration.refresh_from_db()
+        self.assertEqual(self.declaration.pdf_url, 'https://example.com/new.pdf')
+        self.assertEqual(self.declaration.pdf_content_hash, pdf_cache.compute_render_hash(self.declaration))
+
+    def test_edit_without_changes_does_not_enqueue(self):
+        url = reverse('declaration_edit', args=[self.declaration.pk])
+        self.client.post(url, self.edit_data(self.declaration))
+        self.assertFalse(PdfJob.objects.exists())
+
+        self.client.post(url, self.edit_data(self.declaration, patient_name='Neu, Max'))
+        self.assertEqual(PdfJob.objects.filter(declaration=self.declaration).count(), 1)
+
+
+class DriveTestCase(DeclarationTestCase):
+    """Google Drive service'i mock'lanmış, klasör cache'i boş"""
+
+    def setUp(self):
+        super().setUp()
+        google_drive._folder_cache.clear()
+        self.service = mock.MagicMock()
+        self.files = self.service.files.return_value
+        self.files.list.return_value.execute.return_value = {'files': []}
+        self.files.create.side_effect = self.drive_create
+        patcher = mock.patch.object(google_drive, 'get_drive_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def drive_create(self, body, media_body=None, fields=None):
+        """files().create: id dosya / klasör adından türetilir"""
+        request = mock.Mock()
+        request.execute.return_value = {
+            'id': f"id-{body['name']}", 'name': body['name'],
+            'webViewLink': f"https://drive.google.com/file/d/id-{body['name']}/view",
+        }
+        return request
+
+    def created_names(self):
+        return [c.kwargs['body']['name'] for c in self.files.create.call_args_list]
+
+
+@override_settings(DOCUMENT_STORAGE_BACKEND='declarations.storage.GoogleDriveStorage')
+class DrivePdfUploadTests(DriveTestCase):
+
+    def test_pdf_is_uploaded_from_memory(self):
+        declaration = self.create_declaration()
+        with mock.patch.object(declaration_utils, 'render_pdf_bytes', return_value=b'%PDF-1.7 test'):
+            result = declaration_utils.generate_declaration_pdf(declaration)
+
+        self.assertEqual(result['pdf_url'], f'https://drive.google.com/file/d/id-{declaration.declaration_number}.pdf/view')
+        media = self.files.create.call_args.kwargs['media_body']
+        self.assertIsInstance(media, MediaIoBaseUpload)
+        self.assertFalse(media.resumable())
+        self.assertEqual(media.getbytes(0, media.size()), b'%PDF-1.7 test')
+        self.assertFalse((settings.BASE_DIR / 'temp_pdfs').exists())
+
+
+@override_settings(
+    DOCUMENT_STORAGE_BACKEND='declarations.storage.GoogleDriveStorage', DRIVE_UPLOAD_CHUNK_SIZE=300 * 1024
+)
+class DriveArchiveUploadTests(DriveTestCase):
+
+    def test_archive_upload_is_streamed_in_chunks(self):
+        content = b'%PDF-1.7 ' + b'x' * (600 * 1024)
+        uploads = []
+
+        def create(body, media_body=None, fields=None):
+            if media_body is not None:
+                # Upload handler'ın dosyası view dönünce kapanır: içerik burada okunur
+                uploads.append((media_body.resumable(), media_body.chunksize(), media_body.getbytes(0, media_body.size())))
+            return self.drive_create(body)
+        self.files.create.side_effect = create
+
+        response = self.client.post(reverse('archive_upload'), {
+            'title': 'Scan', 'category': 'other', 'file': SimpleUploadedFile('scan.pdf', content, content_type='application/pdf')
+        })
+        self.assertRedirects(response, reverse('archive_list'), fetch_redirect_response=False)
+
+        # Resumable upload, 256 KB'a hizalanmış parçalar; ara dosya kopyası yok
+        self.assertEqual(uploads, [(True, 256 * 1024, content)])
+        self.assertFalse((settings.BASE_DIR / 'temp_pdfs').exists())
+        document = ArchiveDocument.objects.get(user=self.user)
+        self.assertEqual(document.drive_file_id, 'id-scan.pdf')
+
+
+class DriveClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.creds = mock.Mock(token='token', expiry=datetime.utcnow() + timedelta(hours=1))
+        patchers = [
+            mock.patch.object(google_drive, '_credentials', None),
+            mock.patch.object(google_drive, '_thread_local', threading.local()),
+            mock.patch.object(google_drive, '_load_credentials', return_value=self.creds),
+            mock.patch.object(google_drive, '_save_credentials'),
+            mock.patch.object(google_drive, 'build_from_document', side_effect=lambda doc, credentials: mock.Mock()),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_service_is_built_once_per_thread(self):
+        service = google_drive.get_drive_service()
+        self.assertIs(google_drive.get_drive_service(), service)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(google_drive.get_drive_service()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], service)
+
+        google_drive._load_credentials.assert_called_once()
+        self.assertEqual(google_drive.build_from_document.call_count, 2)
+        # Statik discovery dokümanı: HTTP isteği yok
+        document = google_drive.build_from_document.call_args.args[0]
+        self.assertEqual((document['name'], document['version']), ('drive', 'v3'))
+
+    def test_token_is_refreshed_only_near_expiry(self):
+        service = google_drive.get_drive_service()
+        self.creds.refresh.assert_not_called()
+
+        self.creds.expiry = datetime.utcnow() + timedelta(minutes=1)
+        self.creds.refresh.side_effect = lambda request: setattr(self.creds, 'expiry', datetime.utcnow() + timedelta(hours=1))
+        self.assertIs(google_drive.get_drive_service(), service)
+        self.assertIs(google_drive.get_drive_service(), service)
+        self.creds.refresh.assert_called_once()
+        google_drive._save_credentials.assert_called_once_with(self.creds)
+        google_drive._load_credentials.assert_called_once()
+
+
+def _http_error(status):
+    return HttpError(httplib2.Response({'status': str(status)}), b'error')
+
+
+class DriveUploadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.service = mock.MagicMock()
+        self.files = self.service.files.return_value
+        self.files.create.return_value.execute.return_value = {
+            'id': 'file-1', 'name': 'a.pdf', 'webViewLink': 'https://drive.google.com/file/d/file-1/view'
+        }
+        self.batch = self.service.new_batch_http_request.return_value
+
+    def test_upload_is_one_create_and_one_permission_batch(self):
+        info = google_drive.upload_bytes(self.service, b'%PDF', 'folder-1', 'a.pdf', mimetype='application/pdf')
+
+        self.assertEqual(info['view'], 'https://drive.google.com/file/d/file-1/view')
+        self.assertEqual(info['download'], 'https://drive.google.com/uc?export=download&id=file-1')
+        self.assertEqual(set(info['timings']), {'create', 'permission'})
+        create = self.files.create.call_args.kwargs
+        self.assertEqual((create['body'], create['fields']), ({'name': 'a.pdf', 'parents': ['folder-1']}, google_drive.FILE_LINK_FIELDS))
+        self.files.get.assert_not_called()
+        # İzin tek tek execute edilmez, tek batch isteğiyle gider
+        self.service.permissions.return_value.create.assert_called_once_with(
+            fileId='file-1', body=google_drive.PUBLIC_READ_PERMISSION, fields='id'
+        )
+        self.service.permissions.return_value.create.return_value.execute.assert_not_called()
+        self.batch.add.assert_called_once()
+        self.batch.execute.assert_called_once()
+
+    def test_permission_error_does_not_fail_upload(self):
+        def execute():
+            callback = self.service.new_batch_http_request.call_args.kwargs['callback']
+            callback('file-1', None, _http_error(403))
+        self.batch.execute.side_effect = execute
+
+        with self.assertLogs(google_drive.logger, 'WARNING'):
+            info = google_drive.upload_bytes(self.service, b'%PDF', 'folder-1', 'a.pdf')
+        self.assertEqual(info['id'], 'file-1')
+
+
+class DriveFolderCacheTests(DriveTestCase):
+    PATH = ['Zahnovia', 'Declarations']
+
+    def test_folder_ids_are_cached_in_memory_and_db(self):
+        self.assertEqual(google_drive.get_or_create_folder_path(self.service, self.PATH), 'id-Declarations')
+        self.assertEqual(self.created_names(), ['Zahnovia', 'Declarations'])
+        self.assertEqual(
+            dict(DriveFolder.objects.values_list('path', 'folder_id')),
+            {'Zahnovia': 'id-Zahnovia', 'Zahnovia/Declarations': 'id-Declarations'}
+        )
+
+        self.service.reset_mock()
+        with self.assertNumQueries(0):
+            self.assertEqual(google_drive.get_or_create_folder_path(self.service, self.PATH), 'id-Declarations')
+        # Yeni process: LRU boş, ID DB'den gelir
+        google_drive._folder_cache.clear()
+        self.assertEqual(google_drive.get_or_create_folder_path(self.service, self.PATH), 'id-Declarations')
+        self.files.list.assert_not_called()
+        self.files.create.assert_not_called()
+
+    def test_deleted_folder_is_invalidated_and_recreated(self):
+        google_drive.get_or_create_folder_path(self.service, self.PATH)
+        self.files.create.side_effect = lambda body, **kwargs: mock.Mock(**{'execute.return_value': {'id': f"new-{body['name']}"}})
+        upload = mock.Mock(side_effect=[_http_error(404), 'uploaded'])
+
+        self.assertEqual(google_drive.upload_to_folder_path(self.service, self.PATH, upload), 'uploaded')
+        self.assertEqual(upload.call_args_list, [mock.call('id-Declarations'), mock.call('new-Declarations')])
+        self.assertEqual(
+            DriveFolder.objects.get(path='Zahnovia/Declarations').folder_id, 'new-Declarations'
+        )
+        self.assertEqual(google_drive.get_or_create_folder_path(self.service, self.PATH), 'new-Declarations')
+
+    def test_other_errors_keep_cached_folder(self):
+        google_drive.get_or_create_folder_path(self.service, self.PATH)
+        with self.assertRaises(HttpError):
+            google_drive.upload_to_folder_path(self.service, self.PATH, mock.Mock(side_effect=_http_error(500)))
+        self.assertEqual(DriveFolder.objects.get(path='Zahnovia/Declarations').folder_id, 'id-Declarations')
+
+
+class PdfWorkerTests(TransactionTestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('worker', 'worker@example.com', 'secret')
+        self.declaration = Declaration.objects.create(
+            praxis=user, declaration_number='2026-0001', patient_name='Muster, Max', herstellungsdatum=date(2026, 1, 1)
+        )
+
+    def test_error_outside_render_marks_job_for_retry(self):
+        job = pdf_queue.enqueue_pdf_job(self.declaration)
+        with mock.patch.object(pdf_queue, '_run_job', side_effect=DatabaseError('database is locked')), \
+                self.assertLogs(pdf_queue.logger, 'ERROR'):
+            processed = pdf_queue.run_worker(concurrency=1, poll_interval=0, once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(processed, 1)
+        self.assertEqual(job.status, PdfJob.STATUS_PENDING)
+        self.assertEqual(job.locked_by, '')
+        self.assertIn('database is locked', job.last_error)
+
+    def test_claim_error_does_not_kill_worker(self):
+        with mock.patch.object(pdf_queue, 'claim_next_job', side_effect=DatabaseError('disk I/O error')), \
+                self.assertLogs(pdf_queue.logger, 'ERROR'):
+            self.assertEqual(pdf_queue.run_worker(concurrency=1, poll_interval=0, once=True), 0)
+
+
+@override_settings(DOCUMENT_STORAGE_BACKEND='declarations.storage.LocalFileSystemStorage')
+class LocalDocumentStorageTests(DeclarationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = get_document_storage('declarations.storage.LocalFileSystemStorage')
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        patcher = mock.patch.object(self.storage, 'root', root.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_archive_file_type_comes_from_file_name_not_client(self):
+        upload = SimpleUploadedFile('scan.pdf', b'%PDF-1.7 scan', content_type='text/html')
+        response = self.client.post(reverse('archive_upload'), {'title': 'Scan', 'category': 'other', 'file': upload})
+        self.assertEqual(response.status_code, 302)
+
+        document = ArchiveDocument.objects.get(user=self.user)
+        response = self.client.get(document.drive_url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.7 scan')
+
+    def test_served_type_matches_stored_file_name(self):
+        stored = self.storage.put(b'Notizen', 'notes.txt', 'archive')
+        ArchiveDocument.objects.create(user=self.user, title='Notizen', file_name='notes.txt', drive_url=stored['url'])
+        response = self.client.get(stored['url'])
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        response.close()
+
+
+class MaterialCatalogTests(DeclarationTestCase):
+
+    def create_product(self, material='Zirkon'):
+        return MaterialProduct.objects.create(
+            user=self.user, name=f'{material} - Firma', material=material, firma='Firma', bestandteile='ZrO2'
+        )
+
+    def catalog_names(self):
+        return [product.name for product in get_material_catalog(self.user.pk)]
+
+    def test_product_views_invalidate_catalog(self):
+        self.assertEqual(self.catalog_names(), [])
+        self.client.post(reverse('material_product_create'), {
+            'material': 'Zirkon', 'firma': 'Firma', 'bestandteile': 'ZrO2', 'ce_status': 'Ja'
+        })
+        self.assertEqual(self.catalog_names(), ['Zirkon - Firma'])
+
+        product = MaterialProduct.objects.get(user=self.user)
+        self.client.post(reverse('material_product_delete', args=[product.pk]))
+        self.assertEqual(self.catalog_names(), [])
+
+    def test_stale_catalog_cannot_select_inactive_product(self):
+        product = self.create_product()
+        self.assertEqual(self.catalog_names(), ['Zirkon - Firma'])
+        # update() sinyal üretmez: cache'teki katalog eski kalır
+        MaterialProduct.objects.filter(pk=product.pk).update(is_active=False)
+
+        data = {'auftragsnummer': 'A-7', 'patient_name': 'Muster, Erika', 'herstellungsdatum': '2026-01-02'}
+        data.update(formset_data('product_works', [
+            {'produktbezeichnung_arbeit': 'Krone', 'zahnnummer': '11', 'zahnfarbe': 'A2'}
+        ]))
+        data.update(formset_data('materials', [
+            {'material_product': product.pk, 'material': 'Zirkon', 'firma': 'Firma', 'bestandteile': 'ZrO2',
+             'material_lot_no': 'LOT1', 'ce_status': 'Ja'}
+        ]))
+        response = self.client.post(reverse('declaration_create'), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Declaration.objects.filter(auftragsnummer='A-7').exists())
+        self.assertIn('material_product', response.context['material_formset'].forms[0].errors)
+        self.assertEqual(self.catalog_names(), [])
+
+    def test_active_product_selection_is_saved(self):
+        product = self.create_product()
+        data = {'auftragsnummer': 'A-8', 'patient_name': 'Muster, Erika', 'herstellungsdatum': '2026-01-02'}
+        data.update(formset_data('product_works', [
+            {'produktbezeichnung_arbeit': 'Krone', 'zahnnummer': '11', 'zahnfarbe': 'A2'}
+        ]))
+        data.update(formset_data('materials', [
+            {'material_product': product.pk, 'material': 'Zirkon', 'firma': 'Firma', 'bestandteile': 'ZrO2',
+             'material_lot_no': 'LOT1', 'ce_status': 'Ja'}
+        ]))
+        response = self.client.post(reverse('declaration_create'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(Declaration.objects.get(auftragsnummer='A-8').items.values_list('material', flat=True)), ['Zirkon']
+        )
+
+
+class MetricsMiddlewareTests(DeclarationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        REQUEST_SECONDS.reset()
+        REQUEST_QUERIES.reset()
+
+    def test_request_is_recorded_per_view(self):
+        self.create_declaration()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('declaration_list'))
+
+        counts, count, total = REQUEST_SECONDS._series[('declaration_list', 'GET')]
+        self.assertEqual(count, 1)
+        counts, count, total = REQUEST_QUERIES._series[('declaration_list',)]
+        self.assertEqual(count, 1)
+        self.assertEqual(total, len(queries))
+
+    def test_unresolved_paths_share_one_label(self):
+        self.client.get('/gibt-es-nicht/')
+        self.client.get('/auch-nicht/')
+        self.assertEqual(REQUEST_SECONDS._series[('unresolved', 'GET')][1], 2)
+
+    def test_nested_external_calls_count_once(self):
+        stats, token = start_request()
+        try:
+            with timed('test.outer') as outer:
+                with timed('test.inner'):
+                    pass
+        finally:
+            end_request(token)
+        self.assertEqual(stats.external_seconds, outer.elapsed)
+
+    def test_metrics_endpoint_requires_superuser_or_token(self):
+        self.client.get(reverse('declaration_list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+        with self.settings(METRICS_TOKEN='geheim'):
+            self.assertEqual(
+                self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer falsch').status_code, 404
+            )
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer geheim')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'zahnovia_request_seconds_count{view="declaration_list",method="GET"} 1', response.content.decode()
+        )
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class TracingMiddlewareTests(DeclarationTestCase):
+
+    def test_valid_request_id_is_used_as_trace_id(self):
+        response = self.client.get(reverse('declaration_list'), HTTP_X_REQUEST_ID='req-12345678')
+        self.assertEqual(response['X-Trace-ID'], 'req-12345678')
+
+    def test_invalid_request_id_is_replaced(self):
+        response = self.client.get(reverse('declaration_list'), HTTP_X_REQUEST_ID='kurz\nlog')
+        self.assertRegex(response['X-Trace-ID'], r'^[0-9a-f]{32}$')
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=1, SLOW_REQUEST_SAMPLE_RATE=1.0)
+    def test_slow_request_log_has_timings_but_no_content(self):
+        self.create_declaration()
+        with mock.patch('utils.tracing.Trace.elapsed_ms', return_value=5000.0):
+            with self.assertLogs('zahnovia.slow', 'WARNING') as logs:
+                response = self.client.get(reverse('declaration_list'), HTTP_X_REQUEST_ID='req-12345678')
+
+        self.assertContains(response, 'Muster')
+        output = '\n'.join(logs.output)
+        self.assertIn('"trace_id": "req-12345678"', output)
+        self.assertIn('"view": "declaration_list"', output)
+        self.assertIn('"queries": ', output)
+        self.assertNotIn('Muster', output)
+
+    def test_fast_requests_are_not_logged(self):
+        with self.assertNoLogs('zahnovia.slow', 'WARNING'):
+            self.client.get(reverse('declaration_list'))
+
+
+class _FakeBatch:
+    """Gmail batch isteği: execute'ta her eklenen istek için callback çağrılır"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.request_ids = []
+        self.executed = 0
+
+    def add(self, request, request_id):
+        self.request_ids.append(request_id)
+
+    def execute(self):
+        self.executed += 1
+        for request_id in self.request_ids:
+            self.callback(request_id, {'id': request_id}, None)
+
+
+@override_settings(EMAIL_BACKEND='declarations.gmail_backend.GmailApiEmailBackend', DEFAULT_FROM_EMAIL='info@example.com')
+class GmailBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        self.creds = mock.Mock(token=None, expiry=None)
+        self.creds.refresh.side_effect = self.refresh
+        self.batches = []
+        patchers = [
+            mock.patch.object(gmail_backend, '_credentials', None),
+            mock.patch.object(gmail_backend, '_thread_local', threading.local()),
+            mock.patch.object(gmail_backend, 'Credentials', return_value=self.creds),
+            mock.patch.object(gmail_backend, 'build_from_document', side_effect=self.build_service),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def refresh(self, request):
+        self.creds.token = 'token'
+        self.creds.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def build_service(self, document, credentials):
+        service = mock.Mock()
+
+        def new_batch(callback):
+            batch = _FakeBatch(callback)
+            self.batches.append(batch)
+            return batch
+        service.new_batch_http_request.side_effect = new_batch
+        return service
+
+    def messages(self, count):
+        return [EmailMessage(f'Betreff {i}', 'Text', to=[f'kunde{i}@example.com']) for i in range(count)]
+
+    def test_client_is_reused_between_backends(self):
+        for message in self.messages(3):
+            self.assertEqual(get_connection().send_messages([message]), 1)
+
+        self.creds.refresh.assert_called_once()
+        gmail_backend.Credentials.assert_called_once()
+        gmail_backend.build_from_document.assert_called_once()
+        document = gmail_backend.build_from_document.call_args.args[0]
+        self.assertEqual((document['name'], document['version']), ('gmail', 'v1'))
+        service = gmail_backend._thread_local.service
+        self.assertEqual(service.users().messages().send.call_count, 3)
+        self.assertEqual(self.batches, [])
+
+    def test_token_is_refreshed_near_expiry(self):
+        get_connection().send_messages(self.messages(1))
+        self.creds.expiry = datetime.utcnow() + timedelta(minutes=1)
+        get_connection().send_messages(self.messages(1))
+
+        self.assertEqual(self.creds.refresh.call_count, 2)
+        gmail_backend.build_from_document.assert_called_once()
+
+    def test_multiple_messages_are_sent_in_batches(self):
+        count = gmail_backend.GMAIL_BATCH_SIZE + 10
+        self.assertEqual(get_connection().send_messages(self.messages(count)), count)
+
+        self.assertEqual([len(batch.request_ids) for batch in self.batches], [gmail_backend.GMAIL_BATCH_SIZE, 10])
+        self.assertEqual([batch.executed for batch in self.batches], [1, 1])
+
+    def test_batch_errors_are_counted_when_failing_silently(self):
+        def execute_with_error(batch):
+            batch.executed += 1
+            batch.callback('0', None, None)
+            batch.callback('1', None, RuntimeError('abgelehnt'))
+
+        with mock.patch.object(_FakeBatch, 'execute', execute_with_error):
+            with self.assertLogs('declarations.gmail_backend', 'WARNING'):
+                sent = get_connection(fail_silently=True).send_messages(self.messages(2))
+        self.assertEqual(sent, 1)
+
+
+@override_settings(EMAIL_RETRY_DELAY=30)
+class EmailOutboxTests(TestCase):
+
+    def enqueue(self, key='test:1', max_attempts=3):
+        with self.settings(EMAIL_MAX_ATTEMPTS=max_attempts):
+            email, created = email_outbox.enqueue_email(
+                'Betreff', 'Text', ['kunde@example.com'], html_message='<p>Text</p>', idempotency_key=key
+            )
+        return email
+
+    def send_due(self):
+        return email_outbox.send_emails(email_outbox.claim_emails('test-worker'))
+
+    def make_due(self, email):
+        OutboundEmail.objects.filter(pk=email.pk).update(run_after=timezone.now())
+
+    def test_email_is_sent_once(self):
+        email = self.enqueue()
+        self.assertEqual(self.enqueue(), email)
+
+        self.assertEqual(self.send_due(), 1)
+        self.assertEqual(self.send_due(), 0)
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.locked_by), (OutboundEmail.STATUS_SENT, 1, ''))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0].content, '<p>Text</p>')
+
+    def test_failed_email_is_retried_with_backoff(self):
+        email = self.enqueue()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('offline')):
+            with self.assertLogs('declarations.services.email_outbox', 'WARNING'):
+                self.assertEqual(self.send_due(), 0)
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_PENDING, 1))
+        self.assertEqual(email.last_error, 'OSError: offline')
+        self.assertGreater(email.run_after, timezone.now() + timedelta(seconds=25))
+        # Bekleme süresi dolmadan tekrar denenmez
+        self.assertEqual(email_outbox.claim_emails('test-worker'), [])
+
+        self.make_due(email)
+        self.assertEqual(self.send_due(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_SENT, 2))
+        self.assertEqual(email_outbox._retry_delay(3), 120)
+
+    def test_email_is_dead_lettered_and_can_be_requeued(self):
+        email = self.enqueue(max_attempts=2)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('offline')):
+            with self.assertLogs('declarations.services.email_outbox', 'WARNING'):
+                self.send_due()
+            self.make_due(email)
+            with self.assertLogs('declarations.services.email_outbox', 'ERROR'):
+                self.send_due()
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_DEAD, 2))
+        self.make_due(email)
+        self.assertEqual(email_outbox.claim_emails('test-worker'), [])
+
+        self.assertEqual(email_outbox.requeue_dead_emails(OutboundEmail.objects.all()), 1)
+        self.assertEqual(self.send_due(), 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_SENT, 1))
+
+    def test_stale_lock_is_requeued(self):
+        email = self.enqueue()
+        self.assertEqual(len(email_outbox.claim_emails('dead-worker')), 1)
+        self.assertEqual(email_outbox.claim_emails('test-worker'), [])
+
+        OutboundEmail.objects.filter(pk=email.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(email_outbox.requeue_stale_emails(), 1)
+        self.assertEqual(self.send_due(), 1)
+
+
+@override_settings(PDF_PARSE_POOL_SIZE=0)
+class ParseCacheTests(DeclarationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        parse_cache.clear_parse_cache()
+        self.addCleanup(parse_cache.clear_parse_cache)
+        PARSE_CACHE_REQUESTS.reset()
+        self.uploaded = []
+        patchers = [
+            mock.patch.object(declaration_utils, 'iter_pdf_pages', side_effect=self.iter_pages),
+            mock.patch.object(
+                declaration_utils, 'parse_reference_pages', side_effect=lambda pages: (_parsed_reference('A-2'), 1)
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def iter_pages(self, pdf_file):
+        self.uploaded.append(pdf_file)
+        return iter(['Seite 1'])
+
+    def upload(self, content=b'%PDF-1.4 referenz'):
+        return self.client.post(
+            reverse('parse_reference_pdf'), {'pdf_file': SimpleUploadedFile('ref.pdf', content, 'application/pdf')}
+        )
+
+    def test_same_content_is_parsed_once(self):
+        first = self.upload()
+        second = self.upload()
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        declaration_utils.parse_reference_pages.assert_called_once()
+        self.assertEqual(PARSE_CACHE_REQUESTS._series, {('miss',): 1, ('hit',): 1})
+
+        self.upload(b'%PDF-1.4 andere referenz')
+        self.assertEqual(declaration_utils.parse_reference_pages.call_count, 2)
+
+    def test_cached_result_is_a_copy(self):
+        result = declaration_utils.parse_declaration_pdf(SimpleUploadedFile('ref.pdf', b'%PDF-1.4 referenz'))
+        result['materials'].clear()
+
+        cached = declaration_utils.parse_declaration_pdf(SimpleUploadedFile('ref.pdf', b'%PDF-1.4 referenz'))
+        self.assertEqual(len(cached['materials']), 1)
+        declaration_utils.parse_reference_pages.assert_called_once()
+
+    def test_errors_are_not_cached(self):
+        declaration_utils.parse_reference_pages.side_effect = lambda pages: ({'error': 'kaputt'}, 1)
+        self.upload()
+        self.upload()
+        self.assertEqual(declaration_utils.parse_reference_pages.call_count, 2)
+
+    def test_parser_version_and_ttl_invalidate_entries(self):
+        parse_cache.set_parse_result('abc', _parsed_reference('A-2'))
+        self.assertIsNotNone(parse_cache.get_parse_result('abc'))
+
+        with mock.patch.object(parse_cache, 'PARSER_VERSION', 'neu'):
+            self.assertIsNone(parse_cache.get_parse_result('abc'))
+
+        with mock.patch.object(parse_cache.time, 'monotonic', return_value=parse_cache.time.monotonic() + 7200):
+            self.assertIsNone(parse_cache.get_parse_result('abc'))
+        self.assertIsNone(parse_cache.get_parse_result('abc'))
+
+    def test_upload_handlers_hash_while_receiving(self):
+        small, large = b'%PDF-1.4 klein', b'%PDF-1.4 referenz' * 100
+        self.upload(small)
+        with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=100):
+            self.upload(large)
+
+        memory_file, temporary_file = self.uploaded
+        self.assertFalse(hasattr(memory_file, 'temporary_file_path'))
+        self.assertTrue(hasattr(temporary_file, 'temporary_file_path'))
+        self.assertEqual(memory_file.sha256, hashlib.sha256(small).hexdigest())
+        self.assertEqual(temporary_file.sha256, hashlib.sha256(large).hexdigest())
+
+
+def _blank_pdf():
+    writer = PyPDF2.PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class ParseWorkerPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = WarmProcessPool(
+            task=parse_worker._parse_pdf_task, size=1, initializer=parse_worker._init_pdf_parser, max_tasks=2
+        )
+        self.addCleanup(self.pool.close)
+        self.payload = (_blank_pdf(), 20, 512 * 1024)
+
+    def test_pdf_is_parsed_in_worker_process(self):
+        result, pages_read = self.pool.submit(self.payload, timeout=30)
+        self.assertEqual(pages_read, 1)
+        self.assertEqual(len(self.pool._workers), 1)
+
+        # max_tasks sonrası worker yenilenir
+        self.pool.submit(self.payload, timeout=30)
+        self.assertEqual(len(self.pool._workers), 0)
+
+    def test_timeout_kills_worker_and_pool_recovers(self):
+        # Worker state'i time.sleep; görev operator.call(state, saniye) -> uyur.
+        # Worker'lar spawn ile başlar: görev ve initializer picklable olmalı.
+        pool = WarmProcessPool(task=operator.call, size=1, initializer=operator.itemgetter(0), initargs=([time.sleep],))
+        self.addCleanup(pool.close)
+        pool.warm_up()
+        worker, = pool._workers
+
+        with self.assertRaises(PoolTimeout):
+            pool.submit(60, timeout=0.5)
+        self.assertFalse(worker.process.is_alive())
+        self.assertEqual(pool._workers, set())
+
+        self.assertIsNone(pool.submit(0, timeout=30))
+        self.assertEqual(len(pool._workers), 1)
+
+
+@override_settings(PDF_PARSE_POOL_SIZE=1)
+class ParseWorkerTimeoutTests(DeclarationTestCase):
+
+    def setUp(self):
+        super().setUp()
+        parse_cache.clear_parse_cache()
+        self.addCleanup(parse_cache.clear_parse_cache)
+
+    def test_timeout_is_reported_and_not_cached(self):
+        pdf = SimpleUploadedFile('ref.pdf', b'%PDF-1.4 referenz', 'application/pdf')
+        with mock.patch.object(declaration_utils, 'parse_pdf_isolated', side_effect=PoolTimeout('Zeitlimit')) as parse:
+            with self.assertLogs('declarations.utils', 'WARNING'):
+                response = self.client.post(reverse('parse_reference_pdf'), {'pdf_file': pdf})
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(response.json()['code'], 'timeout')
+
+            pdf.seek(0)
+            with self.assertLogs('declarations.utils', 'WARNING'):
+                self.client.post(reverse('parse_reference_pdf'), {'pdf_file': pdf})
+        self.assertEqual(parse.call_count, 2)
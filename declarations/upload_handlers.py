@@ -0,0 +1,61 @@
+"""
+Zahnovia Upload Handler'ları
+Yüklenen dosyanın SHA-256'sı, dosya parça parça alınırken hesaplanır ve
+`uploaded_file.sha256` olarak eklenir (dosyayı sonradan tekrar okumaya gerek
+kalmaz). settings.FILE_UPLOAD_HANDLERS'ta Django'nun varsayılan handler'ları
+yerine kullanılır.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """Parçayı hangi handler saklıyorsa hash'i o handler günceller"""
+
+    def new_file(self, *args, **kwargs):
+        # super() StopFutureHandlers fırlatabilir: hash nesnesi önce oluşturulmalı
+        self._sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        result = super().receive_data_chunk(raw_data, start)
+        if result is None:
+            # Parça bu handler tarafından alındı (sonraki handler'a geçmiyor)
+            self._sha256.update(raw_data)
+        return result
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self._sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def file_sha256(file):
+    """
+    Dosyanın SHA-256'sı: upload handler hesapladıysa o, yoksa dosya okunarak
+
+    Args:
+        file: UploadedFile veya dosya benzeri nesne (okunduktan sonra başa sarılır)
+    """
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    if hasattr(file, 'chunks'):
+        for chunk in file.chunks():
+            sha256.update(chunk)
+    else:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
@@ -25,9 +25,13 @@ urlpatterns = [
     # Declarations
     path('declarations/', views.declaration_list, name='declaration_list'),
     path('declarations/create/', views.declaration_create, name='declaration_create'),
+    path('declarations/import/', views.declaration_bulk_import, name='declaration_bulk_import'),
+    path('declarations/import/<int:pk>/', views.declaration_import_job, name='declaration_import_job'),
+    path('declarations/drafts/', views.declaration_drafts, name='declaration_drafts'),
     path('declarations/<int:pk>/', views.declaration_detail, name='declaration_detail'),
     path('declarations/<int:pk>/edit/', views.declaration_edit, name='declaration_edit'),
     path('declarations/<int:pk>/delete/', views.declaration_delete, name='declaration_delete'),
+    path('declarations/<int:pk>/pdf-status/', views.declaration_pdf_status, name='declaration_pdf_status'),
 
     # Material Products
     path('material-products/', views.material_products_list, name='material_products_list'),
@@ -44,6 +48,12 @@ urlpatterns = [
     path('archive/<int:pk>/', views.archive_view, name='archive_view'),
     path('archive/<int:pk>/delete/', views.archive_delete, name='archive_delete'),
 
+    # Yerel depolama (LocalFileSystemStorage)
+    path('documents/<str:key>/', views.document_file, name='document_file'),
+
+    # Prometheus metrikleri (sadece admin)
+    path('metrics/', views.metrics, name='metrics'),
+
     # AJAX Endpoints
     path('api/parse-reference-pdf/', views.parse_reference_pdf, name='parse_reference_pdf'),
 ]
@@ -1,24 +1,108 @@
+import atexit
+import logging
 import os
-import re
+import threading
 from django.template.loader import render_to_string
 from django.conf import settings
-from weasyprint import HTML
-from utils.google_drive import get_drive_service, upload_file, get_or_create_archive_folder
-try:
-    import PyPDF2
-except ImportError:
-    PyPDF2 = None
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+from utils.google_drive import get_or_create_folder_path
+from utils.metrics import PARSE_CACHE_REQUESTS, timed
+from utils.process_pool import PoolError, PoolTimeout, WarmProcessPool
+from .services.parse_cache import get_parse_result, set_parse_result
+from .services.parse_worker import parse_pdf_isolated
+from .services.pdf_text import PyPDF2, iter_pdf_pages
+from .services.reference_parser import parse_reference_pages
+from .storage import DRIVE_FOLDER_PATHS, get_document_storage, guess_content_type, storage_for_url
+from .upload_handlers import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# NOT: Bu modül renderer worker process'lerinde (spawn) de import edilir,
+# bu yüzden model import'ları fonksiyon içinde yapılmalı.
+
+DECLARATIONS_FOLDER_PATH = DRIVE_FOLDER_PATHS['declarations']
+ARCHIVE_FOLDER_PATH = DRIVE_FOLDER_PATHS['archive']
+
+PDF_STYLESHEET_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'mytemplates', 'declarations', 'pdf', 'declaration.css'
+)
+
+
+# ===== PDF RENDERER =====
+
+def _init_pdf_renderer(stylesheet_path):
+    """Font config ve declaration CSS'ini bir kez hazırla, fontları ısıt"""
+    font_config = FontConfiguration()
+    stylesheets = [CSS(filename=stylesheet_path, font_config=font_config)]
+    HTML(string='<p>Zahnovia</p>').write_pdf(stylesheets=stylesheets, font_config=font_config)
+    return {'font_config': font_config, 'stylesheets': stylesheets}
+
+
+def _render_pdf_task(state, html_string):
+    return HTML(string=html_string).write_pdf(
+        stylesheets=state['stylesheets'],
+        font_config=state['font_config']
+    )
+
+
+_renderer_pool = None
+_renderer_pool_lock = threading.Lock()
+_local_renderer = threading.local()
+
+
+def get_renderer_pool():
+    """Process genelinde tek PDF renderer havuzu (lazy)"""
+    global _renderer_pool
+    with _renderer_pool_lock:
+        if _renderer_pool is None:
+            max_rss_mb = getattr(settings, 'PDF_RENDER_WORKER_MAX_RSS_MB', 500)
+            _renderer_pool = WarmProcessPool(
+                task=_render_pdf_task,
+                size=getattr(settings, 'PDF_RENDER_POOL_SIZE', 2),
+                initializer=_init_pdf_renderer,
+                initargs=(PDF_STYLESHEET_PATH,),
+                max_tasks=getattr(settings, 'PDF_RENDER_WORKER_MAX_RENDERS', 200),
+                max_rss_bytes=max_rss_mb * 1024 * 1024 if max_rss_mb else None,
+            )
+            atexit.register(_renderer_pool.close)
+        return _renderer_pool
+
+
+def render_pdf_bytes(html_string):
+    """
+    HTML'i önceden hazırlanmış font config ve CSS ile PDF'e çevir.
+
+    PDF_RENDER_POOL_SIZE > 0 ise render ayrı worker process'lerde yapılır,
+    aksi halde thread başına saklanan state ile bu process'te yapılır.
+
+    Returns:
+        bytes: PDF içeriği
+    """
+    if getattr(settings, 'PDF_RENDER_POOL_SIZE', 2) > 0:
+        return get_renderer_pool().submit(html_string)
+
+    state = getattr(_local_renderer, 'state', None)
+    if state is None:
+        state = _local_renderer.state = _init_pdf_renderer(PDF_STYLESHEET_PATH)
+    return _render_pdf_task(state, html_string)
 
 
 def generate_declaration_pdf(declaration):
     """
-    Declaration için PDF oluştur ve Google Drive'a yükle
+    Declaration için PDF oluştur ve depolama backend'ine yükle
+
+    PDF tamamen bellekte üretilir ve doğrudan bellekten yüklenir; diske
+    yazılmadığı için aynı declaration numarasına sahip eşzamanlı render'lar
+    (farklı praxisler) çakışmaz.
 
     Args:
         declaration: Declaration instance
 
     Returns:
-        dict: {'pdf_path': local_path, 'drive_url': google_drive_url}
+        dict: {'pdf_url': storage_url, 'size': pdf_byte_size,
+               'timings': {'render': ms, 'create': ms, 'permission': ms}}
     """
     # Hersteller profile bilgisini al
     try:
@@ -26,54 +110,33 @@ def generate_declaration_pdf(declaration):
     except:
         hersteller_profile = None
 
-    # Debug: Tarihi yazdır
-    print(f"DEBUG PDF - Declaration ID: {declaration.id}")
-    print(f"DEBUG PDF - Herstellungsdatum: {declaration.herstellungsdatum}")
-    print(f"DEBUG PDF - Herstellungsdatum type: {type(declaration.herstellungsdatum)}")
-    
     # HTML render et
     html_string = render_to_string('declarations/pdf/declaration.html', {
         'declaration': declaration,
         'hersteller_profile': hersteller_profile
     })
 
-    # PDF oluştur
+    # PDF oluştur (bellekte)
     pdf_filename = f"{declaration.declaration_number}.pdf"
-    pdf_dir = os.path.join(settings.BASE_DIR, 'temp_pdfs')
-    os.makedirs(pdf_dir, exist_ok=True)
-    pdf_path = os.path.join(pdf_dir, pdf_filename)
-
-    HTML(string=html_string).write_pdf(pdf_path)
+    with timed('render') as render_timer:
+        pdf_bytes = render_pdf_bytes(html_string)
+    timings = {'render': render_timer.elapsed * 1000}
 
-    # Google Drive'a yükle
+    # Depolama backend'ine yükle (settings.DOCUMENT_STORAGE_BACKEND)
     try:
-        service = get_drive_service()
-
-        # Zahnovia/Declarations klasörünü bul veya oluştur
-        folder_id = get_or_create_declarations_folder(service)
-
-        # Dosyayı yükle
-        file_info = upload_file(
-            service=service,
-            file_path=pdf_path,
-            folder_id=folder_id,
-            file_name=pdf_filename
-        )
-
-        drive_url = file_info.get('view')
-
-        # Local PDF'i sil (opsiyonel)
-        # os.remove(pdf_path)
-
+        stored = get_document_storage().put(pdf_bytes, pdf_filename, 'declarations', 'application/pdf')
+        timings.update(stored.get('timings', {}))
         return {
-            'pdf_path': pdf_path,
-            'drive_url': drive_url
+            'pdf_url': stored['url'],
+            'size': len(pdf_bytes),
+            'timings': timings
         }
-    except Exception as e:
-        print(f"Google Drive upload error: {e}")
+    except Exception:
+        logger.exception('Document storage upload error: %s', pdf_filename)
         return {
-            'pdf_path': pdf_path,
-            'drive_url': None
+            'pdf_url': None,
+            'size': len(pdf_bytes),
+            'timings': timings
         }
 
 
@@ -81,19 +144,7 @@ def get_or_create_declarations_folder(service):
     """
     Google Drive'da Zahnovia/Declarations klasörünü bul veya oluştur
     """
-    from utils.google_drive import find_folder, create_folder
-
-    # Zahnovia ana klasörü
-    zahnovia_folder = find_folder(service, 'Zahnovia')
-    if not zahnovia_folder:
-        zahnovia_folder = create_folder(service, 'Zahnovia')
-
-    # Declarations alt klasörü
-    declarations_folder = find_folder(service, 'Declarations', parent_id=zahnovia_folder)
-    if not declarations_folder:
-        declarations_folder = create_folder(service, 'Declarations', parent_id=zahnovia_folder)
-
-    return declarations_folder
+    return get_or_create_folder_path(service, DECLARATIONS_FOLDER_PATH)
 
 
 # ===== ARCHIVE GOOGLE DRIVE FUNCTIONS =====
@@ -102,95 +153,86 @@ def get_or_create_zahnovia_archive_folder(service):
     """
     Google Drive'da Zahnovia/Archive klasörünü bul veya oluştur
     """
-    from utils.google_drive import find_folder, create_folder
-
-    # Zahnovia ana klasörü
-    zahnovia_folder = find_folder(service, 'Zahnovia')
-    if not zahnovia_folder:
-        zahnovia_folder = create_folder(service, 'Zahnovia')
+    return get_or_create_folder_path(service, ARCHIVE_FOLDER_PATH)
 
-    # Archive alt klasörü
-    archive_folder = find_folder(service, 'Archive', parent_id=zahnovia_folder)
-    if not archive_folder:
-        archive_folder = create_folder(service, 'Archive', parent_id=zahnovia_folder)
 
-    return archive_folder
+def upload_document(file, title, file_name):
+    """
+    Dosyayı depolama backend'ine yükle (Archive için)
 
+    Dosya, Django upload handler'ının tuttuğu yerden (bellek veya spooled
+    temp dosya) doğrudan, parçalar halinde okunur; ara kopya oluşturulmaz.
 
-def upload_to_drive(file, title, file_name):
-    """
-    Dosyayı Google Drive'a yükle (Archive için)
-    
     Args:
         file: Django UploadedFile object
         title: Döküman başlığı
         file_name: Dosya adı
-        
+
     Returns:
-        dict: {'id': file_id, 'view': view_url} veya None
+        dict: {'id': storage_key, 'view': view_url} veya None
     """
     try:
-        service = get_drive_service()
-        
-        # Archive klasörünü al
-        folder_id = get_or_create_zahnovia_archive_folder(service)
-        
-        # Geçici dosya oluştur
-        temp_dir = os.path.join(settings.BASE_DIR, 'temp_pdfs')
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_path = os.path.join(temp_dir, file_name)
-        
-        # Dosyayı geçici konuma kaydet
-        with open(temp_path, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
-        
-        # Google Drive'a yükle
-        file_info = upload_file(
-            service=service,
-            file_path=temp_path,
-            folder_id=folder_id,
-            file_name=file_name
+        stored = get_document_storage().put(
+            file,
+            file_name,
+            'archive',
+            guess_content_type(file_name)
         )
-        
-        # Geçici dosyayı sil
-        try:
-            os.remove(temp_path)
-        except:
-            pass
-        
         return {
-            'id': file_info.get('id'),
-            'view': file_info.get('view')
+            'id': stored['key'],
+            'view': stored['url']
         }
-    except Exception as e:
-        print(f"Google Drive upload error: {e}")
+    except Exception:
+        logger.exception('Document storage upload error: %s', file_name)
         return None
 
 
-def delete_from_drive(file_id):
+def delete_document(url):
     """
-    Google Drive'dan dosya sil
+    Dökümanı ait olduğu depolama backend'inden sil
+
+    İçerik adresli backend'lerde (LocalFileSystemStorage) aynı dosyayı başka
+    bir kayıt kullanıyorsa dosya silinmez. Bu yüzden DB kaydı bu fonksiyondan
+    ÖNCE silinmeli / güncellenmelidir.
 
     Args:
-        file_id: Google Drive file ID
+        url: Dökümanın URL'i (pdf_url / drive_url)
 
     Returns:
         bool: Başarılı ise True
     """
+    storage, key = storage_for_url(url)
+    if not key:
+        return False
     try:
-        from utils.google_drive import delete_file
-        service = get_drive_service()
-        return delete_file(service, file_id)
-    except Exception as e:
-        print(f"Google Drive delete error: {e}")
+        if storage.content_addressed and document_in_use(url, key):
+            return True
+        return storage.delete(key)
+    except Exception:
+        logger.exception('Document storage delete error: %s', url)
         return False
 
 
+def document_in_use(url, key=None):
+    """URL / key hâlâ bir Declaration veya ArchiveDocument tarafından kullanılıyor mu?"""
+    from .models import Declaration, ArchiveDocument
+
+    if Declaration.objects.filter(pdf_url=url).exists():
+        return True
+    return ArchiveDocument.objects.filter(drive_url=url).exists() or (
+        bool(key) and ArchiveDocument.objects.filter(drive_file_id=key).exists()
+    )
+
+
+@timed('parse')
 def parse_declaration_pdf(pdf_file):
     """
     Referans PDF dosyasından konformitätserklärung bilgilerini çıkar
 
+    Aynı içerikteki PDF'in sonucu parse cache'ten döner (bkz. services.parse_cache).
+    PDF_PARSE_POOL_SIZE > 0 ise parse ayrı bir worker process'te, süre ve
+    bellek sınırıyla yapılır (bkz. services.parse_worker).
+
     Args:
         pdf_file: Django UploadedFile object (PDF)
 
@@ -209,234 +251,49 @@ def parse_declaration_pdf(pdf_file):
                 ...
             ]
         }
+        Hata durumunda: {'error': str, 'code': 'unavailable' | 'too_large' | 'timeout' | 'parse_error'}
     """
     if not PyPDF2:
-        return {'error': 'PyPDF2 kütüphanesi yüklü değil'}
+        return {'error': 'PyPDF2 kütüphanesi yüklü değil', 'code': 'unavailable'}
 
-    try:
-        # PDF'i oku
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-
-        # Tüm sayfaları oku
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-
-        # Unicode karakterleri temizle
-        text = text.replace('\u200b', '')  # Zero-width space
-        text = text.replace('\ufeff', '')  # BOM
-
-        # Debug: PDF'den çıkan metni logla
-        try:
-            print("=" * 80)
-            print("DEBUG: PDF TEXT CONTENT")
-            print("=" * 80)
-            print(text.encode('utf-8', errors='replace').decode('utf-8'))
-            print("=" * 80)
-        except Exception as e:
-            print(f"Debug print error: {e}")
-
-        # Veriyi parse et
-        parsed_data = {
-            'auftragsnummer': '',
-            'patient_name': '',
-            'herstellungsdatum': '',
-            'product_works': [],
-            'materials': []
+    max_file_bytes = getattr(settings, 'PDF_PARSE_MAX_FILE_BYTES', 20 * 1024 * 1024)
+    if max_file_bytes and (getattr(pdf_file, 'size', None) or 0) > max_file_bytes:
+        return {
+            'error': f'Die PDF-Datei ist zu groß (max. {max_file_bytes // (1024 * 1024)} MB)',
+            'code': 'too_large',
         }
 
-        # Auftragsnummer çıkar (sadece standart format varsa)
-        # Dentsply PDF'de Auftragsnummer yok, kullanıcı manuel girecek
-        auftrag_match = re.search(r'Auftragsnummer[:\s]+([A-Z0-9-]+)', text, re.IGNORECASE)
-        if auftrag_match:
-            parsed_data['auftragsnummer'] = auftrag_match.group(1).strip()
-
-        # Patient name çıkar
-        # Dentsply gerçek format: "1Sanli,Seda Fischer,Christine Unknown Krone 24 Hoch"
-        # Boşluklarla ayrılmış: ID Zahnarzt Patient Techniker Elementtyp Zahnnummer Produktion
-        # Virgülden sonra boşluk YOK: "Fischer,Christine"
-        patient_table_match = re.search(r'\d+[A-Za-zäöüßÄÖÜ]+,[A-Za-zäöüßÄÖÜ]+\s+([A-Za-zäöüßÄÖÜ]+),([A-Za-zäöüßÄÖÜ]+)\s+', text)
-        if patient_table_match:
-            # Virgülden sonra boşluk ekle
-            parsed_data['patient_name'] = f"{patient_table_match.group(1)}, {patient_table_match.group(2)}"
-        else:
-            # Standart format: "Patientenname: Fischer, Christine"
-            patient_match = re.search(r'Patient(?:enname)?[:\s]+([^\n]+)', text, re.IGNORECASE)
-            if patient_match:
-                parsed_data['patient_name'] = patient_match.group(1).strip()
-
-        # Herstellungsdatum çıkar
-        # Dentsply'de: "Erstellungsdatum: 01.01.2026 22:27:05" → Zahnovia'da "Herstellungsdatum"
-        date_match = re.search(r'Erstellungsdatum[:\s]+(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{4})', text, re.IGNORECASE)
-        if date_match:
-            day, month, year = date_match.groups()
-            parsed_data['herstellungsdatum'] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-        else:
-            # Alternatif: standart "Herstellungsdatum" formatı
-            date_match2 = re.search(r'Herstellungsdatum[:\s]+(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{4})', text, re.IGNORECASE)
-            if date_match2:
-                day, month, year = date_match2.groups()
-                parsed_data['herstellungsdatum'] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-
-        # Produktbezeichnung/Arbeit tablosunu çıkar
-        # Dentsply Format: Tabloda "Elementtyp | Zahnnummer"
-        # Zahnovia'da: "Produktbezeichnung / Arbeit | Zahnnummer | Zahnfarbe"
-
-        # Format 1: Standart table format
-        product_pattern = r'([^\|]+)\s*\|\s*(\d+[,\s]*\d*)\s*\|\s*([A-Z0-9]+)'
-        product_matches = re.findall(product_pattern, text)
-
-        for match in product_matches:
-            if len(match) == 3:
-                parsed_data['product_works'].append({
-                    'produktbezeichnung_arbeit': match[0].strip(),
-                    'zahnnummer': match[1].strip(),
-                    'zahnfarbe': match[2].strip()
-                })
-
-        # Format 2: Dentsply Sirona tablosu
-        # Gerçek format: "1Sanli,Seda Fischer,Christine Unknown Krone 24 Hoch"
-        # Boşluklarla ayrılmış: ID Zahnarzt Patient Techniker Elementtyp Zahnnummer Produktion
-        if not parsed_data['product_works']:
-            # Pattern: ID Zahnarzt Patient Techniker Elementtyp Zahnnummer
-            # Virgülden sonra boşluk olmayabilir: "Fischer,Christine" (boşluksuz)
-            table_row_pattern = r'\d+[A-Za-zäöüßÄÖÜ]+,[A-Za-zäöüßÄÖÜ]+\s+[A-Za-zäöüßÄÖÜ]+,[A-Za-zäöüßÄÖÜ]+\s+[A-Za-zäöüßÄÖÜ]+\s+([A-Za-zäöüßÄÖÜ]+(?:\s+[A-Za-zäöüßÄÖÜ]+)*)\s+(\d+)'
-            table_match = re.search(table_row_pattern, text)
-
-            if table_match:
-                elementtyp = table_match.group(1).strip()
-                zahnnummer = table_match.group(2).strip()
-
-                # Materialfarbe'yi çıkar (Zahnfarbe için)
-                # Format: "Materialfarbe: A1" - Sadece 2-4 karakterlik alfanumerik kod
-                # Zahnfarbe genelde: A1, A2, B1, 0M2, etc. (max 4 karakter)
-                materialfarbe_match = re.search(r'Materialfarbe[:\s]*([A-Z0-9]{1,4})(?:\s|[a-z]|$)', text, re.IGNORECASE)
-                if materialfarbe_match:
-                    zahnfarbe = materialfarbe_match.group(1).strip()
-                else:
-                    # Alternatif: Boşlukla ayrılmış format (0M2 HT gibi)
-                    materialfarbe_match2 = re.search(r'Materialfarbe[:\s]*([A-Z0-9]+\s+[A-Z0-9]+)', text, re.IGNORECASE)
-                    if materialfarbe_match2:
-                        zahnfarbe = materialfarbe_match2.group(1).strip()
-                    else:
-                        zahnfarbe = ''
-
-                parsed_data['product_works'].append({
-                    'produktbezeichnung_arbeit': elementtyp,  # Krone, Brücke, etc.
-                    'zahnnummer': zahnnummer,  # 24, etc.
-                    'zahnfarbe': zahnfarbe  # Materialfarbe -> Zahnfarbe
-                })
-
-        # Materialien tablosunu çıkar
-        # Dentsply Format:
-        #   Werkstückname: CERECMTLZirconia
-        #   Lot-Nr.: 20260101-222705  <- Bu LOT NO (Material Lot No)
-        #   Hersteller: DentsplySirona
-        #   Materialname: CERECMTLZirconia
-
-        # Material LOT NO çıkar
-        # "LOT-Nummer: YBDFLC" formatı
-        lot_no_match = re.search(r'LOT-Nummer[:\s]*([A-Z0-9]+)', text, re.IGNORECASE)
-        if lot_no_match:
-            material_lot_no = lot_no_match.group(1).strip()
+    try:
+        content_hash = file_sha256(pdf_file)
+        cached = get_parse_result(content_hash)
+        if cached is not None:
+            PARSE_CACHE_REQUESTS.inc(result='hit')
+            return cached
+        PARSE_CACHE_REQUESTS.inc(result='miss')
+
+        if getattr(settings, 'PDF_PARSE_POOL_SIZE', 2) > 0:
+            # Güvenilmeyen PDF ayrı bir worker process'te, süre ve bellek
+            # sınırıyla parse edilir (bkz. services.parse_worker)
+            pdf_file.seek(0)
+            parsed_data, pages_read = parse_pdf_isolated(pdf_file.read())
         else:
-            # Alternatif: "Lot-Nr.: 20260101-222705" formatı
-            lot_no_match2 = re.search(r'Lot-Nr[.:\s]*([A-Z0-9-]+)', text, re.IGNORECASE)
-            if lot_no_match2:
-                material_lot_no = lot_no_match2.group(1).strip()
-            else:
-                # Son alternatif: Eski format "20260101-222705" -> Sadece son 6 hane: "222705"
-                lot_no_match3 = re.search(r'\d{8}-(\d{6})', text)
-                material_lot_no = lot_no_match3.group(1).strip() if lot_no_match3 else ''
-
-        # Materialname ve Hersteller
-        # Materialname: "IPS e.max ZirCAD MT Multi" - Boşlukları da kabul et
-        # Satır sonuna kadar al, sonra temizle
-        materialname_match = re.search(r'Materialname[:\s]*(.+?)(?:\n|$)', text, re.IGNORECASE)
-        hersteller_match = re.search(r'Hersteller[:\s]*(.+?)(?:\n|$)', text, re.IGNORECASE)
-
-        if materialname_match:
-            # Material adını al
-            material_name = materialname_match.group(1).strip()
-
-            # Eğer satırda başka başlıklar varsa kes (Materialklasse, etc.)
-            for stop_word in ['Materialklasse', 'Materialfarbe', 'LOT-Nummer', 'Hersteller', 'Werkstückgröße']:
-                if stop_word in material_name:
-                    material_name = material_name.split(stop_word)[0].strip()
-
-            # Debug: Material name'i logla
-            print(f"DEBUG: Material name parsed: '{material_name}'")
-
-            # Bilinen materyallerdeki boşluk hatalarını düzelt
-            # "IPSe.max" veya "IP Se.max" → "IPS e.max"
-            material_name = material_name.replace('IPSe.max', 'IPS e.max')
-            material_name = material_name.replace('IP Se.max', 'IPS e.max')
-            material_name = material_name.replace('IP S e.max', 'IPS e.max')
-            # "e.maxZirCAD" → "e.max ZirCAD" (boşluk ekleme)
-            material_name = material_name.replace('e.maxZirCAD', 'e.max ZirCAD')
-            # "ZirCADMT" veya "MTMulti" → "ZirCAD MT" ve "MT Multi"
-            material_name = material_name.replace('ZirCADMT', 'ZirCAD MT')
-            material_name = material_name.replace('MTMulti', 'MT Multi')
-
-            # Eğer boşluksuz format gelirse (eski PDF'ler için) düzenle
-            if ' ' not in material_name and len(material_name) > 10:
-                # "CERECMTLZirconia" → "CEREC MTL Zirconia"
-                material_name = re.sub(r'([A-Z][a-z]+)', r' \1', material_name).strip()
-                material_name = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1 \2', material_name).strip()
-
-            # Hersteller adını al
-            firma_name = 'Ivoclar'  # Default
-            if hersteller_match:
-                firma_raw = hersteller_match.group(1).strip()
-                # Boşluksuz format varsa düzenle: "DentsplySirona" → "Dentsply Sirona"
-                if ' ' not in firma_raw:
-                    firma_name = re.sub(r'([a-z])([A-Z])', r'\1 \2', firma_raw)
-                else:
-                    firma_name = firma_raw
-
-            material_data = {
-                'material': material_name,
-                'firma': firma_name,
-                'bestandteile': '',
-                'material_lot_no': material_lot_no,
-                'ce_status': 'yes'
-            }
-            parsed_data['materials'].append(material_data)
-
-        # Format 2: CE işareti, firma isimleri vb. ara (eski format)
-        if not parsed_data['materials']:
-            material_lines = text.split('\n')
-
-            for i, line in enumerate(material_lines):
-                # CE işareti içeren satırları ara
-                if 'CE' in line or 'Lot' in line or 'Zirconi' in line:
-                    # Material bilgisini parse et
-                    parts = re.split(r'\s{2,}|\t', line)  # 2+ boşluk veya tab ile böl
-                    if len(parts) >= 1:
-                        material_data = {
-                            'material': '',
-                            'firma': '',
-                            'bestandteile': '',
-                            'material_lot_no': '',
-                            'ce_status': 'yes' if 'CE' in line else 'no'
-                        }
-
-                        # İlk kısım genelde material
-                        material_data['material'] = parts[0].strip()
-
-                        # Firma ve diğer bilgileri çıkarmaya çalış
-                        for part in parts[1:]:
-                            if 'Lot' in part or 'LOT' in part:
-                                lot_match = re.search(r'(?:Lot|LOT)[:\s]*([A-Z0-9-]+)', part)
-                                if lot_match:
-                                    material_data['material_lot_no'] = lot_match.group(1)
-                            elif len(part) > 2 and material_data['firma'] == '':
-                                material_data['firma'] = part.strip()
-
-                        if material_data['material']:
-                            parsed_data['materials'].append(material_data)
+            # Sayfalar istendikçe çıkarılır: profilin alanları ilk sayfalarda
+            # bulunursa kalan sayfalar hiç işlenmez
+            parsed_data, pages_read = parse_reference_pages(iter_pdf_pages(pdf_file))
 
+        # Metnin kendisi loglanmaz (hasta bilgisi içerir); sadece sayfa sayısı
+        logger.debug('Reference PDF parsed: pages_read=%d', pages_read)
+        set_parse_result(content_hash, parsed_data)
         return parsed_data
 
+    except PoolTimeout:
+        logger.warning('Reference PDF parse timed out (%ss), worker killed', getattr(settings, 'PDF_PARSE_TIMEOUT', 10))
+        return {
+            'error': 'Die PDF-Datei konnte nicht rechtzeitig verarbeitet werden. Bitte prüfen Sie die Datei.',
+            'code': 'timeout',
+        }
+    except PoolError as e:
+        logger.warning('Reference PDF parse failed in worker: %s', e)
+        return {'error': f'PDF parse hatası: {str(e)}', 'code': 'parse_error'}
     except Exception as e:
-        return {'error': f'PDF parse hatası: {str(e)}'}
+        return {'error': f'PDF parse hatası: {str(e)}', 'code': 'parse_error'}
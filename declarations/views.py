@@ -5,23 +5,47 @@ from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib import messages
 from django.http import HttpResponse, FileResponse, Http404, JsonResponse
-from django.utils.crypto import get_random_string
+from django.utils.crypto import constant_time_compare, get_random_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.utils import timezone
 from django.conf import settings
 from datetime import date, datetime, timedelta
+from django.db import transaction
 from django.db.models import Q
 from django import forms
-from .models import Declaration, DeclarationItem, MaterialProduct, HerstellerProfile, ProductWork, ArchiveDocument
+from .models import Declaration, DeclarationItem, MaterialProduct, HerstellerProfile, ProductWork, ArchiveDocument, ImportJob
 from .forms import (
     DeclarationItemFormSet, ProductWorkFormSet, DeclarationItemForm, ProductWorkForm,
-    BaseDeclarationItemFormSet, RegistrationForm, PasswordResetRequestForm,
+    BaseDeclarationItemFormSet, BaseLineItemFormSet, RegistrationForm, PasswordResetRequestForm,
     PasswordResetConfirmForm, HerstellerProfileForm
 )
-from .utils import generate_declaration_pdf, parse_declaration_pdf
+from .utils import parse_declaration_pdf
+from .pagination import get_page_size, keyset_paginate
+from .storage import LocalFileSystemStorage, get_document_storage, guess_content_type, storage_for_url
 from .services.email_service import RegistrationEmailService, PasswordResetEmailService
-from django.views.decorators.http import require_POST
+from .services.bulk_import import STATUS_CREATED, STATUS_DUPLICATE, finalize_drafts
+from .services.import_queue import enqueue_import
+from .services.pdf_queue import enqueue_pdf_job, get_active_job, get_latest_job
+from .services.pdf_cache import is_render_current
+from .services.profile_cache import get_cached_profile
+from .services.line_items import (
+    ChangeSet, changed_header_fields, create_line_items, item_rows, product_work_rows, snapshot_header,
+    sync_line_items
+)
+from django.views.decorators.http import require_GET, require_POST
+from utils.metrics import render_metrics
+from django.views.decorators.clickjacking import xframe_options_sameorigin
+import logging
+
+logger = logging.getLogger(__name__)
+
+# parse_declaration_pdf hata kodlarının HTTP karşılıkları (varsayılan 400)
+PARSE_ERROR_STATUS = {
+    'too_large': 413,
+    'timeout': 422,
+    'unavailable': 503,
+}
 
 
 def user_login(request):
@@ -55,8 +79,9 @@ def dashboard(request):
     if request.user.is_superuser:
         return redirect('/admin/')
     
-    total_declarations = Declaration.objects.filter(praxis=request.user).count()
-    recent_declarations = Declaration.objects.filter(praxis=request.user)[:5]
+    # Taslaklar (toplu import) fertigstellen'e kadar sayılmaz / listelenmez
+    total_declarations = Declaration.objects.filter(praxis=request.user, is_draft=False).count()
+    recent_declarations = Declaration.objects.filter(praxis=request.user, is_draft=False)[:5]
 
     context = {
         'total_declarations': total_declarations,
@@ -72,8 +97,25 @@ def declaration_list(request):
     if request.user.is_superuser:
         return redirect('/admin/')
     
-    declarations = Declaration.objects.filter(praxis=request.user)
-    return render(request, 'declarations/declaration_list.html', {'declarations': declarations})
+    declarations = Declaration.objects.filter(praxis=request.user, is_draft=False)
+
+    # Arama (tüm kayıtlarda, sadece mevcut sayfada değil)
+    search = request.GET.get('search', '').strip()
+    if search:
+        declarations = declarations.filter(
+            Q(patient_name__icontains=search) |
+            Q(auftragsnummer__icontains=search) |
+            Q(declaration_number__icontains=search)
+        )
+
+    # Keyset pagination: (created_at, id) azalan
+    page = keyset_paginate(request, declarations, ['created_at', 'id'], get_page_size(request))
+
+    return render(request, 'declarations/declaration_list.html', {
+        'declarations': page,
+        'page': page,
+        'search_query': search,
+    })
 
 
 @login_required
@@ -103,109 +145,38 @@ def declaration_create(request):
         else:
             herstellungsdatum = date.today()
 
-        print(f"DEBUG - Herstellungsdatum from form: {herstellungsdatum_str}")
-        print(f"DEBUG - Herstellungsdatum to save: {herstellungsdatum} (type: {type(herstellungsdatum)})")
-
-        # Declaration oluştur
-        declaration = Declaration.objects.create(
+        # Declaration (henüz kaydedilmedi) ve satır formset'leri
+        declaration = Declaration(
             praxis=request.user,
             auftragsnummer=auftragsnummer,
             patient_name=patient_name,
             herstellungsdatum=herstellungsdatum
         )
-
-        # Form verilerini işle
         product_work_formset = ProductWorkFormSet(request.POST, instance=declaration, prefix='product_works')
         material_formset = DeclarationItemFormSet(request.POST, instance=declaration, prefix='materials', user=request.user)
 
         if product_work_formset.is_valid() and material_formset.is_valid():
-            # Product works'leri kaydet
-            saved_count = 0
-            for form in product_work_formset.forms:
-                # DELETE checkbox işaretliyse atla
-                if form.cleaned_data.get('DELETE'):
-                    continue
-
-                # Form'dan veriyi al
-                data = form.cleaned_data
-                if data.get('produktbezeichnung_arbeit'):  # En azından produktbezeichnung olmalı
-                    pw = ProductWork(
-                        declaration=declaration,
-                        line_number=saved_count + 1,
-                        produktbezeichnung_arbeit=data.get('produktbezeichnung_arbeit', ''),
-                        zahnnummer=data.get('zahnnummer', ''),
-                        zahnfarbe=data.get('zahnfarbe', '')
-                    )
-                    pw.save()
-                    saved_count += 1
-
-            # Önce tüm material ve firma değerlerini POST'tan al (hidden field'lar)
-            material_data = {}
-            for key in request.POST.keys():
-                if key.startswith('materials-') and '-material' in key:
-                    try:
-                        # materials-0-material -> index: 0, field: material
-                        parts = key.split('-')
-                        if len(parts) == 3:
-                            index = int(parts[1])
-                            field = parts[2]
-                            value = request.POST.get(key, '').strip()
-
-                            if index not in material_data:
-                                material_data[index] = {}
-
-                            material_data[index][field] = value
-                    except (ValueError, IndexError):
-                        continue
-
-            # Materials'ları kaydet
-            items = material_formset.save(commit=False)
-            saved_count = 0
-            for form_index, form in enumerate(material_formset.forms):
-                # DELETE checkbox işaretliyse atla
-                if form.cleaned_data.get('DELETE'):
-                    continue
-
-                # Bu form için item'ı al
-                if saved_count < len(items):
-                    item = items[saved_count]
-                    item.line_number = saved_count + 1
-
-                    # Hidden field'lardan material ve firma değerlerini al
-                    if form_index in material_data:
-                        if not item.material and material_data[form_index].get('material'):
-                            item.material = material_data[form_index]['material']
-                        if not item.firma and material_data[form_index].get('firma'):
-                            item.firma = material_data[form_index]['firma']
-
-                    item.save()
-                    saved_count += 1
-
-            # PDF oluştur ve Google Drive'a yükle
-            try:
-                result = generate_declaration_pdf(declaration)
-                if result.get('drive_url'):
-                    declaration.pdf_url = result['drive_url']
-                    declaration.save()
-                    messages.success(request, f'Erklärung {declaration.declaration_number} wurde erfolgreich erstellt und auf Google Drive hochgeladen!')
-                else:
-                    messages.warning(request, f'Erklärung {declaration.declaration_number} wurde erstellt, aber das Hochladen auf Google Drive ist fehlgeschlagen.')
-            except Exception as e:
-                messages.warning(request, f'Erklärung wurde erstellt, aber PDF-Fehler: {str(e)}')
+            # Declaration ve tüm satırlar tek transaction'da: hata olursa yarım kayıt kalmaz
+            with transaction.atomic():
+                declaration.save()
+                create_line_items(
+                    declaration,
+                    product_work_rows(product_work_formset),
+                    item_rows(material_formset, request.POST)
+                )
+                # PDF arka planda oluşturulup depolamaya yüklenecek
+                enqueue_pdf_job(declaration)
+
+            messages.success(request, f'Erklärung {declaration.declaration_number} wurde erfolgreich erstellt. Das PDF wird im Hintergrund erstellt.')
 
             return redirect('declaration_detail', pk=declaration.pk)
         else:
-            declaration.delete()  # Hata varsa declaration'ı sil
-
-            # Debug: Form hatalarını göster
-            print("=" * 80)
-            print("FORM VALIDATION ERRORS:")
-            print("=" * 80)
-            print("Product Work Formset Valid:", product_work_formset.is_valid())
-            print("Product Work Errors:", product_work_formset.errors)
-            print("Material Formset Valid:", material_formset.is_valid())
-            print("Material Errors:", material_formset.errors)
-            print("=" * 80)
+            # Sadece hatalı alan isimleri loglanır (girilen değerler değil)
+            logger.debug(
+                'Declaration create: form errors product_works=%s materials=%s',
+                [sorted(errors) for errors in product_work_formset.errors],
+                [sorted(errors) for errors in material_formset.errors],
+            )
 
             messages.error(request, 'Es gibt Fehler im Formular, bitte überprüfen Sie es.')
     else:
@@ -215,12 +186,9 @@ def declaration_create(request):
         material_formset = DeclarationItemFormSet(instance=declaration, prefix='materials', user=request.user)
 
     # MaterialProduct'ları ve Hersteller Profile'ı gönder (sadece kullanıcının kendi ürünleri)
-    material_products = MaterialProduct.objects.filter(user=request.user, is_active=True)
+    material_products = material_formset.catalog
 
-    try:
-        hersteller_profile = request.user.hersteller_profile
-    except HerstellerProfile.DoesNotExist:
-        hersteller_profile = None
+    hersteller_profile = get_cached_profile(request.user.pk)
 
     return render(request, 'declarations/declaration_create.html', {
         'product_work_formset': product_work_formset,
@@ -230,6 +198,90 @@ def declaration_create(request):
     })
 
 
+@login_required
+def declaration_bulk_import(request):
+    """Referans PDF'lerden (veya ZIP'ten) toplu taslak Erklärung oluştur (arka planda)"""
+    if request.user.is_superuser:
+        return redirect('/admin/')
+
+    max_files = getattr(settings, 'BULK_IMPORT_MAX_FILES', 100)
+    max_total_bytes = getattr(settings, 'BULK_IMPORT_MAX_TOTAL_BYTES', 200 * 1024 * 1024)
+
+    if request.method == 'POST':
+        files = request.FILES.getlist('files')
+        if not files:
+            messages.error(request, 'Bitte wählen Sie mindestens eine PDF- oder ZIP-Datei aus.')
+            return redirect('declaration_bulk_import')
+
+        # Request'te sadece yükleme boyutu / sayısı kontrol edilir; ZIP açma ve
+        # parse import worker'da yapılır (ZIP içerikleri orada sınırlanır)
+        if len(files) > max_files:
+            messages.error(request, f'Zu viele Dateien (max. {max_files} pro Import).')
+            return redirect('declaration_bulk_import')
+        if sum(f.size for f in files) > max_total_bytes:
+            messages.error(request, f'Gesamtgröße des Imports überschritten (max. {max_total_bytes // (1024 * 1024)} MB pro Import).')
+            return redirect('declaration_bulk_import')
+
+        job = enqueue_import(request.user, [(f.name, f) for f in files])
+        messages.success(request, 'Die Dateien wurden hochgeladen und werden im Hintergrund importiert.')
+        return redirect('declaration_import_job', pk=job.pk)
+
+    return render(request, 'declarations/declaration_bulk_import.html', {
+        'recent_jobs': ImportJob.objects.filter(praxis=request.user).defer('results')[:5],
+        'max_files': max_files,
+        'max_total_mb': max_total_bytes // (1024 * 1024),
+    })
+
+
+@login_required
+def declaration_import_job(request, pk):
+    """Import işinin durumu ve dosya başına sonuçları"""
+    if request.user.is_superuser:
+        return redirect('/admin/')
+
+    job = get_object_or_404(ImportJob, pk=pk, praxis=request.user)
+    results = job.results
+
+    return render(request, 'declarations/declaration_import_job.html', {
+        'job': job,
+        'results': results,
+        'created': sum(result['status'] == STATUS_CREATED for result in results),
+        'duplicates': sum(result['status'] == STATUS_DUPLICATE for result in results),
+        'errors': sum(result['status'] not in (STATUS_CREATED, STATUS_DUPLICATE) for result in results),
+    })
+
+
+@login_required
+def declaration_drafts(request):
+    """Toplu importtan gelen taslaklar: seçilenler tek partide fertigstellen"""
+    if request.user.is_superuser:
+        return redirect('/admin/')
+
+    drafts = Declaration.objects.filter(praxis=request.user, is_draft=True)
+
+    if request.method == 'POST':
+        selected = [pk for pk in request.POST.getlist('declarations') if pk.isdigit()]
+        if not selected:
+            messages.error(request, 'Bitte wählen Sie mindestens einen Entwurf aus.')
+            return redirect('declaration_drafts')
+
+        finalized = finalize_drafts(request.user, selected)
+        if finalized:
+            messages.success(request, f'{len(finalized)} Erklärungen wurden fertiggestellt. Die PDFs werden im Hintergrund erstellt.')
+        skipped = len(selected) - len(finalized)
+        if skipped:
+            messages.warning(request, f'{skipped} Entwürfe ohne Auftragsnummer wurden nicht fertiggestellt.')
+        return redirect('declaration_drafts')
+
+    # Keyset pagination: declaration_list ile aynı sıralama
+    page = keyset_paginate(request, drafts, ['created_at', 'id'], get_page_size(request))
+
+    return render(request, 'declarations/declaration_drafts.html', {
+        'drafts': page,
+        'page': page,
+    })
+
+
 @login_required
 def declaration_edit(request, pk):
     """Beyan düzenle"""
@@ -249,6 +301,7 @@ def declaration_edit(request, pk):
             messages.error(request, 'Auftragsnummer ist erforderlich!')
             return redirect('declaration_edit', pk=pk)
 
+        header_snapshot = snapshot_header(declaration)
         declaration.auftragsnummer = auftragsnummer
         declaration.patient_name = patient_name
 
@@ -258,124 +311,48 @@ def declaration_edit(request, pk):
             except ValueError:
                 pass
 
-        declaration.save()
-
         # Formset'leri işle
         product_work_formset = ProductWorkFormSet(request.POST, instance=declaration, prefix='product_works')
         material_formset = DeclarationItemFormSet(request.POST, instance=declaration, prefix='materials', user=request.user)
 
         if product_work_formset.is_valid() and material_formset.is_valid():
-            # Önce product work verilerini POST'tan al
-            product_work_data = {}
-            for key in request.POST.keys():
-                if key.startswith('product_works-'):
-                    try:
-                        parts = key.split('-')
-                        if len(parts) == 3:
-                            index = int(parts[1])
-                            field = parts[2]
-                            value = request.POST.get(key, '').strip()
-
-                            if index not in product_work_data:
-                                product_work_data[index] = {}
-
-                            product_work_data[index][field] = value
-                    except (ValueError, IndexError):
-                        continue
-
-            # Mevcut product works'leri sil
-            declaration.product_works.all().delete()
-
-            # Yeni product works'leri kaydet
-            saved_count = 0
-            for form_index, form in enumerate(product_work_formset.forms):
-                # DELETE checkbox işaretliyse atla
-                if form.cleaned_data.get('DELETE'):
-                    continue
-
-                # Form'dan veriyi al
-                data = form.cleaned_data
-                if data.get('produktbezeichnung_arbeit'):  # En azından produktbezeichnung olmalı
-                    pw = ProductWork(
-                        declaration=declaration,
-                        line_number=saved_count + 1,
-                        produktbezeichnung_arbeit=data.get('produktbezeichnung_arbeit', ''),
-                        zahnnummer=data.get('zahnnummer', ''),
-                        zahnfarbe=data.get('zahnfarbe', '')
-                    )
-                    pw.save()
-                    saved_count += 1
-
-            # Mevcut materials'ı sil
-            declaration.items.all().delete()
-
-            # Önce tüm material ve firma değerlerini POST'tan al (hidden field'lar)
-            material_data = {}
-            for key in request.POST.keys():
-                if key.startswith('materials-') and '-material' in key:
-                    try:
-                        # materials-0-material -> index: 0, field: material
-                        parts = key.split('-')
-                        if len(parts) == 3:
-                            index = int(parts[1])
-                            field = parts[2]
-                            value = request.POST.get(key, '').strip()
-
-                            if index not in material_data:
-                                material_data[index] = {}
-
-                            material_data[index][field] = value
-                    except (ValueError, IndexError):
-                        continue
-
-            # Formset'ten item'ları al
-            items = material_formset.save(commit=False)
-
-            # Her bir kaydedilecek item için
-            saved_count = 0
-            for form_index, form in enumerate(material_formset.forms):
-                # DELETE checkbox işaretliyse atla
-                if form.cleaned_data.get('DELETE'):
-                    continue
-
-                # Bu form için item'ı al
-                if saved_count < len(items):
-                    item = items[saved_count]
-                    item.line_number = saved_count + 1
-
-                    # Hidden field'lardan material ve firma değerlerini al
-                    if form_index in material_data:
-                        if not item.material and material_data[form_index].get('material'):
-                            item.material = material_data[form_index]['material']
-                        if not item.firma and material_data[form_index].get('firma'):
-                            item.firma = material_data[form_index]['firma']
-
-                    item.save()
-                    saved_count += 1
-
-            # Eski PDF'i Google Drive'dan sil
-            if declaration.pdf_url:
-                try:
-                    from .utils import delete_from_drive
-                    # URL'den file ID'yi çıkar
-                    if '/d/' in declaration.pdf_url:
-                        file_id = declaration.pdf_url.split('/d/')[1].split('/')[0]
-                        delete_from_drive(file_id)
-                        print(f"Eski PDF silindi: {file_id}")
-                except Exception as e:
-                    print(f"Eski PDF silinirken hata: {str(e)}")
-
-            # PDF'i yeniden oluştur ve yükle
-            try:
-                result = generate_declaration_pdf(declaration)
-                if result.get('drive_url'):
-                    declaration.pdf_url = result['drive_url']
-                    declaration.save()
-                    messages.success(request, f'Erklärung {declaration.declaration_number} wurde erfolgreich aktualisiert und PDF erneuert!')
-                else:
-                    messages.warning(request, 'Erklärung wurde aktualisiert, aber das Hochladen des PDFs ist fehlgeschlagen.')
-            except Exception as e:
-                messages.warning(request, f'Erklärung wurde aktualisiert, aber PDF-Fehler: {str(e)}')
+            product_works = product_work_rows(product_work_formset)
+            items = item_rows(material_formset, request.POST)
+
+            # Sadece değişen alanlar / satırlar tek transaction'da yazılır
+            changes = ChangeSet(changed_header_fields(declaration, header_snapshot))
+            with transaction.atomic():
+                if changes.header_fields:
+                    # Sadece değişen başlık alanları: bu arada worker'ın yazdığı
+                    # pdf_url / pdf_content_hash eski değerlerle ezilmez
+                    declaration.save(update_fields=changes.header_fields + ['updated_at'])
+                sync_line_items(declaration, product_works, items, changes=changes)
+                if changes.lines_changed and not changes.header_fields:
+                    # Satır değişikliği de declaration'ın updated_at'ini günceller
+                    Declaration.objects.filter(pk=declaration.pk).update(updated_at=timezone.now())
+            logger.debug('Declaration %s edit: %s', declaration.pk, changes.summary())
+
+            if declaration.is_draft:
+                # Taslak: PDF yok; "Speichern und fertigstellen" numara verip PDF'i kuyruğa alır
+                if 'finalize' in request.POST and finalize_drafts(request.user, [declaration.pk]):
+                    declaration.refresh_from_db(fields=['declaration_number', 'is_draft'])
+                    messages.success(request, f'Erklärung {declaration.declaration_number} wurde fertiggestellt. Das PDF wird im Hintergrund erstellt.')
+                    return redirect('declaration_detail', pk=declaration.pk)
+                messages.success(request, 'Der Entwurf wurde gespeichert.')
+                return redirect('declaration_drafts')
+
+            if changes:
+                # PDF'i arka planda yeniden oluştur (eski PDF yenisi yüklendikten sonra silinir;
+                # veriler son PDF'le aynıysa worker render'ı atlar)
+                enqueue_pdf_job(declaration)
+                messages.success(request, f'Erklärung {declaration.declaration_number} wurde erfolgreich aktualisiert. Das PDF wird im Hintergrund erneuert.')
+            elif is_render_current(declaration):
+                # Hiçbir şey değişmedi ve PDF güncel: mevcut PDF aynen kullanılır
+                messages.success(request, f'Erklärung {declaration.declaration_number} wurde gespeichert. Keine Änderungen, das bestehende PDF bleibt gültig.')
+            else:
+                # Değişiklik yok ama PDF eksik veya template değişmiş
+                enqueue_pdf_job(declaration)
+                messages.success(request, f'Erklärung {declaration.declaration_number} wurde gespeichert. Das PDF wird im Hintergrund erneuert.')
 
             return redirect('declaration_detail', pk=declaration.pk)
         else:
@@ -384,7 +361,7 @@ def declaration_edit(request, pk):
         # Edit için extra=0 kullan (boş satır ekleme)
         ProductWorkFormSetEdit = forms.inlineformset_factory(
             Declaration, ProductWork, form=ProductWorkForm,
-            extra=0, max_num=20, can_delete=True
+            formset=BaseLineItemFormSet, extra=0, max_num=20, can_delete=True
         )
         DeclarationItemFormSetEdit = forms.inlineformset_factory(
             Declaration, DeclarationItem, form=DeclarationItemForm,
@@ -395,12 +372,9 @@ def declaration_edit(request, pk):
         material_formset = DeclarationItemFormSetEdit(instance=declaration, prefix='materials', user=request.user)
 
     # MaterialProduct'ları ve Hersteller Profile'ı gönder
-    material_products = MaterialProduct.objects.filter(user=request.user, is_active=True)
+    material_products = material_formset.catalog
 
-    try:
-        hersteller_profile = request.user.hersteller_profile
-    except HerstellerProfile.DoesNotExist:
-        hersteller_profile = None
+    hersteller_profile = get_cached_profile(request.user.pk)
 
     return render(request, 'declarations/declaration_edit.html', {
         'declaration': declaration,
@@ -419,21 +393,23 @@ def declaration_delete(request, pk):
 
     declaration = get_object_or_404(Declaration, pk=pk, praxis=request.user)
 
-    # Google Drive'dan PDF'i sil
-    if declaration.pdf_url:
+    pdf_url = declaration.pdf_url
+    declaration_number = declaration.declaration_number or 'Entwurf'
+    is_draft = declaration.is_draft
+    declaration.delete()
+
+    # PDF'i depolamadan sil (kayıt silindikten sonra: içerik adresli
+    # depolamada dosya başka bir kayıt tarafından kullanılıyor olabilir)
+    if pdf_url:
         try:
-            from .utils import delete_from_drive
-            if '/d/' in declaration.pdf_url:
-                file_id = declaration.pdf_url.split('/d/')[1].split('/')[0]
-                delete_from_drive(file_id)
-                print(f"PDF silindi: {file_id}")
-        except Exception as e:
-            print(f"PDF silinirken hata: {str(e)}")
+            from .utils import delete_document
+            if delete_document(pdf_url):
+                logger.info('PDF silindi: %s', pdf_url)
+        except Exception:
+            logger.exception('PDF silinirken hata: %s', pdf_url)
 
-    declaration_number = declaration.declaration_number
-    declaration.delete()
     messages.success(request, f'Erklärung {declaration_number} wurde erfolgreich gelöscht!')
-    return redirect('declaration_list')
+    return redirect('declaration_drafts' if is_draft else 'declaration_list')
 
 
 @login_required
@@ -444,16 +420,31 @@ def declaration_detail(request, pk):
         return redirect('/admin/')
 
     declaration = get_object_or_404(Declaration, pk=pk, praxis=request.user)
+    if declaration.is_draft:
+        # Taslağın PDF'i yok: düzenleme sayfasında fertigstellen
+        return redirect('declaration_edit', pk=pk)
 
-    # Hersteller profile bilgisini al
-    try:
-        hersteller_profile = request.user.hersteller_profile
-    except HerstellerProfile.DoesNotExist:
-        hersteller_profile = None
+    # Hersteller profile bilgisini al (cache'ten)
+    hersteller_profile = get_cached_profile(request.user.pk)
 
     return render(request, 'declarations/declaration_detail.html', {
         'declaration': declaration,
-        'hersteller_profile': hersteller_profile
+        'hersteller_profile': hersteller_profile,
+        'pdf_job': get_active_job(declaration)
+    })
+
+
+@login_required
+def declaration_pdf_status(request, pk):
+    """AJAX endpoint: PDF işinin durumunu JSON olarak döndür (detail sayfası polling)"""
+    declaration = get_object_or_404(Declaration, pk=pk, praxis=request.user, is_draft=False)
+    job = get_latest_job(declaration)
+
+    return JsonResponse({
+        'status': job.status if job else None,
+        'attempts': job.attempts if job else 0,
+        'pdf_url': declaration.pdf_url,
+        'ready': bool(declaration.pdf_url) and not (job and job.is_active),
     })
 
 
@@ -503,7 +494,7 @@ def material_product_create(request):
 @login_required
 def material_product_delete(request, pk):
     """Material product sil"""
-    product = get_object_or_404(MaterialProduct, pk=pk)
+    product = get_object_or_404(MaterialProduct, pk=pk, user=request.user)
     name = product.name
     product.delete()
     messages.success(request, f'Material Product "{name}" silindi!')
@@ -559,7 +550,7 @@ def archive_list(request):
     if request.user.is_superuser:
         return redirect('/admin/')
     
-    documents = ArchiveDocument.objects.filter(user=request.user).order_by('-document_date', '-upload_date')
+    documents = ArchiveDocument.objects.filter(user=request.user)
     
     # Kategoriye göre filtrele
     category = request.GET.get('category')
@@ -583,8 +574,12 @@ def archive_list(request):
         custom_category__isnull=False
     ).exclude(custom_category='').values_list('custom_category', flat=True).distinct().order_by('custom_category')
 
+    # Keyset pagination: (document_date, upload_date, id) azalan, tarihsiz belgeler en sonda
+    page = keyset_paginate(request, documents, ['document_date', 'upload_date', 'id'], get_page_size(request))
+
     context = {
-        'documents': documents,
+        'documents': page,
+        'page': page,
         'categories': ArchiveDocument.CATEGORY_CHOICES,
         'custom_categories': list(custom_categories),
         'selected_category': category,
@@ -647,10 +642,10 @@ def archive_upload(request):
             file_name=file.name
         )
         
-        # Google Drive'a yükle
+        # Depolama backend'ine yükle
         try:
-            from .utils import upload_to_drive
-            result = upload_to_drive(file, title, file.name)
+            from .utils import upload_document
+            result = upload_document(file, title, file.name)
             
             if result:
                 document.drive_file_id = result.get('id', '')
@@ -659,7 +654,7 @@ def archive_upload(request):
                 messages.success(request, f'Dokument "{title}" wurde erfolgreich hochgeladen!')
             else:
                 document.delete()
-                messages.error(request, 'Fehler beim Hochladen zu Google Drive.')
+                messages.error(request, 'Fehler beim Hochladen des Dokuments.')
         except Exception as e:
             document.delete()
             messages.error(request, f'Fehler: {str(e)}')
@@ -679,12 +674,39 @@ def archive_view(request, pk):
         return redirect('/admin/')
     
     document = get_object_or_404(ArchiveDocument, pk=pk, user=request.user)
-    
+    storage, _key = storage_for_url(document.drive_url)
+
     return render(request, 'declarations/archive/archive_view.html', {
-        'document': document
+        'document': document,
+        'is_local_storage': isinstance(storage, LocalFileSystemStorage),
     })
 
 
+@login_required
+@xframe_options_sameorigin
+def document_file(request, key):
+    """
+    Yerel depolamadaki (LocalFileSystemStorage) bir dökümanı gönder.
+    Sadece dökümanın sahibi (declaration praxis'i / archive kullanıcısı) erişebilir.
+    Archive görünümündeki iframe için aynı origin'den frame'lenebilir.
+    """
+    storage = get_document_storage('declarations.storage.LocalFileSystemStorage')
+    url = storage.url(key)
+
+    declaration = Declaration.objects.filter(praxis=request.user, pdf_url=url).only('declaration_number').first()
+    if declaration:
+        filename = f"{declaration.declaration_number}.pdf"
+    else:
+        document = ArchiveDocument.objects.filter(user=request.user, drive_url=url).only('file_name').first()
+        if not document:
+            raise Http404
+        filename = document.file_name
+
+    if not storage.exists(key):
+        raise Http404
+    return FileResponse(storage.open(key), content_type=guess_content_type(filename), filename=filename)
+
+
 @login_required
 def archive_delete(request, pk):
     """Archiv Dokument löschen"""
@@ -694,16 +716,18 @@ def archive_delete(request, pk):
     document = get_object_or_404(ArchiveDocument, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        # Google Drive'dan sil
-        if document.drive_file_id:
-            try:
-                from .utils import delete_from_drive
-                delete_from_drive(document.drive_file_id)
-            except Exception as e:
-                messages.warning(request, f'Warnung: Fehler beim Löschen von Google Drive: {str(e)}')
-        
+        drive_url = document.drive_url
         title = document.title
         document.delete()
+
+        # Depolamadan sil (kayıt silindikten sonra, bkz. delete_document)
+        if drive_url:
+            try:
+                from .utils import delete_document
+                delete_document(drive_url)
+            except Exception as e:
+                messages.warning(request, f'Warnung: Fehler beim Löschen der Datei: {str(e)}')
+
         messages.success(request, f'Dokument "{title}" wurde gelöscht!')
         return redirect('archive_list')
 
@@ -732,18 +756,17 @@ def parse_reference_pdf(request):
 
     # Hata kontrolü
     if 'error' in parsed_data:
-        return JsonResponse({'error': parsed_data['error']}, status=400)
-
-    # Debug: Print parsed data
-    print("=" * 80)
-    print("DEBUG: PARSED DATA TO RETURN")
-    print("=" * 80)
-    print(f"Auftragsnummer: {parsed_data.get('auftragsnummer')}")
-    print(f"Patient Name: {parsed_data.get('patient_name')}")
-    print(f"Herstellungsdatum: {parsed_data.get('herstellungsdatum')}")
-    print(f"Product Works: {parsed_data.get('product_works')}")
-    print(f"Materials: {parsed_data.get('materials')}")
-    print("=" * 80)
+        code = parsed_data.get('code', 'parse_error')
+        return JsonResponse(
+            {'error': parsed_data['error'], 'code': code},
+            status=PARSE_ERROR_STATUS.get(code, 400)
+        )
+
+    # Hasta bilgisi loglanmaz; sadece satır sayıları
+    logger.debug(
+        'Reference PDF parsed: product_works=%d materials=%d',
+        len(parsed_data.get('product_works') or []), len(parsed_data.get('materials') or []),
+    )
 
     return JsonResponse(parsed_data)
 
@@ -956,3 +979,19 @@ def profile_edit(request):
         'profile_required': profile_required,
         'user_email': request.user.email
     })
+
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus metrikleri (text format). Sadece superuser veya
+    settings.METRICS_TOKEN ile (Authorization: Bearer ...) erişilebilir.
+    """
+    authorized = request.user.is_authenticated and request.user.is_superuser
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not authorized and token:
+        authorized = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized:
+        raise Http404
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,26 +1,71 @@
+import io
 import os
 import json
+import logging
 import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from pathlib import Path
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
 
 # Google Drive API izinleri
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Yüklenen dosyalar için istenen alanlar ve herkese açık okuma izni
+FILE_LINK_FIELDS = 'id, name, webViewLink, webContentLink, iconLink'
+PUBLIC_READ_PERMISSION = {'role': 'reader', 'type': 'anyone'}
+
+# Resumable upload parça boyutu
+RESUMABLE_CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
 # Proje root dizini
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-def get_drive_service():
-    """Google Drive servisini başlatır"""
+# ==================== DRIVE CLIENT ====================
+# Credentials process genelinde bellekte tutulur ve sadece süresi dolmak
+# üzereyken yenilenir. googleapiclient/httplib2 nesneleri thread-safe
+# olmadığından service nesneleri thread başına bir kez oluşturulur.
+
+# Access token'ın bitmesine bu kadar süre kala yenile
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_discovery_document = None
+_thread_local = threading.local()
+
+
+def _token_path():
+    return BASE_DIR / 'token.pickle'
+
+
+def _needs_refresh(creds):
+    if not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+    # google-auth expiry'yi naive UTC olarak tutar
+    return creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+
+
+def _load_credentials():
+    """token.pickle'dan credentials yükle, yoksa OAuth akışını başlat"""
     creds = None
-    
-    # Dosya yollarını absolute path olarak belirle
-    token_path = BASE_DIR / 'token.pickle'
+    token_path = _token_path()
     credentials_path = BASE_DIR / 'credentials.json'
 
     # Token varsa yükle
@@ -28,22 +73,67 @@ def get_drive_service():
         with open(token_path, 'rb') as token:
             creds = pickle.load(token)
 
-    # Token yoksa veya geçersizse yenile
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(str(credentials_path), SCOPES)
-            creds = flow.run_local_server(port=8080)
+    # Token yoksa veya yenilenemiyorsa OAuth akışı
+    if not creds or not creds.refresh_token:
+        flow = InstalledAppFlow.from_client_secrets_file(str(credentials_path), SCOPES)
+        creds = flow.run_local_server(port=8080)
+        _save_credentials(creds)
+    return creds
+
+
+def _save_credentials(creds):
+    with open(_token_path(), 'wb') as token:
+        pickle.dump(creds, token)
+
+
+def get_drive_credentials():
+    """Process genelinde paylaşılan credentials (gerekirse yenilenir)"""
+    global _credentials
+    creds = _credentials
+    if creds is not None and not _needs_refresh(creds):
+        return creds
+
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = _load_credentials()
+        if _needs_refresh(_credentials):
+            _credentials.refresh(Request())
+            _save_credentials(_credentials)
+        return _credentials
+
+
+def _get_discovery_document():
+    """googleapiclient ile gelen statik Drive v3 discovery dokümanı (bir kez parse edilir)"""
+    global _discovery_document
+    if _discovery_document is None:
+        _discovery_document = json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+    return _discovery_document
 
-        # Token kaydet
-        with open(token_path, 'wb') as token:
-            pickle.dump(creds, token)
 
-    service = build('drive', 'v3', credentials=creds)
+def get_drive_service():
+    """
+    Google Drive servisini döner.
+
+    Service nesnesi thread başına bir kez oluşturulur ve tekrar kullanılır;
+    sonraki çağrılar sadece token süresini kontrol eder.
+    """
+    creds = get_drive_credentials()
+    service = getattr(_thread_local, 'service', None)
+    if service is None or getattr(_thread_local, 'credentials', None) is not creds:
+        service = build_from_document(_get_discovery_document(), credentials=creds)
+        _thread_local.service = service
+        _thread_local.credentials = creds
     return service
 
 
+def reset_drive_client():
+    """Cache'lenmiş credentials'ı bırak (ör. token iptal edildiğinde)"""
+    global _credentials
+    with _credentials_lock:
+        _credentials = None
+
+
+@timed('drive.create_folder')
 def create_folder(service, folder_name, parent_id=None):
     """Google Drive'da klasör oluşturur"""
     file_metadata = {
@@ -57,6 +147,7 @@ def create_folder(service, folder_name, parent_id=None):
     return folder.get('id')
 
 
+@timed('drive.find_folder')
 def find_folder(service, folder_name, parent_id=None):
     """Klasör var mı kontrol eder, varsa ID döner"""
     query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
@@ -70,32 +161,74 @@ def find_folder(service, folder_name, parent_id=None):
 
 def upload_file(service, file_path, folder_id, file_name):
     """Dosyayı Google Drive'a yükler ve linkle erişime açar"""
-    file_metadata = {'name': file_name, 'parents': [folder_id]}
     media = MediaFileUpload(file_path, resumable=True)
+    return upload_media(service, media, folder_id, file_name)
 
+
+def upload_bytes(service, data, folder_id, file_name, mimetype='application/octet-stream'):
+    """
+    Bellekteki veriyi (bytes / memoryview) diske yazmadan Google Drive'a yükler
+
+    Küçük dosyalar (PDF'ler) için tek istekli multipart upload kullanılır.
+    """
+    # BytesIO, bytes üzerinde yazılmadıkça kopya oluşturmaz
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, resumable=False)
+    return upload_media(service, media, folder_id, file_name)
+
+
+def upload_stream(service, stream, folder_id, file_name, mimetype='application/octet-stream', chunksize=None):
+    """
+    Dosya benzeri nesneyi (ör. Django UploadedFile) geçici dosyaya kopyalamadan
+    parça parça (resumable) Google Drive'a yükler. Bellekte aynı anda en fazla
+    bir parça tutulur.
+
+    Args:
+        chunksize: Parça boyutu (byte), 256 KB'ın katına yuvarlanır
+    """
+    chunksize = _resumable_chunksize(chunksize or DEFAULT_UPLOAD_CHUNK_SIZE)
+    media = MediaIoBaseUpload(stream, mimetype=mimetype, chunksize=chunksize, resumable=True)
+    return upload_media(service, media, folder_id, file_name)
+
+
+def _resumable_chunksize(chunksize):
+    """Drive resumable upload parçaları 256 KB'ın katı olmalı"""
+    return max(RESUMABLE_CHUNK_ALIGNMENT, chunksize // RESUMABLE_CHUNK_ALIGNMENT * RESUMABLE_CHUNK_ALIGNMENT)
+
+
+@timed('drive.upload')
+def upload_media(service, media, folder_id, file_name):
+    """
+    MediaUpload nesnesini Google Drive'a yükler ve linkle erişime açar
+
+    Linkler create cevabından (veya bilinen URL kalıbından) alınır, izin
+    Drive batch endpoint'i üzerinden verilir; tekrar files().get yapılmaz.
+
+    Returns:
+        dict: id, name, view, download, icon ve 'timings' (ms cinsinden
+              'create' ve 'permission' süreleri)
+    """
+    file_metadata = {'name': file_name, 'parents': [folder_id]}
+    timings = {}
+
+    start = time.perf_counter()
     created = service.files().create(
         body=file_metadata,
         media_body=media,
-        fields='id, name, webViewLink, webContentLink, iconLink'
+        fields=FILE_LINK_FIELDS
     ).execute()
+    timings['create'] = (time.perf_counter() - start) * 1000
 
     file_id = created['id']
 
     # 🔓 Herkese açık (read-only) izin ver
+    start = time.perf_counter()
     try:
-        service.permissions().create(
-            fileId=file_id,
-            body={'role': 'reader', 'type': 'anyone'},
-            fields='id'
-        ).execute()
-
-        # Güncel linkleri tekrar al
-        created = service.files().get(
-            fileId=file_id,
-            fields='id, name, webViewLink, webContentLink, iconLink'
-        ).execute()
-    except Exception as e:
-        print(f"Permission error: {e}")
+        errors = grant_public_read(service, [file_id])
+        if errors:
+            logger.warning('Drive permission error (%s): %s', file_id, errors[file_id])
+    except Exception:
+        logger.exception('Drive permission error (%s)', file_id)
+    timings['permission'] = (time.perf_counter() - start) * 1000
 
     # Linkler
     view_link = created.get('webViewLink') or f"https://drive.google.com/file/d/{file_id}/view"
@@ -107,9 +240,35 @@ def upload_file(service, file_path, folder_id, file_name):
         'view': view_link,
         'download': download_link,
         'icon': created.get('iconLink'),
+        'timings': timings,
     }
 
 
+@timed('drive.permission')
+def grant_public_read(service, file_ids):
+    """
+    Dosyalara tek bir batch HTTP isteğiyle herkese açık okuma izni verir
+
+    Returns:
+        dict: Başarısız olan file_id -> exception
+    """
+    errors = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+
+    batch = service.new_batch_http_request(callback=callback)
+    for file_id in file_ids:
+        batch.add(
+            service.permissions().create(fileId=file_id, body=PUBLIC_READ_PERMISSION, fields='id'),
+            request_id=file_id
+        )
+    batch.execute()
+    return errors
+
+
+@timed('drive.get')
 def get_file_download_link(service, file_id):
     """Dosya indirme linki oluşturur"""
     file = service.files().get(
@@ -119,27 +278,29 @@ def get_file_download_link(service, file_id):
     return file.get('webContentLink') or file.get('webViewLink')
 
 
+@timed('drive.delete')
 def delete_file(service, file_id):
     """Dosyayı siler"""
     try:
         service.files().delete(fileId=file_id).execute()
         return True
     except Exception as e:
-        print(f"Dosya silinemedi: {e}")
+        logger.warning('Dosya silinemedi (%s): %s', file_id, e)
         return False
 
 
+@timed('drive.permission')
 def ensure_anyone_reader_on_folder(service, folder_id):
     """Klasörü herkese açık yapar (isteğe bağlı)"""
     try:
         service.permissions().create(
             fileId=folder_id,
-            body={'role': 'reader', 'type': 'anyone'},
+            body=PUBLIC_READ_PERMISSION,
             fields='id'
         ).execute()
         return True
     except Exception as e:
-        print(f"Klasör izin hatası: {e}")
+        logger.warning('Klasör izin hatası (%s): %s', folder_id, e)
         return False
     
 def delete_file_by_url(service, file_url):
@@ -150,13 +311,191 @@ def delete_file_by_url(service, file_url):
         if '/file/d/' in file_url:
             file_id = file_url.split('/file/d/')[1].split('/')[0]
             service.files().delete(fileId=file_id).execute()
-            print(f"✓ Dosya silindi: {file_id}")
+            logger.info('Dosya silindi: %s', file_id)
             return True
     except Exception as e:
-        print(f"✗ Dosya silinemedi: {e}")
+        logger.warning('Dosya silinemedi (%s): %s', file_url, e)
         return False
 
 
+# ==================== FOLDER ID CACHE ====================
+# Klasör yolu → ID eşlemesi önce process içi LRU'da, sonra DB'de (DriveFolder)
+# aranır. Sadece ikisinde de yoksa Drive'a find/create sorgusu atılır.
+
+FOLDER_CACHE_SIZE = 256
+# Kilidi tutan worker bu süre içinde klasörü oluşturmazsa kilit bayat sayılır
+FOLDER_LOCK_TIMEOUT = 30
+
+_folder_cache = OrderedDict()
+_folder_cache_lock = threading.Lock()
+_folder_create_lock = threading.Lock()
+
+
+def _folder_key(names):
+    return '/'.join(name.replace('/', '\\/') for name in names)
+
+
+def _segment_names(segment):
+    """Yol parçası str veya alternatif isimler tuple'ı olabilir (ilki oluşturulur)"""
+    return (segment,) if isinstance(segment, str) else tuple(segment)
+
+
+def _cache_get(key):
+    with _folder_cache_lock:
+        folder_id = _folder_cache.get(key)
+        if folder_id:
+            _folder_cache.move_to_end(key)
+        return folder_id
+
+
+def _cache_put(key, folder_id):
+    with _folder_cache_lock:
+        _folder_cache[key] = folder_id
+        _folder_cache.move_to_end(key)
+        while len(_folder_cache) > FOLDER_CACHE_SIZE:
+            _folder_cache.popitem(last=False)
+
+
+def _lookup_folder(key):
+    folder_id = _cache_get(key)
+    if folder_id:
+        return folder_id
+
+    from declarations.models import DriveFolder
+    folder_id = DriveFolder.objects.filter(path=key).values_list('folder_id', flat=True).first()
+    if folder_id:
+        _cache_put(key, folder_id)
+    return folder_id
+
+
+def _find_any(service, names, parent_id):
+    for name in names:
+        folder_id = find_folder(service, name, parent_id=parent_id)
+        if folder_id:
+            return folder_id
+    return None
+
+
+def _find_or_create_locked(service, key, names, parent_id):
+    """
+    Klasörü bul veya oluştur; DriveFolder satırı (unique path) süreçler arası
+    kilit olarak kullanılır, böylece aynı klasör iki kez oluşturulmaz.
+    """
+    from django.db import IntegrityError, transaction
+    from django.utils import timezone
+    from declarations.models import DriveFolder
+
+    while True:
+        try:
+            with transaction.atomic():
+                DriveFolder.objects.create(path=key, folder_id='')
+        except IntegrityError:
+            # Başka bir worker oluşturuyor (veya zaten oluşturdu) - bekle
+            row = DriveFolder.objects.filter(path=key).values_list('folder_id', 'updated_at').first()
+            if row is None:
+                continue  # Kilit sahibi başarısız oldu, tekrar dene
+            folder_id, locked_at = row
+            if folder_id:
+                return folder_id
+            if (timezone.now() - locked_at).total_seconds() < FOLDER_LOCK_TIMEOUT:
+                time.sleep(0.2)
+                continue
+            # Bayat kilit: devral
+            if not DriveFolder.objects.filter(path=key, folder_id='', updated_at=locked_at).update(updated_at=timezone.now()):
+                continue
+
+        try:
+            folder_id = _find_any(service, names, parent_id) or create_folder(service, names[0], parent_id=parent_id)
+        except Exception:
+            DriveFolder.objects.filter(path=key, folder_id='').delete()
+            raise
+        DriveFolder.objects.filter(path=key).update(folder_id=folder_id, updated_at=timezone.now())
+        return folder_id
+
+
+def get_or_create_folder_path(service, path):
+    """
+    Klasör yolunu (ör. ['Zahnovia', 'Declarations']) ID'ye çevirir, eksik
+    klasörleri oluşturur. Sonuçlar LRU + DB cache'inde tutulur.
+
+    Args:
+        service: Google Drive service
+        path: Klasör isimleri listesi. Bir eleman alternatif isimler tuple'ı
+              olabilir (ör. ('Gelir Faturalari', 'gelir faturalari'))
+
+    Returns:
+        str: Son klasörün ID'si
+    """
+    segments = [_segment_names(segment) for segment in path]
+    full_key = _folder_key(names[0] for names in segments)
+
+    folder_id = _lookup_folder(full_key)
+    if folder_id:
+        return folder_id
+
+    with _folder_create_lock:
+        parent_id = None
+        for depth, names in enumerate(segments, start=1):
+            key = _folder_key(segment[0] for segment in segments[:depth])
+            folder_id = _lookup_folder(key)
+            if not folder_id:
+                folder_id = _find_or_create_locked(service, key, names, parent_id)
+                _cache_put(key, folder_id)
+            parent_id = folder_id
+    return parent_id
+
+
+def invalidate_folder_id(folder_id):
+    """
+    Drive'da artık bulunmayan (404) klasörü ve altındaki tüm yolları
+    cache'ten ve DB'den siler.
+    """
+    from declarations.models import DriveFolder
+
+    keys = set(DriveFolder.objects.filter(folder_id=folder_id).values_list('path', flat=True))
+    with _folder_cache_lock:
+        keys.update(key for key, value in _folder_cache.items() if value == folder_id)
+    _invalidate_keys(keys)
+
+
+def _invalidate_keys(keys):
+    """Verilen yolları ve alt yollarını LRU'dan ve DB'den siler"""
+    from django.db.models import Q
+    from declarations.models import DriveFolder
+
+    with _folder_cache_lock:
+        for key in list(_folder_cache):
+            if any(key == k or key.startswith(k + '/') for k in keys):
+                del _folder_cache[key]
+
+    if keys:
+        query = Q()
+        for key in keys:
+            query |= Q(path=key) | Q(path__startswith=key + '/')
+        DriveFolder.objects.filter(query).delete()
+
+
+def is_not_found_error(error):
+    return isinstance(error, HttpError) and getattr(error.resp, 'status', None) == 404
+
+
+def upload_to_folder_path(service, path, upload):
+    """
+    upload(folder_id) fonksiyonunu cache'teki klasör ID'si ile çağırır.
+    Klasör Drive'da silinmişse (404) cache temizlenir ve bir kez daha denenir.
+    """
+    folder_id = get_or_create_folder_path(service, path)
+    try:
+        return upload(folder_id)
+    except HttpError as e:
+        if not is_not_found_error(e):
+            raise
+        # Üst klasörlerden biri de silinmiş olabilir: tüm yolu yeniden doğrula
+        invalidate_folder_id(folder_id)
+        _invalidate_keys([_folder_key(_segment_names(path[0])[:1])])
+        return upload(get_or_create_folder_path(service, path))
+
+
 # ==================== HIGH-LEVEL FOLDER UTILITIES ====================
 
 def get_or_create_case_folder(service, praxis_name, auftragsnummer):
@@ -172,27 +511,7 @@ def get_or_create_case_folder(service, praxis_name, auftragsnummer):
     Returns:
         str: Auftrag klasörünün ID'si
     """
-    # Labor klasörü
-    labor_folder = find_folder(service, 'Labor')
-    if not labor_folder:
-        labor_folder = create_folder(service, 'Labor')
-
-    # Dental scans klasörü
-    dental_scans_folder = find_folder(service, 'Dental scans', parent_id=labor_folder)
-    if not dental_scans_folder:
-        dental_scans_folder = create_folder(service, 'Dental scans', parent_id=labor_folder)
-
-    # Praxis klasörü
-    praxis_folder = find_folder(service, praxis_name, parent_id=dental_scans_folder)
-    if not praxis_folder:
-        praxis_folder = create_folder(service, praxis_name, parent_id=dental_scans_folder)
-
-    # Auftrag klasörü
-    auftrag_folder = find_folder(service, auftragsnummer, parent_id=praxis_folder)
-    if not auftrag_folder:
-        auftrag_folder = create_folder(service, auftragsnummer, parent_id=praxis_folder)
-
-    return auftrag_folder
+    return get_or_create_folder_path(service, ['Labor', 'Dental scans', praxis_name, auftragsnummer])
 
 
 def get_or_create_muhasebe_folder(service, folder_type='gelir'):
@@ -206,22 +525,10 @@ def get_or_create_muhasebe_folder(service, folder_type='gelir'):
     Returns:
         str: Target klasörün ID'si
     """
-    # Muhasebe ana klasörü
-    muhasebe_folder = find_folder(service, 'muhasebe')
-    if not muhasebe_folder:
-        muhasebe_folder = create_folder(service, 'muhasebe')
-
-    # Alt klasör adı
+    # Alt klasör adı (hem büyük hem küçük harfle aranır)
     folder_name = 'Gelir Faturalari' if folder_type == 'gelir' else 'Gider Faturalari'
 
-    # Alt klasörü bul veya oluştur (hem büyük hem küçük harfle dene)
-    target_folder = find_folder(service, folder_name, parent_id=muhasebe_folder)
-    if not target_folder:
-        target_folder = find_folder(service, folder_name.lower(), parent_id=muhasebe_folder)
-    if not target_folder:
-        target_folder = create_folder(service, folder_name, parent_id=muhasebe_folder)
-
-    return target_folder
+    return get_or_create_folder_path(service, ['muhasebe', (folder_name, folder_name.lower())])
 
 
 def get_or_create_shipment_folder(service, lab_name, auftragsnummer):
@@ -236,22 +543,7 @@ def get_or_create_shipment_folder(service, lab_name, auftragsnummer):
     Returns:
         str: Shipment klasörünün ID'si
     """
-    # Shipment ana klasörü
-    shipment_root = find_folder(service, 'Shipment')
-    if not shipment_root:
-        shipment_root = create_folder(service, 'Shipment')
-
-    # Labor klasörü
-    labor_folder = find_folder(service, lab_name, parent_id=shipment_root)
-    if not labor_folder:
-        labor_folder = create_folder(service, lab_name, parent_id=shipment_root)
-
-    # Auftrag klasörü
-    shipment_folder = find_folder(service, auftragsnummer, parent_id=labor_folder)
-    if not shipment_folder:
-        shipment_folder = create_folder(service, auftragsnummer, parent_id=labor_folder)
-
-    return shipment_folder
+    return get_or_create_folder_path(service, ['Shipment', lab_name, auftragsnummer])
 
 
 def get_or_create_xml_folder(service):
@@ -264,17 +556,7 @@ def get_or_create_xml_folder(service):
     Returns:
         str: XML klasörünün ID'si
     """
-    # Labor klasörü
-    labor_folder = find_folder(service, 'Labor')
-    if not labor_folder:
-        labor_folder = create_folder(service, 'Labor')
-
-    # XML klasörü
-    xml_folder = find_folder(service, 'XML', parent_id=labor_folder)
-    if not xml_folder:
-        xml_folder = create_folder(service, 'XML', parent_id=labor_folder)
-
-    return xml_folder
+    return get_or_create_folder_path(service, ['Labor', 'XML'])
 
 
 def get_or_create_archive_folder(service, belge_tipi=None, yil=None):
@@ -0,0 +1,260 @@
+"""
+Zahnovia Metrikler
+Bağımlılıksız, process içi Prometheus metrikleri (histogram / counter) ve
+zamanlama hook'ları.
+
+    with timed('drive.upload'):
+        ...
+
+    @timed('parse')
+    def parse(...):
+        ...
+
+Metrikler process bazındadır; birden fazla worker process varsa her biri
+kendi değerlerini tutar.
+"""
+import contextvars
+import logging
+import threading
+import time
+from functools import wraps
+
+from utils import tracing
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+# Aktif HTTP isteğinin sayaçları (MetricsMiddleware set eder)
+_request_stats = contextvars.ContextVar('zahnovia_request_stats', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(self._render_series(series))
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, series):
+        for key, value in series:
+            yield f'{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            state[1] += 1
+            state[2] += value
+
+    def _render_series(self, series):
+        for key, (counts, count, total) in series:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                yield f'{self.name}_bucket{labels} {bucket_count}'
+            yield f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", "+Inf"))} {count}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {count}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+
+
+def render_metrics():
+    """Tüm metrikler, Prometheus text formatında (0.0.4)"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ===== Metrikler =====
+
+EXTERNAL_CALL_SECONDS = Histogram(
+    'zahnovia_external_call_seconds',
+    'Harici / pahalı çağrıların süresi (WeasyPrint, Drive, Gmail, PDF parse)',
+    ['call'],
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    'zahnovia_external_call_errors',
+    'Hata ile biten harici çağrılar',
+    ['call'],
+)
+PARSE_CACHE_REQUESTS = Counter(
+    'zahnovia_parse_cache_requests',
+    'Referans PDF parse cache isabetleri (hit / miss)',
+    ['result'],
+)
+REQUEST_SECONDS = Histogram(
+    'zahnovia_request_seconds',
+    'View bazında istek süresi',
+    ['view', 'method'],
+)
+REQUEST_QUERIES = Histogram(
+    'zahnovia_request_queries',
+    'View bazında istek başına SQL sorgu sayısı',
+    ['view'],
+    buckets=COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    'zahnovia_request_db_seconds',
+    'View bazında istek başına toplam SQL süresi',
+    ['view'],
+)
+REQUEST_EXTERNAL_SECONDS = Histogram(
+    'zahnovia_request_external_seconds',
+    'View bazında istek başına harici çağrı süresi',
+    ['view'],
+)
+
+
+# ===== Zamanlama hook'ları =====
+
+class RequestStats:
+    """Tek bir isteğin SQL ve harici çağrı sayaçları"""
+
+    __slots__ = ('queries', 'db_seconds', 'external_seconds', 'depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.external_seconds = 0.0
+        self.depth = 0
+
+
+def start_request():
+    """Yeni istek sayaçlarını başlat; (stats, token) döner"""
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def current_request_stats():
+    """Aktif isteğin RequestStats'ı (istek dışında None)"""
+    return _request_stats.get()
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper ile kullanılır: sorgu sayısı ve süresi"""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - start
+
+
+class timed:
+    """
+    Harici çağrı süresini ölç (context manager veya decorator olarak).
+
+    İç içe çağrılarda (örn. bir timed bloğu içinde drive.upload) her çağrı kendi
+    histogramına yazılır, isteğin harici süresine ise sadece en dıştaki eklenir.
+    Aynı isimle bir tracing span'i de kaydedilir (bkz. utils.tracing). Ölçülen
+    süre çıkışta `elapsed` (saniye) olarak okunabilir.
+    """
+
+    def __init__(self, call):
+        self.call = call
+        self.elapsed = None
+        self._start = None
+        self._stats = None
+
+    def __enter__(self):
+        self._stats = _request_stats.get()
+        if self._stats is not None:
+            self._stats.depth += 1
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = self.elapsed = time.perf_counter() - self._start
+        EXTERNAL_CALL_SECONDS.observe(elapsed, call=self.call)
+        if exc_type is not None:
+            EXTERNAL_CALL_ERRORS.inc(call=self.call)
+        if self._stats is not None:
+            self._stats.depth -= 1
+            if self._stats.depth == 0:
+                self._stats.external_seconds += elapsed
+        if tracing.current_trace() is not None or tracing.trace_logger.isEnabledFor(logging.DEBUG):
+            tracing.record_span(self.call, elapsed * 1000, exc_type is not None)
+        return False
+
+    def __call__(self, func):
+        call = self.call
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(call):
+                return func(*args, **kwargs)
+        return wrapper
@@ -0,0 +1,229 @@
+"""
+Zahnovia Process Pool
+Uzun ömürlü (warm) worker process havuzu. PDF render (declarations.utils) ve
+güvenilmeyen referans PDF'lerin parse edilmesi (declarations.services.parse_worker)
+bu havuzu kullanır.
+
+Worker'lar spawn ile başlatılır ve sadece bu modülü + görev fonksiyonunun
+modülünü import eder; görev modülleri bu yüzden hafif tutulmalıdır.
+"""
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+
+
+class PoolError(Exception):
+    """Process pool hatası (worker çöktü veya görev hata verdi)"""
+
+
+class PoolTimeout(PoolError):
+    """Görev süre sınırını aştı, worker sonlandırıldı"""
+
+
+def _current_rss_bytes():
+    """Process'in o anki RSS değeri (byte)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # /proc yoksa (macOS vb.) tepe değeri kullan
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _apply_memory_limit(limit_bytes):
+    """
+    Process'in adres alanını sınırla (RLIMIT_AS).
+
+    Linux RLIMIT_RSS'i uygulamaz; adres alanı sınırı ise aşıldığında
+    allocation başarısız olur ve Python'da MemoryError olarak görünür.
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit_bytes = min(limit_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, hard))
+
+
+def _pool_worker_main(conn, task, initializer, initargs, max_tasks, max_rss_bytes, memory_limit_bytes=None):
+    """
+    Worker process döngüsü: initializer ile state'i bir kez hazırlar, sonra
+    pipe'tan gelen her payload için task(state, payload) çalıştırır.
+    max_tasks veya max_rss_bytes aşılınca sonucu gönderip kendini kapatır.
+    memory_limit_bytes verilmişse initializer'dan sonra sert bellek sınırı
+    uygulanır; MemoryError alan worker da yenilenir.
+    """
+    state = initializer(*initargs) if initializer else None
+    if memory_limit_bytes:
+        _apply_memory_limit(memory_limit_bytes)
+    conn.send(('ready', None))
+
+    done = 0
+    while True:
+        try:
+            payload = conn.recv()
+        except (EOFError, OSError):
+            break
+        if payload is None:
+            break
+
+        out_of_memory = False
+        try:
+            result = ('ok', task(state, payload))
+        except MemoryError:
+            out_of_memory = True
+            result = ('error', 'MemoryError: Speicherlimit überschritten')
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}")
+
+        done += 1
+        recycle = (
+            out_of_memory
+            or bool(max_tasks and done >= max_tasks)
+            or bool(max_rss_bytes and _current_rss_bytes() > max_rss_bytes)
+        )
+        conn.send((result, recycle))
+        if recycle:
+            break
+    conn.close()
+
+
+class _PoolWorker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+    def stop(self, kill=False):
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WarmProcessPool:
+    """
+    Uzun ömürlü worker process havuzu.
+
+    Her worker initializer ile pahalı state'i (ör. font config, parse edilmiş
+    CSS) bir kez hazırlar ve görevler arasında saklar. Worker'lar max_tasks
+    görevden sonra veya RSS max_rss_bytes'ı geçince yenilenir. Güvenilmeyen
+    girdiler için memory_limit_bytes ile sert bir bellek sınırı konabilir.
+    Thread-safe: aynı anda en fazla `size` görev çalışır.
+    """
+
+    def __init__(self, task, size=2, initializer=None, initargs=(), max_tasks=None, max_rss_bytes=None,
+                 memory_limit_bytes=None):
+        self.task = task
+        self.size = max(1, size)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_tasks = max_tasks
+        self.max_rss_bytes = max_rss_bytes
+        self.memory_limit_bytes = memory_limit_bytes
+
+        # fork, thread'li bir process'te (PDF worker) kilit sorunlarına yol açabilir
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._closed = False
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_pool_worker_main,
+            args=(
+                child_conn, self.task, self.initializer, self.initargs,
+                self.max_tasks, self.max_rss_bytes, self.memory_limit_bytes,
+            ),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+
+        worker = _PoolWorker(process, parent_conn)
+        try:
+            status, _ = parent_conn.recv()
+        except (EOFError, OSError):
+            worker.stop(kill=True)
+            raise PoolError('Worker process konnte nicht gestartet werden')
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _discard(self, worker, kill=False):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop(kill=kill)
+
+    def _acquire(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn()
+            if worker.process.is_alive():
+                return worker
+            self._discard(worker, kill=True)
+
+    def warm_up(self):
+        """Tüm worker'ları önceden başlat (ilk isteğin soğuk başlamaması için)"""
+        for _ in range(self.size - self._idle.qsize()):
+            # Slot alınamıyorsa havuz zaten istek işliyor; fazladan worker başlatma
+            if not self._slots.acquire(blocking=False):
+                break
+            try:
+                self._idle.put(self._spawn())
+            finally:
+                self._slots.release()
+
+    def submit(self, payload, timeout=None):
+        """
+        Görevi boştaki bir worker'da çalıştır ve sonucu döndür.
+
+        Raises:
+            PoolTimeout: timeout aşıldı (worker öldürülür)
+            PoolError: worker çöktü veya görev exception fırlattı
+        """
+        if self._closed:
+            raise PoolError('Pool ist geschlossen')
+
+        with self._slots:
+            worker = self._acquire()
+            try:
+                worker.conn.send(payload)
+                if timeout is not None and not worker.conn.poll(timeout):
+                    self._discard(worker, kill=True)
+                    raise PoolTimeout(f'Zeitlimit von {timeout}s überschritten')
+                (status, value), recycle = worker.conn.recv()
+            except PoolTimeout:
+                raise
+            except (EOFError, OSError) as e:
+                self._discard(worker, kill=True)
+                raise PoolError(f'Worker process abgestürzt: {e}')
+
+            if recycle:
+                self._discard(worker)
+            else:
+                self._idle.put(worker)
+
+        if status == 'error':
+            raise PoolError(value)
+        return value
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,115 @@
+"""
+Zahnovia Tracing
+logging üzerine kurulu, hafif span / trace altyapısı. Span'ler
+utils.metrics.timed ile ölçülen çağrılardan (render, drive.upload, parse,
+mail.send, ...) aynı isimle kaydedilir:
+
+    with timed('drive.upload'):
+        ...
+
+- Her HTTP isteği bir trace ID alır (TracingMiddleware); tüm log kayıtlarına
+  TraceIdFilter ile `trace_id` eklenir.
+- Span'ler 'zahnovia.trace' logger'ına DEBUG seviyesinde yazılır. Logger
+  kapalıysa ve aktif bir trace yoksa span neredeyse hiçbir maliyet getirmez.
+- Yavaş istekler (settings.SLOW_REQUEST_THRESHOLD_MS) örneklenerek
+  'zahnovia.slow' logger'ına span süreleriyle birlikte yazılır.
+
+Span'lerde sadece isim, süre ve hata bilgisi tutulur; döküman metni veya
+hasta bilgisi ASLA konmamalı.
+"""
+import contextvars
+import json
+import logging
+import re
+import time
+import uuid
+
+trace_logger = logging.getLogger('zahnovia.trace')
+slow_logger = logging.getLogger('zahnovia.slow')
+
+# Bir trace'te tutulacak en fazla span (uzun süren worker döngüleri için sınır)
+MAX_SPANS = 200
+
+_TRACE_ID_RE = re.compile(r'^[A-Za-z0-9._-]{8,64}$')
+
+_current_trace = contextvars.ContextVar('zahnovia_trace', default=None)
+
+
+class Trace:
+    """Tek bir istek / iş için toplanan span'ler"""
+
+    __slots__ = ('trace_id', 'spans', 'started', 'dropped')
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self.started = time.perf_counter()
+        self.dropped = 0
+
+    def add(self, name, duration_ms, error=False):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        entry = {'name': name, 'ms': round(duration_ms, 2)}
+        if error:
+            entry['error'] = True
+        self.spans.append(entry)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def clean_trace_id(value):
+    """Dışarıdan gelen (X-Request-ID) trace ID'yi doğrula, geçersizse None"""
+    if value and _TRACE_ID_RE.match(value):
+        return value
+    return None
+
+
+def start_trace(trace_id=None):
+    """Yeni trace başlat; (trace, token) döner"""
+    trace = Trace(trace_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace else '-'
+
+
+def record_span(name, duration_ms, error=False):
+    """Tamamlanmış bir span'i aktif trace'e ekle ve (DEBUG açıksa) logla"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration_ms, error)
+    if trace_logger.isEnabledFor(logging.DEBUG):
+        trace_logger.debug(
+            'span %s %.1fms%s', name, duration_ms, ' error' if error else '',
+            extra={'span': name, 'duration_ms': round(duration_ms, 2)},
+        )
+
+
+def log_slow_request(trace, **fields):
+    """Yavaş istek kaydı: sadece süreler ve span isimleri (içerik yok)"""
+    record = {'trace_id': trace.trace_id, 'duration_ms': round(trace.elapsed_ms(), 1)}
+    record.update(fields)
+    record['spans'] = trace.spans
+    if trace.dropped:
+        record['dropped_spans'] = trace.dropped
+    slow_logger.warning('slow request %s', json.dumps(record, ensure_ascii=False, default=str))
+
+
+class TraceIdFilter(logging.Filter):
+    """Log kayıtlarına aktif trace ID'yi ekler (formatter'da %(trace_id)s)"""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id()
+        return True